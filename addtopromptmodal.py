@@ -1,13 +1,17 @@
 from utils import split_message
+from promptrecord import PromptRecord
 import discord
 import datetime
 import os
+import logging
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 try:
     datadir = os.environ["SNAP_DATA"]
 except:
-    print("SNAP_DATA must be set")
+    logger.error("SNAP_DATA must be set")
 
 prompt_image_dir = os.path.join(datadir, "prompt_images")
 
@@ -44,9 +48,25 @@ class AddToPromptModal(discord.ui.Modal):
         try:
             prompt_id = self.children[0].value.upper().strip().replace(" ", "_")
             prompt = self.children[1].value
-            if prompt_id not in self.bot.prompt_info.keys():
-                self.bot.prompt_info[prompt_id] = {"message": ""}
-            self.bot.prompt_info[prompt_id]["message"] += f"\n\n{prompt}"
+            over_quota = self.bot.quotas.check_storage(
+                self.guild_id,
+                new_prompts=0
+                if prompt_id in self.bot.state.snapshot(self.guild_id)
+                else 1,
+                new_bytes=len(prompt.encode()),
+            )
+            if over_quota:
+                await interaction.response.send_message(over_quota, ephemeral=True)
+                return
+            async with self.bot.state.write(self.guild_id) as prompts:
+                if prompt_id in prompts:
+                    record = prompts[prompt_id].copy()
+                else:
+                    record = PromptRecord(prompt_id, None)
+                record.message += f"\n\n{prompt}"
+                record.touch()
+                prompts[prompt_id] = record
+            self.bot.search.update(self.guild_id, record)
             log_channel = self.bot.get_channel(
                 self.bot.config[self.guild_id]["log_channel_id"]
             )
@@ -67,7 +87,7 @@ class AddToPromptModal(discord.ui.Modal):
                 messages = split_message(prompt)
                 for message in messages:
                     await log_channel.send(message)
-                channel_id = self.bot.prompt_info[prompt_id]["channel"]
+                channel_id = record.channel
                 """if self.file and channel_id:
                     if (
                         self.file.filename.lower().endswith(".png")
@@ -84,7 +104,7 @@ class AddToPromptModal(discord.ui.Modal):
                         )
                         os.makedirs(file_dir, exist_ok=True)
                         await self.file.save(file_path)
-                        self.bot.prompt_info[prompt_id]["image"] = file_path
+                        self.prompts[prompt_id]["image"] = file_path
                         await log_channel.send(file=discord.File(file_path))
                     else:
                         await interaction.response.send_message(
@@ -92,7 +112,11 @@ class AddToPromptModal(discord.ui.Modal):
                             ephemeral=True,
                         )"""
             else:
-                print(f"Log channel not found: {log_channel_id}")
+                logger.warning(
+                    "Log channel not found: %s",
+                    self.bot.config[self.guild_id]["log_channel_id"],
+                    extra={"guild": self.guild_id, "prompt_id": prompt_id},
+                )
             await interaction.response.send_message(
                 f"{prompt_id} Prompt added to successfully.", ephemeral=True
             )
@@ -100,6 +124,7 @@ class AddToPromptModal(discord.ui.Modal):
             await interaction.response.send_message(
                 "An error occurred. Please try again.", ephemeral=True
             )
-            print(f"Error: {e}")
-        # Saves prompts to json
-        self.bot.save()
+            logger.exception(
+                "Failed to add to prompt",
+                extra={"guild": self.guild_id, "command": "add-to-prompt"},
+            )
@@ -0,0 +1,3 @@
+#!/bin/bash
+# Offline maintenance, e.g. thg-discord-bot.admin inspect
+exec python3 $SNAP/bin/promptadmin.py "$@"
@@ -0,0 +1,153 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from typing import Optional
+from memoryreport import resident_memory, guild_memory
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AdminCommands(commands.Cog):
+    """Bot maintenance and resource usage."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(
+        name="memory-usage", description="Shows the bot's memory use for this server"
+    )
+    async def memory_usage(self, interaction: discord.Interaction):
+        usage = guild_memory(self.bot, interaction.guild)
+        counts = usage.pop("counts")
+        rss = resident_memory()
+        guild_count = max(1, len(self.bot.guilds))
+        memory_embed = discord.Embed(
+            title="**Memory usage**", color=discord.Color.blue()
+        )
+        memory_embed.add_field(
+            name="This server",
+            value="\n".join(
+                f"{name}: {size / 1024:.1f} KiB ({counts[name]})"
+                if name in counts
+                else f"{name}: {size / 1024:.1f} KiB"
+                for name, size in usage.items()
+            ),
+            inline=True,
+        )
+        memory_embed.add_field(
+            name="Process",
+            value=(
+                f"Resident: {rss / 1024 / 1024:.1f} MiB\n"
+                f"Servers: {len(self.bot.guilds)}\n"
+                f"Per server: {rss / guild_count / 1024:.0f} KiB\n"
+                f"Profile: {'low-memory' if self.bot.low_memory else 'default'}"
+            ),
+            inline=True,
+        )
+        memory_embed.timestamp = datetime.datetime.now()
+        await interaction.response.send_message(embed=memory_embed, ephemeral=True)
+
+    @app_commands.command(
+        name="quota-usage", description="Shows this server's usage against its quotas"
+    )
+    @app_commands.default_permissions(manage_guild=True)
+    async def quota_usage(self, interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        quota = self.bot.quotas.quota(guild_id)
+        usage = self.bot.quotas.usage(guild_id)
+        commands_left = self.bot.quotas.commands_left(interaction.guild.id)
+
+        def limit(value, unit=""):
+            return f"{value}{unit}" if value else "unlimited"
+
+        quota_embed = discord.Embed(
+            title="**Quota usage**", color=discord.Color.blue()
+        )
+        quota_embed.add_field(
+            name="Prompts",
+            value=f"{usage.prompts} of {limit(quota.max_prompts)}",
+            inline=True,
+        )
+        quota_embed.add_field(
+            name="Storage",
+            value=(
+                f"{usage.bytes / 1024 / 1024:.1f} MiB of "
+                f"{limit(quota.max_bytes // 1024 // 1024, ' MiB')}\n"
+                f"Text: {usage.text_bytes / 1024:.1f} KiB\n"
+                f"Files: {usage.file_bytes / 1024 / 1024:.1f} MiB"
+            ),
+            inline=True,
+        )
+        commands_value = f"{limit(quota.commands_per_minute)} per minute"
+        if commands_left is not None:
+            commands_value += f"\n{commands_left} available now"
+        quota_embed.add_field(name="Commands", value=commands_value, inline=True)
+        if interaction.guild.icon != None:
+            quota_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+        quota_embed.timestamp = datetime.datetime.now()
+        await interaction.response.send_message(embed=quota_embed, ephemeral=True)
+
+    @app_commands.command(
+        name="reload", description="Reloads command modules without reconnecting"
+    )
+    @app_commands.describe(
+        extension="Module to reload, e.g. promptcommands. Reloads all when empty",
+        sync="Sync commands with Discord, needed when names or options changed",
+    )
+    async def reload(
+        self,
+        interaction: discord.Interaction,
+        extension: Optional[str] = None,
+        sync: bool = False,
+    ):
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message(
+                "Only the bot owner can reload commands.", ephemeral=True
+            )
+            return
+        # A reload only reaches this process, so with shards split across
+        # processes the others would keep running the old commands
+        if self.bot.shard_ids is not None and set(self.bot.shard_ids) != set(
+            range(self.bot.shard_count)
+        ):
+            await interaction.response.send_message(
+                "This process only runs shards "
+                f"{', '.join(map(str, self.bot.shard_ids))}, so a reload would "
+                "leave the others on the old commands. Restart the bot instead.",
+                ephemeral=True,
+            )
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        # Prompts, config and the scheduler live on the bot, so they survive
+        # the reload. Helper modules such as promptsender are not reloaded.
+        started = time.perf_counter()
+        extensions = [extension] if extension else list(self.bot.extensions)
+        reloaded = []
+        failed = []
+        for name in extensions:
+            try:
+                await self.bot.reload_extension(name)
+                reloaded.append(name)
+            except commands.ExtensionError as e:
+                logger.exception("Failed to reload %s", name)
+                failed.append(f"{name}: {e}")
+        synced = ""
+        if sync:
+            synced = f"\nSynced {len(await self.bot.tree.sync())} commands."
+        logger.info(
+            "Reloaded %s",
+            ", ".join(reloaded) or "nothing",
+            extra={"command": "reload", "duration": time.perf_counter() - started},
+        )
+        content = f"Reloaded {', '.join(reloaded) or 'nothing'}.{synced}"
+        if failed:
+            content += "\nFailed:\n" + "\n".join(failed)
+        await interaction.followup.send(content[:2000], ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(AdminCommands(bot))
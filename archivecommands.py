@@ -0,0 +1,314 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from promptbundle import read_import, extract_files, write_export
+import os
+from typing import Optional
+import datetime
+import asyncio
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+def parse_archive_date(date: Optional[str]):
+    # Returns False when the date is given but cannot be read
+    if not date:
+        return None
+    try:
+        return datetime.date.fromisoformat(date.strip())
+    except ValueError:
+        return False
+
+
+class ArchiveCommands(commands.Cog):
+    """The prompt archive and bulk import and export."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="archive-search", description="Search archived prompts")
+    async def archive_search(
+        self,
+        interaction: discord.Interaction,
+        prompt_id: Optional[str] = None,
+        game: Optional[str] = None,
+        date: Optional[str] = None,
+    ):
+        guild_id = str(interaction.guild.id)
+        archive_date = parse_archive_date(date)
+        if archive_date is False:
+            await interaction.response.send_message(
+                "Dates are written as YYYY-MM-DD.", ephemeral=True
+            )
+            return
+        if prompt_id:
+            prompt_id = prompt_id.upper().strip().replace(" ", "_")
+        matches = self.bot.archive.search(guild_id, prompt_id, game, archive_date)
+        if not matches:
+            await interaction.response.send_message(
+                "No archived prompts found.", ephemeral=True
+            )
+            return
+
+        # Only the frames holding the shown results are decompressed
+        shown = matches[:10]
+        search_embed = discord.Embed(
+            title=f"**{len(matches)} archived prompts found**", color=discord.Color.blue()
+        )
+        records = await asyncio.to_thread(self.bot.archive.records, guild_id, shown)
+        for entry, record in zip(shown, records):
+            snippet = record.message.strip().replace("\n", " ")
+            if len(snippet) > 200:
+                snippet = snippet[:200] + "..."
+            search_embed.add_field(
+                name=f"{entry["prompt_id"]} | {entry["game"] or "No game"} | {entry["date"]} | {entry["reason"]}",
+                value=f"<#{record.channel}>\n{snippet or "*Empty prompt*"}",
+                inline=False,
+            )
+        if len(matches) > len(shown):
+            search_embed.set_footer(
+                text=f"{len(matches) - len(shown)} more, narrow the search to see them"
+            )
+        await interaction.response.send_message(embed=search_embed, ephemeral=True)
+
+    @app_commands.command(
+        name="archive-restore", description="Restore the latest archived copy of a prompt"
+    )
+    async def archive_restore(
+        self,
+        interaction: discord.Interaction,
+        prompt_id: str,
+        game: Optional[str] = None,
+        date: Optional[str] = None,
+    ):
+        guild_id = str(interaction.guild.id)
+        prompt_id = prompt_id.upper().strip().replace(" ", "_")
+        archive_date = parse_archive_date(date)
+        if archive_date is False:
+            await interaction.response.send_message(
+                "Dates are written as YYYY-MM-DD.", ephemeral=True
+            )
+            return
+        if prompt_id in self.bot.state.snapshot(guild_id):
+            await interaction.response.send_message(
+                f"{prompt_id} is already saved. Clear it before restoring.", ephemeral=True
+            )
+            return
+        matches = self.bot.archive.search(guild_id, prompt_id, game, archive_date)
+        if not matches:
+            await interaction.response.send_message(
+                "No archived copy of that prompt was found.", ephemeral=True
+            )
+            return
+
+        (record,) = await asyncio.to_thread(
+            self.bot.archive.records, guild_id, matches[:1]
+        )
+        # Attachments are removed once sent or cleared, so only keep any that
+        # are still on disk
+        record.attachments = tuple(
+            file_name
+            for file_name in record.attachments
+            if os.path.exists(os.path.join(self.bot.prompt_image_dir, guild_id, file_name))
+        )
+        record.touch()
+        async with self.bot.state.write(guild_id) as prompts:
+            prompts[prompt_id] = record
+        await interaction.response.send_message(
+            f"{prompt_id} restored from {matches[0]["date"]}.", ephemeral=True
+        )
+
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"{prompt_id} prompt restored from the archive.",
+                color=discord.Color.green(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+    @app_commands.command(
+        name="import-prompts", description="Import prompts from a JSON, CSV or zip file"
+    )
+    @app_commands.describe(
+        file="A .json, .jsonl or .csv of prompts, or a .zip of one plus its files",
+        replace="Replace prompts that already exist",
+    )
+    async def import_prompts(
+        self,
+        interaction: discord.Interaction, file: discord.Attachment, replace: bool = False
+    ):
+        await interaction.response.defer(ephemeral=True)
+        guild_id = str(interaction.guild.id)
+        # The upload's size stands in for what it will store, so a server
+        # over its quota is refused before anything is downloaded
+        over_quota = self.bot.quotas.check_storage(guild_id, new_bytes=file.size)
+        if over_quota:
+            await interaction.followup.send(over_quota, ephemeral=True)
+            return
+        # The same channels PromptModal offers, by ID and by name
+        channels = {}
+        for channel in interaction.guild.text_channels:
+            if (
+                channel.category_id == self.bot.config[guild_id].get("category_id")
+                and "district-" in channel.name
+            ):
+                channels[str(channel.id)] = channel.id
+                channels[channel.name.lower()] = channel.id
+
+        file_dir = os.path.join(self.bot.prompt_image_dir, guild_id)
+        os.makedirs(file_dir, exist_ok=True)
+        # Files are extracted and shrunk in a staging directory beside the
+        # guild's files and only renamed into place once all of them are
+        # good, so a failed import never overwrites files prompts still use
+        with tempfile.TemporaryDirectory(dir=file_dir, prefix=".import-") as upload_dir:
+            upload_path = os.path.join(upload_dir, "upload")
+            staging_dir = os.path.join(upload_dir, "files")
+            await file.save(upload_path)
+            result = await asyncio.to_thread(
+                read_import,
+                upload_path,
+                file.filename,
+                channels,
+                self.bot.state.snapshot(guild_id),
+                replace,
+            )
+            if result.errors:
+                errors = "\n".join(result.errors[:15])
+                if len(result.errors) > 15:
+                    errors += f"\n...and {len(result.errors) - 15} more"
+                await interaction.followup.send(
+                    f"Nothing was imported.\n{errors}"[:2000], ephemeral=True
+                )
+                return
+            if not result.records:
+                await interaction.followup.send(
+                    "No prompts were found in that file.", ephemeral=True
+                )
+                return
+            saved = self.bot.state.snapshot(guild_id)
+            over_quota = self.bot.quotas.check_storage(
+                guild_id,
+                new_prompts=sum(prompt_id not in saved for prompt_id in result.records),
+                # The imported text plus what the zip's files expand to,
+                # not the upload's size
+                new_bytes=sum(
+                    len(record.message.encode()) for record in result.records.values()
+                )
+                + result.file_bytes,
+            )
+            if over_quota:
+                await interaction.followup.send(
+                    f"Nothing was imported. {over_quota}", ephemeral=True
+                )
+                return
+            await asyncio.to_thread(extract_files, upload_path, result.files, staging_dir)
+
+            # Imported files are shrunk to fit the upload limit like uploads are
+            infos = await asyncio.gather(
+                *(
+                    self.bot.media.ingest(
+                        os.path.join(staging_dir, file_name),
+                        interaction.guild.filesize_limit,
+                    )
+                    for file_name in result.files
+                )
+            )
+            errors = [info.error for info in infos if info.error]
+            if errors:
+                await interaction.followup.send(
+                    ("Nothing was imported.\n" + "\n".join(errors[:15]))[:2000],
+                    ephemeral=True,
+                )
+                return
+
+            async with self.bot.state.write(guild_id) as prompts:
+                for file_name in result.files:
+                    os.replace(
+                        os.path.join(staging_dir, file_name),
+                        os.path.join(file_dir, file_name),
+                    )
+                replaced = [
+                    prompts[prompt_id]
+                    for prompt_id in result.replaced
+                    if prompt_id in prompts
+                ]
+                prompts.update(result.records)
+        # Files of replaced prompts that the import did not overwrite
+        for record in replaced:
+            for file_name in record.attachments:
+                if file_name not in result.files:
+                    try:
+                        os.unlink(os.path.join(file_dir, file_name))
+                    except FileNotFoundError:
+                        pass
+        logger.info(
+            "Imported %d prompts",
+            len(result.records),
+            extra={"guild": guild_id, "command": "import-prompts"},
+        )
+        await interaction.followup.send(
+            f"Imported {len(result.records)} prompts ({len(result.replaced)} replaced).",
+            ephemeral=True,
+        )
+
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"{len(result.records)} prompts imported.",
+                color=discord.Color.green(),
+            )
+            log_embed.add_field(
+                name="Prompt IDs", value=f"**{"\n".join(result.records)}**"[:1024]
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+    @app_commands.command(
+        name="export-prompts", description="Download this server's prompts as a zip"
+    )
+    async def export_prompts(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        guild_id = str(interaction.guild.id)
+        prompts = self.bot.state.snapshot(guild_id)
+        if not prompts:
+            await interaction.followup.send("There are no prompts to export.", ephemeral=True)
+            return
+
+        # The zip is written to a temporary file and uploaded from there
+        with tempfile.TemporaryFile() as export_file:
+            missing = await asyncio.to_thread(
+                write_export, export_file, prompts, os.path.join(self.bot.prompt_image_dir, guild_id)
+            )
+            size = export_file.tell()
+            if size > interaction.guild.filesize_limit:
+                await interaction.followup.send(
+                    f"The export is {size / 1024 / 1024:.1f} MiB, over this server's upload limit.",
+                    ephemeral=True,
+                )
+                return
+            export_file.seek(0)
+            content = f"Exported {len(prompts)} prompts."
+            if missing:
+                content += f" Missing files: {', '.join(missing)}"
+            await interaction.followup.send(
+                content[:2000],
+                file=discord.File(export_file, filename=f"prompts-{guild_id}.zip"),
+                ephemeral=True,
+            )
+
+
+async def setup(bot):
+    await bot.add_cog(ArchiveCommands(bot))
@@ -0,0 +1,130 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import atexit
+
+# Structured fields that can be attached to any record with
+# logger.info("...", extra={"guild": guild_id, "prompt_id": prompt_id})
+STRUCTURED_FIELDS = ("guild", "command", "prompt_id", "duration")
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formats records as a plain message followed by key=value pairs for
+    every structured field that was set on the record.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = []
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is None:
+                continue
+            if field == "duration":
+                value = f"{value * 1000:.1f}ms"
+            fields.append(f"{field}={value}")
+        if fields:
+            line = f"{line} | {' '.join(fields)}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops high-frequency records so only one in every N reaches the queue.
+
+    A record opts in to sampling with extra={"sample": N}. Records are
+    counted per logger and message template, so unrelated messages do not
+    share a counter.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+
+    def filter(self, record):
+        every = getattr(record, "sample", None)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return count % every == 0
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records untouched so that message formatting happens in the
+    listener thread instead of on the event loop.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def parse_levels(spec: str) -> dict[str, int]:
+    """
+    Parses a per-module level spec such as "promptmodal=DEBUG,discord=WARNING".
+
+    Args:
+        spec: Comma separated logger=LEVEL pairs
+
+    Returns:
+        Mapping of logger name to logging level
+    """
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        level = logging.getLevelName(level.strip().upper())
+        if isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+
+def setup_logging():
+    """
+    Routes all logging through a queue drained by a background thread.
+
+    Reads LOG_LEVEL (root level), LOG_LEVELS (per-module overrides) and
+    LOG_FILE (optional rotating log file, stdout otherwise) from the
+    environment. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = StructuredFormatter(
+        "%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    log_file = os.environ.get("LOG_FILE")
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        output = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=5 * 1024 * 1024, backupCount=3
+        )
+    else:
+        output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel((os.environ.get("LOG_LEVEL") or "INFO").upper())
+    for name, level in parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, output, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
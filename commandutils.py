@@ -0,0 +1,126 @@
+import discord
+from typing import Optional
+import datetime
+import functools
+import logging
+import re
+
+# Helpers shared by the command extensions. This module is not an
+# extension itself, so it is not reloaded by /reload.
+
+logger = logging.getLogger(__name__)
+
+
+def deferred(func):
+    """
+    Decorator for slow cog commands. The interaction is acknowledged with
+    an ephemeral defer straight away, then the command body runs on the
+    guild's work queue (bot.work), after any earlier deferred commands in
+    that guild. The body must reply with interaction.followup.
+
+    discord.py reports on_app_command_completion once the defer is sent,
+    so the bot dispatches on_deferred_command_completion when the body
+    finishes without an error.
+
+    Usage:
+        @app_commands.command(name="send-prompt")
+        @deferred
+        async def send_prompt(self, interaction, prompt_id: str): ...
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, interaction: discord.Interaction, *args, **kwargs):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        async def run():
+            try:
+                await func(self, interaction, *args, **kwargs)
+                self.bot.dispatch(
+                    "deferred_command_completion", interaction, interaction.command
+                )
+            except Exception:
+                logger.exception(
+                    "Command failed",
+                    extra={
+                        "guild": interaction.guild_id,
+                        "command": interaction.command.qualified_name,
+                    },
+                )
+                await interaction.followup.send(
+                    "An error occurred. Please try again.", ephemeral=True
+                )
+
+        self.bot.work.submit(
+            interaction.guild_id, interaction.command.qualified_name, run()
+        )
+
+    wrapper.deferred = True
+    return wrapper
+
+
+async def prompt_ids_list(
+    bot, interaction: discord.Interaction, embed_title: str, send_to: Optional[int]
+):
+    guild_id = str(interaction.guild.id)
+    prompts = bot.state.snapshot(guild_id)
+    if prompts:
+        prompt_keys = []
+        prompt_mentions = []
+        channels = []
+        for prompt_id, record in prompts.items():
+            channel = interaction.guild.get_channel(record.channel)
+            if channel:
+                prompt_keys.append(prompt_id)
+                prompt_mentions.append(record.channel)
+                channels.append(channel)
+        id_list_embed = discord.Embed(
+            title=f"**{embed_title}**\n", color=discord.Color.green()
+        )
+        # Sorts channels in the view to be more readable
+        prompt_keys = sorted(
+            prompt_keys,
+            key=lambda x: (
+                (int(re.search(r"\d+", x).group()), x[-1])
+                if re.search(r"\d+", x)
+                else (float("inf"), x)
+            ),
+        )
+        channels = sorted(channels, key=lambda ch: ch.position)
+        if len(prompt_keys) > 0:
+            id_list_embed.add_field(
+                name="**Prompt IDs**",
+                value=f"**{"\n".join(prompt_keys)}**",
+                inline=True,
+            )
+            id_list_embed.add_field(
+                name="**Prompt channels**",
+                value=f"{'\n'.join(ch.mention for ch in channels)}",
+                inline=True,
+            )
+            id_list_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            id_list_embed.set_thumbnail(url=f"{interaction.user.avatar}")
+            id_list_embed.timestamp = datetime.datetime.now()
+            if send_to == bot.config[guild_id]["log_channel_id"]:
+                if interaction.response.is_done():
+                    await interaction.guild.get_channel(send_to).send(
+                        embed=id_list_embed
+                    )
+                else:
+                    await interaction.guild.get_channel(send_to).send(
+                        embed=id_list_embed
+                    )
+            else:
+                if interaction.response.is_done():
+                    await interaction.followup.send(embed=id_list_embed, ephemeral=True)
+                else:
+                    await interaction.response.send_message(
+                        embed=id_list_embed, ephemeral=True
+                    )
+        else:
+            await interaction.response.send_message(
+                "No prompts found in guild.", ephemeral=True
+            )
+    else:
+        await interaction.response.send_message("No prompts found", ephemeral=True)
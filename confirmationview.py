@@ -1,4 +1,7 @@
 import discord
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ConfirmationView(discord.ui.View):
@@ -17,7 +20,7 @@ class ConfirmationView(discord.ui.View):
         )
         self.cancel_button.callback = self.cancel_callback
         self.add_item(self.cancel_button)
-        print("Confirm")
+        logger.debug("Confirmation view created")
 
     async def send_callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker may hold a job without reporting progress before
+# another worker takes it over
+LEASE_SECONDS = 300
+# Seconds between checks for finished jobs, and for new jobs when idle
+POLL_INTERVAL = 0.1
+# Seconds a job may wait unclaimed before the bot warns that no sender
+# worker seems to be running
+UNCLAIMED_WARNING = 30
+# Seconds the bot waits on a job while no worker claims or checkpoints
+# anything before it takes the job back and sends the prompt itself
+UNCLAIMED_TIMEOUT = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    guild_id TEXT NOT NULL,
+    batch TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    payload TEXT NOT NULL,
+    worker TEXT,
+    claimed_at REAL,
+    error TEXT,
+    permanent INTEGER NOT NULL DEFAULT 0,
+    first_sent REAL,
+    UNIQUE (guild_id, batch, prompt_id)
+)
+"""
+
+
+class DeliveryError(Exception):
+    """
+    A sender worker could not deliver a prompt. permanent is set when
+    retrying will not help, e.g. the bot may not post in the channel.
+    """
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class Job:
+    def __init__(self, row):
+        self.id, self.guild_id, self.batch, self.prompt_id = row[:4]
+        self.state = row[4]
+        # {"channel": id, "delivery": mode, "operations": [...]}, the
+        # outbox entry's operations as the worker last checkpointed them
+        self.payload = json.loads(row[5])
+        self.error, self.permanent, self.first_sent = row[6:9]
+
+
+class DeliveryQueue:
+    """
+    Durable queue of prompt deliveries shared by the bot and its sender
+    workers, in one SQLite database. A job is one prompt of an outbox:
+    the bot submits it and waits, a worker claims it, runs its
+    operations, checkpoints them into the job and marks it done or
+    failed, and the bot copies the result back into its outbox and
+    removes the job.
+
+    Jobs are unique per guild, send-all and prompt, so a bot that
+    restarts mid-send waits on the jobs it already submitted. A worker
+    that dies loses its lease, and the next worker continues from the
+    last checkpointed operation; nonces keep replayed sends from posting
+    twice. If no worker makes progress on anything for UNCLAIMED_TIMEOUT
+    seconds, the bot withdraws the jobs it is waiting on and delivers
+    them itself.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Used from worker threads, one call at a time
+        self._db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+        # Bot side: job ID -> future resolved when the job finishes
+        self._waiters = {}
+        self._poller = None
+
+    def _execute(self, sql, parameters=()) -> list:
+        with self._db_lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def _transaction(self, statements):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers
+        # cannot claim the same job
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(self, guild_id, batch, prompt_id, payload) -> int:
+        """Queues a delivery, or returns the ID of the one already queued."""
+
+        def statements(db):
+            db.execute(
+                "INSERT OR IGNORE INTO jobs (guild_id, batch, prompt_id, payload)"
+                " VALUES (?, ?, ?, ?)",
+                (guild_id, batch, prompt_id, json.dumps(payload)),
+            )
+            return db.execute(
+                "SELECT id FROM jobs WHERE guild_id = ? AND batch = ? AND prompt_id = ?",
+                (guild_id, batch, prompt_id),
+            ).fetchone()[0]
+
+        return self._transaction(statements)
+
+    def get(self, job_id) -> Job | None:
+        rows = self._execute(
+            "SELECT id, guild_id, batch, prompt_id, state, payload, error,"
+            " permanent, first_sent FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+        return Job(rows[0]) if rows else None
+
+    def remove(self, job_id):
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    # Worker side
+
+    def claim(self, worker) -> Job | None:
+        """Takes the oldest queued job, or one whose worker's lease ran out."""
+        expired = time.time() - LEASE_SECONDS
+        available = "state = 'queued' OR (state = 'claimed' AND claimed_at < ?)"
+        # Most polls find nothing, and a read does not need the write lock
+        if not self._execute(f"SELECT 1 FROM jobs WHERE {available} LIMIT 1", (expired,)):
+            return None
+
+        def statements(db):
+            row = db.execute(
+                "SELECT id, guild_id, batch, prompt_id, state, payload, error,"
+                f" permanent, first_sent FROM jobs WHERE {available}"
+                " ORDER BY id LIMIT 1",
+                (expired,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET state = 'claimed', worker = ?, claimed_at = ?"
+                " WHERE id = ?",
+                (worker, time.time(), row[0]),
+            )
+            return Job(row)
+
+        return self._transaction(statements)
+
+    def checkpoint(self, job: Job, first_sent=None):
+        # Progress also renews the lease
+        self._execute(
+            "UPDATE jobs SET payload = ?, claimed_at = ?,"
+            " first_sent = COALESCE(first_sent, ?) WHERE id = ?",
+            (json.dumps(job.payload), time.time(), first_sent, job.id),
+        )
+
+    def finish(self, job: Job, error=None, permanent=False):
+        self._execute(
+            "UPDATE jobs SET state = ?, payload = ?, error = ?, permanent = ?"
+            " WHERE id = ?",
+            (
+                "failed" if error else "done",
+                json.dumps(job.payload),
+                error,
+                int(permanent),
+                job.id,
+            ),
+        )
+
+    # Bot side
+
+    def withdraw(self, job_id, idle) -> Job | None:
+        """
+        Takes a job back off the queue if no worker is working on it and
+        none has claimed or checkpointed any job for idle seconds.
+
+        Returns:
+            The job with state "withdrawn" and its last checkpointed
+            operations, or None if it was left queued
+        """
+        now = time.time()
+
+        def statements(db):
+            if db.execute(
+                "SELECT 1 FROM jobs WHERE claimed_at > ? LIMIT 1", (now - idle,)
+            ).fetchone():
+                return None
+            row = db.execute(
+                "SELECT id, guild_id, batch, prompt_id, state, payload, error,"
+                " permanent, first_sent FROM jobs WHERE id = ? AND"
+                " (state = 'queued' OR (state = 'claimed' AND claimed_at < ?))",
+                (job_id, now - LEASE_SECONDS),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            job = Job(row)
+            job.state = "withdrawn"
+            return job
+
+        return self._transaction(statements)
+
+    async def wait(self, job_id, timeout=UNCLAIMED_TIMEOUT) -> Job:
+        """
+        Waits for a worker to finish a job. If no worker makes progress
+        for timeout seconds the job is withdrawn (see withdraw()) and
+        returned with state "withdrawn", for the caller to deliver.
+        """
+        future = self._waiters.get(job_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[job_id] = future
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll(), name="delivery-poll")
+        while True:
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except TimeoutError:
+                job = await asyncio.to_thread(self.withdraw, job_id, timeout)
+                if job is not None:
+                    if self._waiters.get(job_id) is future:
+                        del self._waiters[job_id]
+                    return job
+
+    async def _poll(self):
+        # One poller for every waiting delivery, not one per prompt
+        started = time.monotonic()
+        warned = False
+        while self._waiters:
+            await asyncio.sleep(POLL_INTERVAL)
+            job_ids = list(self._waiters)
+            try:
+                states = await asyncio.to_thread(
+                    self._execute,
+                    "SELECT id, state FROM jobs WHERE id IN"
+                    f" ({','.join('?' * len(job_ids))})",
+                    job_ids,
+                )
+                for job_id, state in states:
+                    if state not in ("done", "failed"):
+                        continue
+                    job = await asyncio.to_thread(self.get, job_id)
+                    future = self._waiters.pop(job_id)
+                    if not future.done():
+                        future.set_result(job)
+            except sqlite3.Error:
+                logger.exception("Failed to poll the delivery queue")
+                continue
+            if (
+                not warned
+                and time.monotonic() - started > UNCLAIMED_WARNING
+                and all(state == "queued" for _, state in states)
+            ):
+                warned = True
+                logger.warning(
+                    "No delivery has been claimed for %ds; is the sender"
+                    " service running?",
+                    UNCLAIMED_WARNING,
+                )
+
+    def close(self):
+        if self._poller:
+            self._poller.cancel()
+        with self._db_lock:
+            self._db.close()
+
+
+def delivery_from_env(datadir) -> DeliveryQueue | None:
+    """
+    Builds the delivery queue when SENDER_WORKERS is above 0, meaning
+    sender worker processes run alongside the bot and deliver its prompts.
+
+    Returns:
+        A DeliveryQueue, or None to deliver in the bot's own process
+    """
+    try:
+        workers = int(os.environ.get("SENDER_WORKERS") or 0)
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        return None
+    return DeliveryQueue(os.path.join(datadir, "delivery.db"))
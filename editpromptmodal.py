@@ -0,0 +1,27 @@
+import discord
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Longest text a modal text input can hold
+MODAL_TEXT_LIMIT = 4000
+
+
+# Modal prefilled with a sent prompt's text. The corrected text is handed to
+# on_text, which works out and applies the edits.
+class EditPromptModal(discord.ui.Modal):
+    def __init__(self, prompt_id: str, text: str, on_text) -> None:
+        super().__init__(title=f"Edit sent prompt {prompt_id}"[:45])
+        self.on_text = on_text
+        self.add_item(
+            discord.ui.TextInput(
+                label="Prompt",
+                default=text,
+                custom_id="prompt",
+                style=discord.TextStyle.paragraph,
+                max_length=MODAL_TEXT_LIMIT,
+            )
+        )
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await self.on_text(interaction, self.children[0].value)
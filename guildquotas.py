@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Commands that are never rate limited, so admins can always see why
+# others are
+EXEMPT_COMMANDS = ("quota-usage",)
+
+
+class Quota:
+    """A guild's limits. 0 means unlimited."""
+
+    def __init__(self, max_prompts=0, max_bytes=0, commands_per_minute=0):
+        self.max_prompts = max_prompts
+        self.max_bytes = max_bytes
+        self.commands_per_minute = commands_per_minute
+
+    def with_overrides(self, overrides: dict) -> "Quota":
+        return Quota(
+            overrides.get("max_prompts", self.max_prompts),
+            overrides.get("max_bytes", self.max_bytes),
+            overrides.get("commands_per_minute", self.commands_per_minute),
+        )
+
+
+class Usage:
+    """What a guild has stored."""
+
+    def __init__(self, prompts, text_bytes, file_bytes):
+        self.prompts = prompts
+        self.text_bytes = text_bytes
+        self.file_bytes = file_bytes
+
+    @property
+    def bytes(self):
+        return self.text_bytes + self.file_bytes
+
+
+class _TokenBucket:
+    """Holds up to a minute's worth of commands and refills continuously."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity):
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, per_minute) -> float:
+        now = time.monotonic()
+        self.tokens = min(
+            float(per_minute), self.tokens + (now - self.updated) * per_minute / 60
+        )
+        self.updated = now
+        return self.tokens
+
+    def take(self, per_minute) -> float:
+        """Takes a token. Returns 0, or the seconds until one is free."""
+        if self.refill(per_minute) >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * 60 / per_minute
+
+
+class GuildQuotas:
+    """
+    Keeps one guild from starving the rest of a shared process: commands
+    per minute are admitted through a token bucket per guild, and prompts
+    and stored bytes are capped.
+
+    Limits default to the QUOTA_* environment settings and can be raised
+    or lowered per guild with promptadmin.py set-quota, which stores them
+    in the guild's config under "quotas". Admission is a dictionary lookup
+    and some arithmetic. Stored bytes are recounted only after the guild's
+    prompts or file directory change.
+    """
+
+    def __init__(self, bot, defaults: Quota):
+        self.bot = bot
+        self.defaults = defaults
+        self._buckets = {}
+        # guild_id -> (snapshot, text bytes) and (directory mtime, file bytes)
+        self._text = {}
+        self._files = {}
+
+    def quota(self, guild_id) -> Quota:
+        overrides = self.bot.config.get(str(guild_id), {}).get("quotas")
+        return self.defaults.with_overrides(overrides) if overrides else self.defaults
+
+    def admit(self, guild_id, command_name) -> float:
+        """
+        Takes one of the guild's command tokens.
+
+        Returns:
+            0 if the command may run, otherwise seconds until it may
+        """
+        if command_name in EXEMPT_COMMANDS:
+            return 0.0
+        per_minute = self.quota(guild_id).commands_per_minute
+        if not per_minute:
+            return 0.0
+        bucket = self._buckets.get(guild_id)
+        if bucket is None:
+            bucket = self._buckets[guild_id] = _TokenBucket(per_minute)
+        return bucket.take(per_minute)
+
+    def commands_left(self, guild_id) -> int | None:
+        """Commands the guild could run right now, None if unlimited."""
+        per_minute = self.quota(guild_id).commands_per_minute
+        if not per_minute:
+            return None
+        bucket = self._buckets.get(guild_id)
+        return int(bucket.refill(per_minute)) if bucket else per_minute
+
+    def usage(self, guild_id: str) -> Usage:
+        prompts = self.bot.state.snapshot(guild_id)
+        cached = self._text.get(guild_id)
+        if cached is None or cached[0] is not prompts:
+            # Snapshots are replaced on every write, so an unchanged one
+            # means unchanged text
+            cached = (
+                prompts,
+                sum(len(record.message.encode()) for record in prompts.values()),
+            )
+            self._text[guild_id] = cached
+        return Usage(len(prompts), cached[1], self.file_bytes(guild_id))
+
+    def file_bytes(self, guild_id: str) -> int:
+        file_dir = os.path.join(self.bot.prompt_image_dir, guild_id)
+        try:
+            mtime = os.stat(file_dir).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+        cached = self._files.get(guild_id)
+        if cached is None or cached[0] != mtime:
+            # Files are only ever added, removed or replaced by rename, all
+            # of which change the directory's mtime
+            total = 0
+            with os.scandir(file_dir) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        total += entry.stat().st_size
+            cached = (mtime, total)
+            self._files[guild_id] = cached
+        return cached[1]
+
+    def check_storage(self, guild_id: str, new_prompts=0, new_bytes=0) -> str | None:
+        """
+        Checks that storing more would stay within the guild's quota.
+
+        Args:
+            guild_id: The guild ID as a string
+            new_prompts: Prompts about to be added
+            new_bytes: Bytes of text and files about to be added
+
+        Returns:
+            Why it would not, or None if it would
+        """
+        quota = self.quota(guild_id)
+        if not quota.max_prompts and not quota.max_bytes:
+            return None
+        usage = self.usage(guild_id)
+        if quota.max_prompts and usage.prompts + new_prompts > quota.max_prompts:
+            return (
+                f"This server has {usage.prompts} of its {quota.max_prompts} "
+                "prompts. Clear or send some first."
+            )
+        if quota.max_bytes and usage.bytes + new_bytes > quota.max_bytes:
+            reason = (
+                f"This server is using {usage.bytes / 1024 / 1024:.1f} of its "
+                f"{quota.max_bytes / 1024 / 1024:.0f} MiB of prompt storage"
+            )
+            if new_bytes:
+                reason += f", and this needs {new_bytes / 1024 / 1024:.1f} MiB more"
+            return reason + "."
+        return None
+
+
+def quotas_from_env(bot) -> GuildQuotas:
+    """
+    Reads the default quotas from QUOTA_MAX_PROMPTS, QUOTA_MAX_MIB and
+    QUOTA_COMMANDS_PER_MINUTE. Unset values fall back to limits no normal
+    game reaches; 0 turns a limit off.
+    """
+
+    def setting(name, default):
+        try:
+            return max(0, int(os.environ.get(name) or default))
+        except ValueError:
+            logger.warning("%s is not a whole number, using %d", name, default)
+            return default
+
+    return GuildQuotas(
+        bot,
+        Quota(
+            max_prompts=setting("QUOTA_MAX_PROMPTS", 1000),
+            max_bytes=setting("QUOTA_MAX_MIB", 1024) * 1024 * 1024,
+            commands_per_minute=setting("QUOTA_COMMANDS_PER_MINUTE", 60),
+        ),
+    )
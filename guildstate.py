@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+from types import MappingProxyType
+
+
+class GuildState:
+    """
+    Serialises changes to each guild's prompts and hands out snapshots.
+
+    Writers hold the guild's asyncio.Lock while they change its prompts and
+    the guild is saved when they finish, so changes made across awaits are
+    never interleaved or lost. Commands that await while going through the
+    prompts iterate a snapshot instead: a read-only copy of the mapping
+    that is shared until the next write, so taking one costs nothing when
+    nothing has changed. Records are replaced rather than changed in place
+    (see PromptRecord.copy()), so a snapshot never sees a later write.
+
+    Every guild has its own lock, so guilds never wait on each other.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._locks = {}
+        self._snapshots = {}
+
+    def lock(self, guild_id) -> asyncio.Lock:
+        return self._locks.setdefault(guild_id, asyncio.Lock())
+
+    def snapshot(self, guild_id) -> MappingProxyType:
+        snapshot = self._snapshots.get(guild_id)
+        if snapshot is None:
+            snapshot = MappingProxyType(dict(self.bot.prompts(guild_id)))
+            self._snapshots[guild_id] = snapshot
+        return snapshot
+
+    def invalidate(self, guild_id):
+        self._snapshots.pop(guild_id, None)
+
+    @contextlib.asynccontextmanager
+    async def write(self, guild_id):
+        """
+        Locks a guild's prompts for writing and saves the guild afterwards.
+
+        Usage:
+            async with bot.state.write(guild_id) as prompts:
+                prompts[prompt_id] = record
+        """
+        async with self.lock(guild_id):
+            try:
+                yield self.bot.prompts(guild_id)
+            finally:
+                self.invalidate(guild_id)
+            self.bot.save(guild_id)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Detects event loop stalls and logs the stack of the blocking callsite.
+
+    A heartbeat task on the loop records when it last ran. A monitor thread
+    checks that timestamp, and once the loop has not ticked for longer than
+    the threshold it captures the loop thread's current frame, which is the
+    code that is blocking it.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        """
+        Args:
+            threshold: Seconds the loop may go without a heartbeat before a
+                stall is reported
+            interval: Seconds between heartbeats
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.last_beat = time.monotonic()
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._reported_beat = None
+
+    def start(self):
+        """Starts the heartbeat and monitor. Must be called from the loop."""
+        self._loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._monitor, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            "Loop watchdog started (threshold %.0fms)", self.threshold * 1000
+        )
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - expected
+            self.max_lag = max(self.max_lag, lag)
+            if self._reported_beat == self.last_beat:
+                logger.warning(
+                    "Event loop stall ended",
+                    extra={"duration": now - self.last_beat},
+                )
+            self.last_beat = now
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval / 2):
+            beat = self.last_beat
+            stalled_for = time.monotonic() - beat
+            if stalled_for < self.threshold or self._reported_beat == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._reported_beat = beat
+            self.stalls += 1
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning(
+                "Event loop blocked for over %.0fms at:\n%s",
+                stalled_for * 1000,
+                stack,
+                extra={"duration": stalled_for},
+            )
+
+
+def watchdog_from_env() -> LoopWatchdog | None:
+    """
+    Builds a watchdog from STALL_WATCHDOG and STALL_THRESHOLD_MS.
+
+    Returns:
+        A LoopWatchdog if STALL_WATCHDOG is enabled, None otherwise
+    """
+    if os.environ.get("STALL_WATCHDOG", "").lower() not in ("1", "true", "yes", "on"):
+        return None
+    threshold_ms = float(os.environ.get("STALL_THRESHOLD_MS") or 250)
+    return LoopWatchdog(threshold=threshold_ms / 1000)
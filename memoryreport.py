@@ -0,0 +1,79 @@
+import os
+import resource
+import sys
+
+# Types whose size is counted without following references
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+
+def resident_memory() -> int:
+    """
+    Returns the process's resident set size in bytes. Falls back to the
+    peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def deep_size(obj, seen=None) -> int:
+    """Size of plain data (dicts, lists, strings...) including contents."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__") and not isinstance(obj, _ATOMIC):
+        for slot in _slots(obj):
+            value = getattr(obj, slot, None)
+            if isinstance(value, _ATOMIC) or isinstance(value, (tuple, list, dict)):
+                size += deep_size(value, seen)
+    return size
+
+
+def _slots(obj):
+    for cls in type(obj).__mro__:
+        slots = getattr(cls, "__slots__", ())
+        yield from (slots,) if isinstance(slots, str) else slots
+
+
+def cached_size(objects) -> int:
+    """
+    Approximate size of cached discord.py objects. Only each object's own
+    slots are counted, not the shared state they point to.
+    """
+    return sum(deep_size(obj) for obj in objects)
+
+
+def guild_memory(bot, guild) -> dict:
+    """
+    Estimates the memory held for one guild.
+
+    Returns:
+        Mapping of "prompts", "config", "channels", "members", "roles" to
+        approximate bytes, plus the object counts under "counts"
+    """
+    guild_id = str(guild.id)
+    return {
+        "prompts": deep_size(bot.prompt_info.get(guild_id, {})),
+        "config": deep_size(bot.config.get(guild_id, {})),
+        "channels": cached_size(guild.channels),
+        "members": cached_size(guild.members),
+        "roles": cached_size(guild.roles),
+        "counts": {
+            "prompts": len(bot.prompt_info.get(guild_id, {})),
+            "channels": len(guild.channels),
+            "members": len(guild.members),
+            "roles": len(guild.roles),
+        },
+    }
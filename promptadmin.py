@@ -0,0 +1,322 @@
+# Offline maintenance for the bot's data directory. Never imports discord,
+# so it starts instantly and works whether or not the bot is running.
+# Commands that rewrite prompt or config files refuse to run while the bot
+# is up, since it keeps those in memory and would write over the changes.
+
+import argparse
+import json
+import os
+import sys
+import time
+from promptarchive import PromptArchive
+from promptrecord import SCHEMA_VERSION, decode_prompts, encode_prompts
+from promptstore import guild_ids, is_running, migrate_legacy, save_guild
+
+
+def data_dir(override=None) -> str:
+    if override:
+        return override
+    try:
+        return os.environ["SNAP_DATA"].replace(os.environ["SNAP_REVISION"], "current")
+    except KeyError:
+        sys.exit("SNAP_DATA and SNAP_REVISION must be set, or pass --data-dir")
+
+
+class Store:
+    """Paths inside the data directory, laid out as thgbot.py lays them out."""
+
+    def __init__(self, datadir):
+        self.datadir = datadir
+        self.prompt_image_dir = os.path.join(datadir, "prompt_images")
+        self.prompt_dir = os.path.join(datadir, "prompts")
+        self.config_dir = os.path.join(datadir, "config")
+        self.outbox_dir = os.path.join(datadir, "outbox")
+        self.archive_dir = os.path.join(datadir, "archive")
+
+    def read_json(self, directory, guild_id):
+        with open(os.path.join(directory, f"{guild_id}.json"), "r") as f:
+            return json.load(f)
+
+    def prompts(self, guild_id):
+        return decode_prompts(self.read_json(self.prompt_dir, guild_id))
+
+    def guild_ids(self) -> list[str]:
+        return sorted(
+            set(guild_ids(self.prompt_dir))
+            | set(guild_ids(self.config_dir))
+            | set(guild_ids(self.outbox_dir))
+        )
+
+    def require_stopped(self):
+        if is_running(self.datadir):
+            sys.exit("The bot is running. Stop it first: snap stop thg-discord-bot")
+
+
+def inspect(store, args):
+    if args.guild_id:
+        prompts = store.prompts(args.guild_id)
+        for prompt_id, record in sorted(prompts.items()):
+            updated = time.strftime("%Y-%m-%d %H:%M", time.gmtime(record.updated))
+            print(
+                f"{prompt_id:<6} channel={record.channel} chars={len(record.message)}"
+                f" files={len(record.attachments)} updated={updated}"
+            )
+        return 0
+
+    state = "running" if is_running(store.datadir) else "stopped"
+    print(f"data: {store.datadir} (bot {state})")
+    archive = PromptArchive(store.archive_dir)
+    for guild_id in store.guild_ids():
+        prompt_path = os.path.join(store.prompt_dir, f"{guild_id}.json")
+        prompts = {}
+        version = "-"
+        if os.path.exists(prompt_path):
+            data = store.read_json(store.prompt_dir, guild_id)
+            version = data.get("version")
+            version = version if isinstance(version, int) else 1
+            prompts = decode_prompts(data)
+        pending = 0
+        outbox_path = os.path.join(store.outbox_dir, f"{guild_id}.json")
+        if os.path.exists(outbox_path):
+            outbox = store.read_json(store.outbox_dir, guild_id)
+            pending = sum(
+                entry["state"] != "sent" for entry in outbox["prompts"].values()
+            )
+        print(
+            f"{guild_id}: {len(prompts)} prompts (schema {version}),"
+            f" {sum(len(record.attachments) for record in prompts.values())} files,"
+            f" {pending} unsent in outbox,"
+            f" {len(archive.index(guild_id))} archived"
+        )
+    for legacy in ("prompt_info.json", "config.json"):
+        for directory in (store.prompt_dir, store.config_dir):
+            if os.path.exists(os.path.join(directory, legacy)):
+                print(f"legacy file to migrate: {os.path.join(directory, legacy)}")
+    return 0
+
+
+def validate(store, args):
+    problems = []
+    archive = PromptArchive(store.archive_dir)
+    for guild_id in store.guild_ids():
+        try:
+            prompts = (
+                store.prompts(guild_id)
+                if os.path.exists(os.path.join(store.prompt_dir, f"{guild_id}.json"))
+                else {}
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            problems.append(f"{guild_id}: prompts file unreadable: {e!r}")
+            continue
+        for prompt_id, record in prompts.items():
+            if not record.channel:
+                problems.append(f"{guild_id} {prompt_id}: no channel")
+            if not record.message.strip():
+                problems.append(f"{guild_id} {prompt_id}: empty message")
+            for file_name in record.attachments:
+                if not os.path.exists(
+                    os.path.join(store.prompt_image_dir, guild_id, file_name)
+                ):
+                    problems.append(
+                        f"{guild_id} {prompt_id}: missing file {file_name}"
+                    )
+        for directory in (store.config_dir, store.outbox_dir):
+            if os.path.exists(os.path.join(directory, f"{guild_id}.json")):
+                try:
+                    store.read_json(directory, guild_id)
+                except ValueError as e:
+                    problems.append(f"{guild_id}: {directory} file unreadable: {e}")
+        # Checking must not create archive directories or lock files
+        if not os.path.isdir(os.path.join(store.archive_dir, guild_id)):
+            continue
+        try:
+            archive.records(guild_id, archive.index(guild_id))
+        except (OSError, ValueError, KeyError) as e:
+            problems.append(f"{guild_id}: archive unreadable: {e!r}")
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problems found")
+    return 1 if problems else 0
+
+
+def compact(store, args):
+    # Safe while running: the archive is locked per guild, the bot waits
+    # for the lock in a worker thread rather than on its event loop, and
+    # it notices the rewritten index
+    archive = PromptArchive(store.archive_dir)
+    if not os.path.isdir(store.archive_dir):
+        print("Nothing archived yet")
+        return 0
+    for guild_id in sorted(os.listdir(store.archive_dir)):
+        if not archive.index(guild_id):
+            continue
+        before, after = archive.compact(guild_id)
+        print(f"{guild_id}: archive {before} -> {after} bytes")
+    return 0
+
+
+def migrate(store, args):
+    store.require_stopped()
+    for guild_id, data in migrate_legacy(
+        store.config_dir, "config.json", lambda key, _: key, keyed_by_guild=True
+    ).items():
+        print(f"{guild_id}: config moved to its own file")
+    for guild_id in guild_ids(store.prompt_dir):
+        data = store.read_json(store.prompt_dir, guild_id)
+        if data.get("version") != SCHEMA_VERSION:
+            save_guild(
+                store.prompt_dir, guild_id, encode_prompts(decode_prompts(data))
+            )
+            print(f"{guild_id}: prompts upgraded to schema {SCHEMA_VERSION}")
+    if os.path.exists(os.path.join(store.prompt_dir, "prompt_info.json")):
+        # Its prompts are placed by channel, which needs Discord
+        print("prompt_info.json is migrated by the bot when it next starts")
+    return 0
+
+
+def prune_files(store, args):
+    """
+    Removes files in prompt_image_dir that no prompt or outbox refers to.
+    Files newer than --min-age are kept, since a prompt being saved in a
+    running bot may not have been written to disk yet.
+    """
+    cutoff = time.time() - args.min_age * 3600
+    removed = 0
+    if not os.path.isdir(store.prompt_image_dir):
+        return 0
+    for guild_id in sorted(os.listdir(store.prompt_image_dir)):
+        file_dir = os.path.join(store.prompt_image_dir, guild_id)
+        if not os.path.isdir(file_dir):
+            continue
+        referenced = set()
+        if os.path.exists(os.path.join(store.prompt_dir, f"{guild_id}.json")):
+            for record in store.prompts(guild_id).values():
+                referenced.update(record.attachments)
+        if os.path.exists(os.path.join(store.outbox_dir, f"{guild_id}.json")):
+            outbox = store.read_json(store.outbox_dir, guild_id)
+            for entry in outbox["prompts"].values():
+                referenced.update(
+                    os.path.basename(operation["path"])
+                    for operation in entry["operations"]
+                    if operation["kind"] == "file"
+                )
+        for file_name in sorted(os.listdir(file_dir)):
+            file_path = os.path.join(file_dir, file_name)
+            # Directories are imports still being staged
+            if (
+                file_name in referenced
+                or not os.path.isfile(file_path)
+                or os.path.getmtime(file_path) > cutoff
+            ):
+                continue
+            print(f"{'would remove' if args.dry_run else 'removing'} {file_path}")
+            if not args.dry_run:
+                os.unlink(file_path)
+            removed += 1
+    print(f"{removed} orphaned files {'found' if args.dry_run else 'removed'}")
+    return 0
+
+
+def export(store, args):
+    # Imported here so the other commands do not pay for zipfile
+    from promptbundle import write_export
+
+    prompts = store.prompts(args.guild_id)
+    output = args.output or f"prompts-{args.guild_id}.zip"
+    missing = write_export(
+        output, prompts, os.path.join(store.prompt_image_dir, args.guild_id)
+    )
+    for file_name in missing:
+        print(f"missing file: {file_name}")
+    print(f"Exported {len(prompts)} prompts to {output}")
+    return 0
+
+
+def set_quota(store, args):
+    # Overrides the QUOTA_* defaults for one guild; 0 means unlimited
+    store.require_stopped()
+    path = os.path.join(store.config_dir, f"{args.guild_id}.json")
+    if os.path.exists(path):
+        config = store.read_json(store.config_dir, args.guild_id)
+    else:
+        config = {"log_channel_id": None, "category_id": None}
+    if args.reset:
+        config.pop("quotas", None)
+    quotas = config.setdefault("quotas", {})
+    for name, value in (
+        ("max_prompts", args.prompts),
+        ("max_bytes", None if args.mib is None else args.mib * 1024 * 1024),
+        ("commands_per_minute", args.commands_per_minute),
+    ):
+        if value is not None:
+            quotas[name] = value
+    if not quotas:
+        del config["quotas"]
+    save_guild(store.config_dir, args.guild_id, config)
+    print(f"{args.guild_id}: quotas {config.get('quotas', 'reset to defaults')}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="promptadmin", description="Offline maintenance for THGBot's data"
+    )
+    parser.add_argument("--data-dir", help="Use this instead of $SNAP_DATA")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    inspect_parser = commands.add_parser("inspect", help="Summarise stored guilds")
+    inspect_parser.add_argument(
+        "guild_id", nargs="?", help="List this guild's prompts"
+    )
+    inspect_parser.set_defaults(run=inspect)
+
+    commands.add_parser(
+        "validate", help="Check every file parses and attachments exist"
+    ).set_defaults(run=validate)
+    commands.add_parser(
+        "compact", help="Rewrite archives into fewer, larger frames"
+    ).set_defaults(run=compact)
+    commands.add_parser(
+        "migrate", help="Upgrade stored files to the current layout and schema"
+    ).set_defaults(run=migrate)
+
+    prune_parser = commands.add_parser(
+        "prune-files", help="Remove attachment files nothing refers to"
+    )
+    prune_parser.add_argument(
+        "--min-age",
+        type=float,
+        default=24,
+        help="Keep files newer than this many hours",
+    )
+    prune_parser.add_argument("--dry-run", action="store_true")
+    prune_parser.set_defaults(run=prune_files)
+
+    export_parser = commands.add_parser(
+        "export", help="Export a guild's prompts as a zip"
+    )
+    export_parser.add_argument("guild_id")
+    export_parser.add_argument("--output", "-o", help="Zip file to write")
+    export_parser.set_defaults(run=export)
+
+    quota_parser = commands.add_parser(
+        "set-quota", help="Set a guild's quotas, overriding the defaults"
+    )
+    quota_parser.add_argument("guild_id")
+    quota_parser.add_argument("--prompts", type=int, help="Most prompts stored")
+    quota_parser.add_argument(
+        "--mib", type=int, help="Most MiB of prompt text and files stored"
+    )
+    quota_parser.add_argument("--commands-per-minute", type=int)
+    quota_parser.add_argument(
+        "--reset", action="store_true", help="Drop overrides set before"
+    )
+    quota_parser.set_defaults(run=set_quota)
+
+    args = parser.parse_args(argv)
+    return args.run(Store(data_dir(args.data_dir)), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import datetime
+import json
+import os
+import struct
+import time
+import zlib
+from promptrecord import PromptRecord
+from promptstore import directory_lock, write_atomic
+
+# A segment stops taking new frames once it reaches this size
+SEGMENT_BYTES = 1024 * 1024
+INDEX_NAME = "index.jsonl"
+# Records per frame when compacting
+COMPACT_FRAME_RECORDS = 200
+# Each frame is a big-endian length followed by that many compressed bytes
+_FRAME_HEADER = struct.Struct(">I")
+
+
+class PromptArchive:
+    """
+    Append-only archive of sent and cleared prompts, one directory per guild.
+
+    Each append writes the archived records as a single zlib-compressed
+    frame at the end of the guild's current segment file, then one line
+    per record to index.jsonl with its game, prompt ID, date and the
+    frame's location. Searches only read the index, and reading a record
+    decompresses just the frame that holds it.
+
+    Writes and reads hold the guild directory's lock, so the offline admin
+    tool can compact an archive while the bot is running. Compaction
+    replaces index.jsonl, which is noticed by its inode changing.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # (index inode, entries) by guild ID, read from disk on first use
+        self._indexes = {}
+
+    def _guild_dir(self, guild_id):
+        return os.path.join(self.directory, guild_id)
+
+    def index(self, guild_id) -> list[dict]:
+        path = os.path.join(self._guild_dir(guild_id), INDEX_NAME)
+        try:
+            inode = os.stat(path).st_ino
+        except FileNotFoundError:
+            inode = None
+        cached = self._indexes.get(guild_id)
+        if cached and cached[0] == inode:
+            return cached[1]
+
+        entries = []
+        if inode is not None:
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash mid-append
+                        continue
+        self._indexes[guild_id] = (inode, entries)
+        return entries
+
+    @staticmethod
+    def _segments(guild_dir) -> list[str]:
+        return sorted(
+            name for name in os.listdir(guild_dir) if name.startswith("segment-")
+        )
+
+    @staticmethod
+    def _next_segment(segments) -> str:
+        number = int(segments[-1][8:13]) + 1 if segments else 1
+        return f"segment-{number:05d}.z"
+
+    def _current_segment(self, guild_dir) -> str:
+        segments = self._segments(guild_dir)
+        if segments:
+            last = segments[-1]
+            if os.path.getsize(os.path.join(guild_dir, last)) < SEGMENT_BYTES:
+                return last
+        return self._next_segment(segments)
+
+    def append(
+        self, guild_id, records: list[PromptRecord], reason: str, game=None
+    ) -> int:
+        """
+        Archives prompt records. Records already archived unchanged, e.g.
+        when a resumed send-all settles again, are skipped.
+
+        Args:
+            guild_id: The guild ID as a string
+            records: The records to archive
+            reason: Why they were archived, "sent" or "cleared"
+            game: Name of the game the prompts belong to, if set
+
+        Returns:
+            Number of records archived
+        """
+        guild_dir = self._guild_dir(guild_id)
+        with directory_lock(guild_dir):
+            return self._append(guild_id, guild_dir, records, reason, game)
+
+    def _append(self, guild_id, guild_dir, records, reason, game) -> int:
+        index = self.index(guild_id)
+        archived_ids = {(entry["prompt_id"], entry["updated"]) for entry in index}
+        records = [
+            record
+            for record in records
+            if (record.prompt_id, record.updated) not in archived_ids
+        ]
+        if not records:
+            return 0
+
+        segment = self._current_segment(guild_dir)
+        offset = self._write_frame(guild_dir, segment, records)
+
+        # The index is written after the frame, so it never points at a
+        # frame that was only partly written
+        archived = time.time()
+        date = datetime.datetime.fromtimestamp(archived, datetime.timezone.utc)
+        entries = [
+            {
+                "prompt_id": record.prompt_id,
+                "game": game,
+                "date": date.date().isoformat(),
+                "archived": archived,
+                "reason": reason,
+                "updated": record.updated,
+                "segment": segment,
+                "offset": offset,
+            }
+            for record in records
+        ]
+        with open(os.path.join(guild_dir, INDEX_NAME), "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        index.extend(entries)
+        return len(records)
+
+    @staticmethod
+    def _write_frame(guild_dir, segment, records) -> int:
+        """Appends one compressed frame of records and returns its offset."""
+        frame = zlib.compress(
+            json.dumps({record.prompt_id: record.to_dict() for record in records})
+            .encode()
+        )
+        with open(os.path.join(guild_dir, segment), "ab") as f:
+            offset = f.tell()
+            f.write(_FRAME_HEADER.pack(len(frame)) + frame)
+            f.flush()
+            os.fsync(f.fileno())
+        return offset
+
+    def search(self, guild_id, prompt_id=None, game=None, date=None) -> list[dict]:
+        """
+        Finds archived prompts using only the index.
+
+        Args:
+            guild_id: The guild ID as a string
+            prompt_id: Only match this prompt ID
+            game: Only match this game, ignoring case
+            date: Only match prompts archived on this UTC date
+
+        Returns:
+            Matching index entries, newest first
+        """
+        matches = []
+        for entry in reversed(self.index(guild_id)):
+            if prompt_id and entry["prompt_id"] != prompt_id:
+                continue
+            if game and (entry["game"] or "").lower() != game.lower():
+                continue
+            if date and entry["date"] != date.isoformat():
+                continue
+            matches.append(entry)
+        return matches
+
+    def _read_frame(self, guild_id, segment, offset) -> dict:
+        with open(os.path.join(self._guild_dir(guild_id), segment), "rb") as f:
+            f.seek(offset)
+            (length,) = _FRAME_HEADER.unpack(f.read(_FRAME_HEADER.size))
+            return json.loads(zlib.decompress(f.read(length)))
+
+    def records(self, guild_id, entries: list[dict]) -> list[PromptRecord]:
+        """Reads the records for index entries, decompressing each frame once."""
+        with directory_lock(self._guild_dir(guild_id)):
+            return self._read_records(guild_id, entries)
+
+    def _read_records(self, guild_id, entries):
+        # Entries found before a compaction are looked up again
+        current = {
+            (entry["prompt_id"], entry["updated"]): entry
+            for entry in self.index(guild_id)
+        }
+        frames = {}
+        records = []
+        for entry in entries:
+            entry = current.get((entry["prompt_id"], entry["updated"]), entry)
+            location = (entry["segment"], entry["offset"])
+            if location not in frames:
+                frames[location] = self._read_frame(guild_id, *location)
+            records.append(
+                PromptRecord.from_dict(
+                    entry["prompt_id"], frames[location][entry["prompt_id"]]
+                )
+            )
+        return records
+
+    def compact(self, guild_id) -> tuple[int, int]:
+        """
+        Rewrites a guild's archive into full segments of large frames, which
+        compress better than the small frames written as prompts are sent.
+
+        Returns:
+            (bytes before, bytes after)
+        """
+        guild_dir = self._guild_dir(guild_id)
+        with directory_lock(guild_dir):
+            old_segments = self._segments(guild_dir)
+            before = sum(
+                os.path.getsize(os.path.join(guild_dir, name)) for name in old_segments
+            )
+            entries = self.index(guild_id)
+            records = self._read_records(guild_id, entries)
+
+            new_segments = []
+            new_entries = []
+            batch = []
+
+            def flush():
+                if not new_segments or (
+                    os.path.getsize(os.path.join(guild_dir, new_segments[-1]))
+                    >= SEGMENT_BYTES
+                ):
+                    new_segments.append(
+                        self._next_segment(old_segments + new_segments)
+                    )
+                segment = new_segments[-1]
+                offset = self._write_frame(
+                    guild_dir, segment, [record for _, record in batch]
+                )
+                for entry, _ in batch:
+                    new_entries.append({**entry, "segment": segment, "offset": offset})
+                batch.clear()
+
+            for entry, record in zip(entries, records):
+                # A frame holds one record per prompt ID
+                if len(batch) >= COMPACT_FRAME_RECORDS or any(
+                    queued.prompt_id == record.prompt_id for _, queued in batch
+                ):
+                    flush()
+                batch.append((entry, record))
+            if batch:
+                flush()
+
+            write_atomic(
+                os.path.join(guild_dir, INDEX_NAME),
+                "".join(json.dumps(entry) + "\n" for entry in new_entries),
+            )
+            for name in old_segments:
+                os.unlink(os.path.join(guild_dir, name))
+            after = sum(
+                os.path.getsize(os.path.join(guild_dir, name)) for name in new_segments
+            )
+        return before, after
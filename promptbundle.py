@@ -0,0 +1,266 @@
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import zipfile
+from promptrecord import PromptRecord
+
+# File types prompts may carry, as accepted by /add-file
+ATTACHMENT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".webm", ".mp3")
+# Prompt lists a zip may contain, checked in this order
+PROMPT_FILES = ("prompts.jsonl", "prompts.json", "prompts.csv")
+CHANNEL_MENTION = re.compile(r"<#(\d+)>")
+# Most a zip import may expand to, whatever the guild's quota
+MAX_UNPACKED_BYTES = 512 * 1024 * 1024
+# Most a .json prompt list may be. It is parsed whole, unlike .jsonl and
+# .csv which are read a row at a time, so it gets a far lower limit.
+MAX_JSON_BYTES = 16 * 1024 * 1024
+
+
+def valid_prompt_id(prompt_id: str) -> bool:
+    # Same format PromptModal enforces, e.g. D1F, D12M
+    return 1 < len(prompt_id) <= 5 and prompt_id[1].isdigit()
+
+
+class PromptImport:
+    """The outcome of validating an import file."""
+
+    def __init__(self):
+        self.records = {}
+        # Attachment file name -> zip member it is extracted from
+        self.files = {}
+        self.errors = []
+        self.replaced = []
+        # Uncompressed size of the attachments to extract
+        self.file_bytes = 0
+
+
+def _json_rows(f):
+    data = json.load(f)
+    if isinstance(data, list):
+        yield from enumerate(data, 1)
+        return
+    # An export or a prompts file: {"version": 2, "prompts": {...}} or the
+    # unversioned {prompt_id: {...}} mapping
+    prompts = data.get("prompts") if isinstance(data.get("version"), int) else data
+    for line, (prompt_id, row) in enumerate(prompts.items(), 1):
+        # Anything but an object is reported by _add_row
+        yield line, {"prompt_id": prompt_id, **row} if isinstance(row, dict) else row
+
+
+def _jsonl_rows(f):
+    for line, text in enumerate(f, 1):
+        if text.strip():
+            yield line, json.loads(text)
+
+
+def _csv_rows(f):
+    # Attachments are separated by semicolons in a CSV
+    for line, row in enumerate(csv.DictReader(f), 2):
+        attachments = row.get("attachments") or ""
+        row["attachments"] = [name for name in attachments.split(";") if name]
+        yield line, row
+
+
+def _rows(f, file_name):
+    """Reads prompt rows one at a time from a JSON, JSONL or CSV text stream."""
+    if file_name.endswith(".jsonl"):
+        return _jsonl_rows(f)
+    if file_name.endswith(".json"):
+        return _json_rows(f)
+    if file_name.endswith(".csv"):
+        return _csv_rows(f)
+    raise ValueError("Upload a .json, .jsonl, .csv or .zip file.")
+
+
+def _check_json_size(file_name, size):
+    if file_name.endswith(".json") and size > MAX_JSON_BYTES:
+        raise ValueError(
+            f"{file_name} is over {MAX_JSON_BYTES // 1024 // 1024} MiB."
+            " Import large prompt lists as .jsonl instead."
+        )
+
+
+def read_import(path, file_name, channels, prompts, replace=False) -> PromptImport:
+    """
+    Parses and validates an uploaded import without changing any state.
+
+    Args:
+        path: Where the upload was saved
+        file_name: The upload's original file name
+        channels: Channel ID by str(ID) and by lowercased name, for the
+            guild's text channels
+        prompts: The guild's current prompts
+        replace: Allow replacing prompts that already exist
+
+    Returns:
+        A PromptImport. Nothing should be committed if it has errors.
+    """
+    result = PromptImport()
+    file_name = file_name.lower()
+    archive = None
+    members = {}
+    try:
+        if file_name.endswith(".zip"):
+            archive = zipfile.ZipFile(path)
+            for member in archive.namelist():
+                if not member.endswith("/"):
+                    members.setdefault(os.path.basename(member), member)
+            prompt_file = next(
+                (members[name] for name in PROMPT_FILES if name in members), None
+            )
+            if not prompt_file:
+                raise ValueError(
+                    "The zip needs a prompts.jsonl, prompts.json or prompts.csv file."
+                )
+            # Sizes are checked before anything is decompressed. zipfile never
+            # reads past a member's stated size, so they cannot be lied about.
+            if archive.getinfo(prompt_file).file_size > MAX_UNPACKED_BYTES:
+                raise ValueError(f"{prompt_file} is too large to import.")
+            _check_json_size(prompt_file, archive.getinfo(prompt_file).file_size)
+            stream = io.TextIOWrapper(
+                archive.open(prompt_file), encoding="utf-8-sig", newline=""
+            )
+            rows = _rows(stream, prompt_file)
+        else:
+            _check_json_size(file_name, os.path.getsize(path))
+            stream = open(path, "r", encoding="utf-8-sig", newline="")
+            rows = _rows(stream, file_name)
+
+        with stream:
+            for line, row in rows:
+                _add_row(result, line, row, channels, prompts, replace, members)
+        if archive:
+            result.file_bytes = sum(
+                archive.getinfo(member).file_size for member in result.files.values()
+            )
+            if result.file_bytes > MAX_UNPACKED_BYTES:
+                result.errors.append(
+                    f"The zip's files expand to {result.file_bytes / 1024 / 1024:.0f} MiB,"
+                    f" over the {MAX_UNPACKED_BYTES // 1024 // 1024} MiB import limit."
+                )
+    except (
+        ValueError,
+        KeyError,
+        AttributeError,
+        TypeError,
+        csv.Error,
+        zipfile.BadZipFile,
+    ) as e:
+        result.errors.append(str(e) or "The file could not be read.")
+    finally:
+        if archive:
+            archive.close()
+
+    # Attachment names must not collide with files of prompts that are kept
+    kept = {
+        file_name: prompt_id
+        for prompt_id, record in prompts.items()
+        if prompt_id not in result.records
+        for file_name in record.attachments
+    }
+    for file_name in result.files:
+        if file_name in kept:
+            result.errors.append(
+                f"{file_name} is already attached to {kept[file_name]}"
+            )
+    return result
+
+
+def _add_row(result, line, row, channels, prompts, replace, members):
+    if not isinstance(row, dict):
+        result.errors.append(f"Line {line}: expected an object")
+        return
+    prompt_id = str(row.get("prompt_id") or "").upper().strip().replace(" ", "_")
+    if not valid_prompt_id(prompt_id):
+        result.errors.append(
+            f"Line {line}: {prompt_id or 'missing ID'} is not a valid prompt ID"
+        )
+        return
+    if prompt_id in result.records:
+        result.errors.append(f"Line {line}: {prompt_id} appears more than once")
+        return
+    if prompt_id in prompts:
+        if not replace:
+            result.errors.append(f"Line {line}: {prompt_id} already exists")
+            return
+        result.replaced.append(prompt_id)
+
+    channel = str(row.get("channel") or "").strip()
+    if mention := CHANNEL_MENTION.fullmatch(channel):
+        channel = mention.group(1)
+    channel_id = channels.get(channel) or channels.get(channel.lstrip("#").lower())
+    if not channel_id:
+        result.errors.append(f"Line {line}: {prompt_id} has no channel {channel!r}")
+        return
+
+    attachments = row.get("attachments") or []
+    if isinstance(attachments, str):
+        attachments = [attachments]
+    for file_name in attachments:
+        file_name = os.path.basename(file_name)
+        if not file_name.lower().endswith(ATTACHMENT_EXTENSIONS):
+            result.errors.append(
+                f"Line {line}: {file_name} is not an allowed file type"
+            )
+        elif file_name not in members:
+            result.errors.append(f"Line {line}: {file_name} is not in the zip")
+        else:
+            result.files[file_name] = members[file_name]
+
+    result.records[prompt_id] = PromptRecord(
+        prompt_id,
+        channel_id,
+        str(row.get("message") or ""),
+        tuple(os.path.basename(name) for name in attachments),
+    )
+
+
+def extract_files(path, files: dict[str, str], file_dir):
+    """Copies a validated import's attachments out of the zip in chunks."""
+    if not files:
+        return
+    os.makedirs(file_dir, exist_ok=True)
+    with zipfile.ZipFile(path) as archive:
+        for file_name, member in files.items():
+            with archive.open(member) as source, open(
+                os.path.join(file_dir, file_name), "wb"
+            ) as target:
+                shutil.copyfileobj(source, target)
+
+
+def write_export(out_file, prompts, file_dir) -> list[str]:
+    """
+    Writes a guild's prompts as a zip that /import-prompts accepts:
+    prompts.jsonl plus attachments/<file name>. Attachments are copied from
+    disk in chunks, so the archive is never held in memory.
+
+    Args:
+        out_file: Path or binary file object to write the zip to
+        prompts: The guild's prompts
+        file_dir: The guild's prompt image directory
+
+    Returns:
+        Attachment file names that were missing on disk
+    """
+    missing = []
+    with zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("prompts.jsonl", "w") as f:
+            for prompt_id, record in prompts.items():
+                row = {"prompt_id": prompt_id, **record.to_dict()}
+                f.write((json.dumps(row) + "\n").encode())
+        for record in prompts.values():
+            for file_name in record.attachments:
+                file_path = os.path.join(file_dir, file_name)
+                if os.path.exists(file_path):
+                    # Media is already compressed
+                    archive.write(
+                        file_path,
+                        f"attachments/{file_name}",
+                        compress_type=zipfile.ZIP_STORED,
+                    )
+                else:
+                    missing.append(file_name)
+    return missing
@@ -0,0 +1,472 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from promptmodal import PromptModal
+from addtopromptmodal import AddToPromptModal
+from confirmationview import ConfirmationView
+from utils import split_message
+from commandutils import prompt_ids_list
+from promptsearch import snippet
+from promptmedia import resizable
+from promptpageview import PromptPageView
+import io
+import os
+from typing import Literal, Optional
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCommands(commands.Cog):
+    """Creating, viewing, searching and clearing prompts."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="view-prompt-ids", description="Lists all prompt_ids")
+    async def view_prompt_ids(self, interaction: discord.Interaction):
+        await prompt_ids_list(self.bot, interaction, "Prompts", None)
+
+    @app_commands.command(name="view-prompt", description="View a prompt")
+    @app_commands.describe(
+        mode="pages: one embed with buttons (default), file: the text as a .md file, "
+        "messages: one message per chunk as it will be sent"
+    )
+    async def viewPrompt(
+        self,
+        interaction: discord.Interaction,
+        prompt_id: str,
+        mode: Literal["pages", "file", "messages"] = "pages",
+    ):
+        prompt_id = prompt_id.upper().strip().replace(" ", "_")
+        guild_id = str(interaction.guild.id)
+        record = self.bot.state.snapshot(guild_id).get(prompt_id)
+        if record and interaction.guild.get_channel(record.channel):
+            messages = split_message(record.message)
+            if mode != "messages" and record.message:
+                await self.preview_prompt(interaction, guild_id, record, messages, mode)
+            elif messages:
+                await interaction.response.send_message(messages[0], ephemeral=True)
+                for msg in messages[1:]:
+                    await interaction.followup.send(msg, ephemeral=True)
+                for file_name in record.attachments:
+                    file_path = os.path.join(self.bot.prompt_image_dir, guild_id, file_name)
+                    if os.path.exists(file_path):
+                        await interaction.followup.send(
+                            file=discord.File(file_path), ephemeral=True
+                        )
+                    else:
+                        await interaction.followup.send(
+                            "File is missing, please reattach the file.",
+                            ephemeral=True,
+                        )
+            else:
+                await interaction.response.send_message("Prompt is empty", ephemeral=True)
+        else:
+            await interaction.response.send_message("Prompt not found", ephemeral=True)
+
+    async def preview_prompt(self, interaction, guild_id, record, messages, mode):
+        """
+        Shows a whole prompt in a single response, with its attachments
+        bundled in as long as they fit under the upload limit together.
+        """
+        files = []
+        notes = []
+        total = 0
+        for file_name in record.attachments:
+            file_path = os.path.join(self.bot.prompt_image_dir, guild_id, file_name)
+            if not os.path.exists(file_path):
+                notes.append(f"{file_name} is missing, please reattach the file.")
+                continue
+            size = os.path.getsize(file_path)
+            if len(files) >= 9 or total + size > interaction.guild.filesize_limit:
+                notes.append(f"{file_name} is too large to show here.")
+                continue
+            total += size
+            files.append(discord.File(file_path))
+
+        if mode == "file":
+            text = io.BytesIO(record.message.encode())
+            files.insert(0, discord.File(text, filename=f"{record.prompt_id}.md"))
+            content = (
+                f"`{record.prompt_id}`: {len(record.message)} characters, "
+                f"sent as {len(messages)} message(s)."
+            )
+            if notes:
+                content += "\n" + "\n".join(notes)
+            await interaction.response.send_message(
+                content[:2000], files=files, ephemeral=True
+            )
+            return
+
+        footer = " ".join(notes)[:2048] or None
+        if len(messages) > 1:
+            view = PromptPageView(record.prompt_id, messages, footer)
+            await interaction.response.send_message(
+                embed=view.embed(), view=view, files=files, ephemeral=True
+            )
+        else:
+            embed = discord.Embed(
+                title=record.prompt_id,
+                description=messages[0],
+                color=discord.Color.blue(),
+            )
+            if footer:
+                embed.set_footer(text=footer)
+            await interaction.response.send_message(
+                embed=embed, files=files, ephemeral=True
+            )
+
+    @app_commands.command(name="search-prompts", description="Search the text of saved prompts")
+    @app_commands.describe(
+        query='Words to find. Use "quotes" for a phrase and a trailing * for a prefix'
+    )
+    async def search_prompts(self, interaction: discord.Interaction, query: str):
+        guild_id = str(interaction.guild.id)
+        prompts = self.bot.state.snapshot(guild_id)
+        results = self.bot.search.search(guild_id, prompts, query)
+        if not results:
+            await interaction.response.send_message(
+                "No prompts match that search.", ephemeral=True
+            )
+            return
+
+        shown = results[:10]
+        search_embed = discord.Embed(
+            title=f"**{len(results)} prompts match**", color=discord.Color.blue()
+        )
+        for result in shown:
+            record = prompts[result.prompt_id]
+            search_embed.add_field(
+                name=result.prompt_id,
+                value=f"<#{record.channel}>\n{snippet(record.message, result.position, result.length)}"[
+                    :1024
+                ],
+                inline=False,
+            )
+        if len(results) > len(shown):
+            search_embed.set_footer(
+                text=f"{len(results) - len(shown)} more, narrow the search to see them"
+            )
+        await interaction.response.send_message(embed=search_embed, ephemeral=True)
+
+    @app_commands.command(name="save-prompt", description="Stores prompt info using a modal UI")
+    async def save_prompt(
+        self,
+        interaction: discord.Interaction, file: Optional[discord.Attachment]
+    ):
+        guild_id = str(interaction.guild.id)
+        over_quota = self.bot.quotas.check_storage(
+            guild_id, new_bytes=file.size if file else 0
+        )
+        if over_quota:
+            await interaction.response.send_message(over_quota, ephemeral=True)
+            return
+        try:
+            if not file:
+                modal = PromptModal(interaction, self.bot)
+                await interaction.response.send_modal(modal)
+            elif (
+                file.filename.lower().endswith(".png")
+                or file.filename.lower().endswith(".jpg")
+                or file.filename.lower().endswith(".jpeg")
+                or file.filename.lower().endswith(".webp")
+                or file.filename.lower().endswith(".webm")
+                or file.filename.lower().endswith(".mp3")
+            ):
+                limit = interaction.guild.filesize_limit
+                if file.size > limit and not resizable(file.filename):
+                    await interaction.response.send_message(
+                        f"{file.filename} is over this server's "
+                        f"{limit / 1024 / 1024:.0f} MiB upload limit.",
+                        ephemeral=True,
+                    )
+                    return
+                modal = PromptModal(interaction, self.bot, file)
+                await interaction.response.send_modal(modal)
+            else:
+                await interaction.response.send_message(
+                    "Please upload a .png, .jpg, .jpeg, .webp, or .webm file."
+                )
+            return
+        except Exception as e:
+            await interaction.response.send_message("An error occured. Please try again.")
+            logger.exception(
+                "Failed to open prompt modal",
+                extra={"guild": guild_id, "command": "save-prompt"},
+            )
+
+    @app_commands.command(
+        name="add-to-prompt", description="Adds content to a prompt using a modal UI"
+    )
+    async def add_to_prompt(self, interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        over_quota = self.bot.quotas.check_storage(guild_id)
+        if over_quota:
+            await interaction.response.send_message(over_quota, ephemeral=True)
+            return
+        try:
+            modal = AddToPromptModal(interaction, self.bot)
+            await interaction.response.send_modal(modal)
+        except Exception as e:
+            await interaction.response.send_message("An error occured. Please try again.")
+            logger.exception(
+                "Failed to open add-to-prompt modal",
+                extra={"guild": guild_id, "command": "add-to-prompt"},
+            )
+
+    @app_commands.command(name="add-file", description="Add a file to a specific prompt.")
+    async def add_file(
+        self,
+        interaction: discord.Interaction, prompt_id: str, file: discord.Attachment
+    ):
+        # Add a file to an existing prompt without overwriting
+
+        await interaction.response.defer(ephemeral=True)
+
+        guild_id = str(interaction.guild.id)
+        prompt_id = prompt_id.upper().strip()
+
+        # Check if prompt exists
+        if prompt_id not in self.bot.state.snapshot(guild_id):
+            await interaction.followup.send(
+                f"Prompt ID `{prompt_id}` not found. Please create the prompt first.",
+                ephemeral=True,
+            )
+            return
+
+        # Validate file type
+        if not (
+            file.filename.endswith(".png")
+            or file.filename.endswith(".jpg")
+            or file.filename.endswith(".jpeg")
+            or file.filename.endswith(".webp")
+            or file.filename.endswith(".webm")
+            or file.filename.endswith(".mp3")
+        ):
+            await interaction.followup.send(
+                "Please upload a .png, .jpeg, .jpg, .webm, .webp, or .mp3 file.",
+                ephemeral=True,
+            )
+            return
+        # Files that cannot be shrunk are refused before downloading them
+        limit = interaction.guild.filesize_limit
+        if file.size > limit and not resizable(file.filename):
+            await interaction.followup.send(
+                f"{file.filename} is over this server's "
+                f"{limit / 1024 / 1024:.0f} MiB upload limit.",
+                ephemeral=True,
+            )
+            return
+        over_quota = self.bot.quotas.check_storage(guild_id, new_bytes=file.size)
+        if over_quota:
+            await interaction.followup.send(over_quota, ephemeral=True)
+            return
+
+        # Prepare file directory
+        file_dir = os.path.join(self.bot.prompt_image_dir, guild_id)
+        os.makedirs(file_dir, exist_ok=True)
+
+        # Downloaded and shrunk under a staging name before taking the
+        # lock, so other edits to the guild do not wait on it. Under the
+        # lock the file is numbered after the prompt's other files and
+        # renamed into place. Leaving the block saves to persistent storage.
+        file_extension = os.path.splitext(file.filename)[1]
+        upload_path = os.path.join(file_dir, f".upload-{interaction.id}{file_extension}")
+        await file.save(upload_path)
+        info = await self.bot.media.ingest(upload_path, limit)
+        if info.error:
+            os.unlink(upload_path)
+            await interaction.followup.send(
+                info.error.replace(info.file_name, file.filename), ephemeral=True
+            )
+            return
+        async with self.bot.state.write(guild_id) as prompts:
+            if prompt_id not in prompts:
+                record = None
+                os.unlink(upload_path)
+            else:
+                # Number additional files so they do not overwrite the first one
+                record = prompts[prompt_id].copy()
+                if record.attachments:
+                    new_filename = f"{prompt_id}_{len(record.attachments)}{file_extension}"
+                else:
+                    new_filename = f"{prompt_id}{file_extension}"
+                file_path = os.path.join(file_dir, new_filename)
+                os.replace(upload_path, file_path)
+                record.add_attachment(new_filename)
+                prompts[prompt_id] = record
+        if not record:
+            await interaction.followup.send(
+                f"Prompt ID `{prompt_id}` was cleared before the file was added.",
+                ephemeral=True,
+            )
+            return
+
+        # Log to log channel
+        if "log_channel_id" in self.bot.config[guild_id]:
+            log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+            if log_channel:
+                log_embed = discord.Embed(
+                    title=f"File added to {prompt_id}",
+                    description=f"Added: `{new_filename}`",
+                    color=discord.Color.green(),
+                )
+                log_embed.set_author(
+                    name=interaction.user.name,
+                    icon_url=(
+                        interaction.user.avatar.url if interaction.user.avatar else None
+                    ),
+                )
+                log_embed.timestamp = discord.utils.utcnow()
+                if info.original_size:
+                    log_embed.add_field(
+                        name="Resized",
+                        value=f"{info.original_size / 1024:.0f} KiB -> {info.size / 1024:.0f} KiB",
+                    )
+                await log_channel.send(embed=log_embed)
+                if info.thumbnail:
+                    await log_channel.send(
+                        file=discord.File(
+                            io.BytesIO(info.thumbnail), filename=f"{prompt_id}_thumbnail.jpg"
+                        )
+                    )
+                else:
+                    await log_channel.send(file=discord.File(file_path))
+
+        # Confirm to user
+        file_count = len(record.attachments)
+        await interaction.followup.send(
+            f"{new_filename} added to prompt `{prompt_id}`. This prompt now has {file_count} file(s).",
+            ephemeral=True,
+        )
+
+    @app_commands.command(name="clear-prompt", description="Clear a specific prompt")
+    async def clear_prompt(self, interaction: discord.Interaction, prompt_id: str):
+        # Clears a specific prompt
+        prompt_id_key = prompt_id.upper().strip().replace(" ", "_")
+        guild_id = str(interaction.guild.id)
+        if prompt_id_key in self.bot.state.snapshot(guild_id):
+            confirmSend = ConfirmationView()
+            await interaction.response.send_message(
+                f"Are you sure you want to delete the {prompt_id_key} prompt?",
+                ephemeral=True,
+                view=confirmSend,
+            )
+            await confirmSend.wait()
+
+            log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+            log_embed = discord.Embed(
+                title=f"{prompt_id_key} prompt cleared.", color=discord.Color.red()
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+
+            if confirmSend.confirmed:
+                async with self.bot.state.write(guild_id) as prompts:
+                    record = prompts.pop(prompt_id_key, None)
+                    if record:
+                        await self.bot.archive_prompts(guild_id, [record], "cleared")
+                if record:
+                    self.bot.delete_attachments(guild_id, record)
+                msg = await interaction.original_response()
+                await interaction.followup.edit_message(
+                    msg.id, content=f"Prompt {prompt_id_key} cleared.", view=confirmSend
+                )
+                await log_channel.send(embed=log_embed)
+            else:
+                msg = await interaction.original_response()
+                await interaction.followup.edit_message(
+                    msg.id,
+                    content=f"Cancelled clearing the {prompt_id_key} prompt!",
+                    view=confirmSend,
+                )
+        else:
+            await interaction.response.send_message(
+                "This prompt was not found in this server.", ephemeral=True
+            )
+
+    @app_commands.command(name="clear-all-prompts", description="Clear all prompts")
+    async def clearAllPrompts(self, interaction: discord.Interaction):
+        # Clears all the prompts
+        try:
+            guild_id = str(interaction.guild.id)
+            prompts = self.bot.state.snapshot(guild_id)
+            confirmSend = ConfirmationView()
+            length = 0
+            for record in prompts.values():
+                if interaction.guild.get_channel(record.channel):
+                    length += 1
+            await interaction.response.send_message(
+                f"There are {length} prompts saved. Are you sure you want to delete all prompts?",
+                ephemeral=True,
+                view=confirmSend,
+            )
+            await confirmSend.wait()
+            # Prompts may have changed while waiting for confirmation
+            prompts = self.bot.state.snapshot(guild_id)
+
+            prompts_to_del = []
+            prompt_keys = []
+            prompt_mentions = []
+            for prompt_id, record in prompts.items():
+                if interaction.guild.get_channel(record.channel):
+                    prompt_keys.append(prompt_id)
+                    prompt_mentions.append(f"<#{record.channel}>")
+
+            log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+            if length > 0:
+                log_embed = discord.Embed(
+                    title=f"All prompts cleared.", color=discord.Color.red()
+                )
+                log_embed.add_field(
+                    name="Prompt IDs", value=f"**{"\n".join(prompt_keys)}**", inline=True
+                )
+                log_embed.add_field(
+                    name="Prompt channels",
+                    value=f"{'\n'.join(prompt_mentions)}",
+                    inline=True,
+                )
+                log_embed.set_author(
+                    name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+                )
+                if interaction.guild.icon != None:
+                    log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+                log_embed.timestamp = datetime.datetime.now()
+
+            if confirmSend.confirmed:
+                for prompt_id, record in prompts.items():
+                    if interaction.guild.get_channel(record.channel):
+                        prompts_to_del.append(prompt_id)
+
+                async with self.bot.state.write(guild_id) as live_prompts:
+                    cleared = [
+                        live_prompts.pop(prompt_id)
+                        for prompt_id in prompts_to_del
+                        if prompt_id in live_prompts
+                    ]
+                    await self.bot.archive_prompts(guild_id, cleared, "cleared")
+                for record in cleared:
+                    self.bot.delete_attachments(guild_id, record)
+                msg = await interaction.original_response()
+                await interaction.followup.edit_message(
+                    msg.id, content="Prompts cleared", view=confirmSend
+                )
+                await log_channel.send(embed=log_embed)
+            else:
+                await interaction.followup.send("Cancelled clearing all prompts!")
+        except Exception as e:
+            logger.exception(
+                "Failed to clear prompts",
+                extra={"guild": str(interaction.guild.id), "command": "clear-all-prompts"},
+            )
+            await interaction.response.send_message("Prompts not cleared", ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(PromptCommands(bot))
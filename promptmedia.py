@@ -0,0 +1,193 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Pillow is optional. Without it attachments are only checked against the
+# upload limit, never resized, and log messages carry the original file.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+# Longest side of a log channel thumbnail
+THUMBNAIL_SIZE = (320, 320)
+# JPEG and WebP qualities tried at each size before shrinking further
+QUALITIES = (85, 70, 55)
+# Each resize pass shrinks both sides to this fraction
+SCALE_STEP = 0.75
+# Give up rather than shrink an image's shorter side below this
+MIN_SIDE = 64
+
+
+class MediaInfo:
+    """What ingesting an attachment found and did."""
+
+    def __init__(self, file_name, size):
+        self.file_name = file_name
+        self.size = size
+        self.width = None
+        self.height = None
+        # Set when the file was re-encoded to fit the upload limit
+        self.original_size = None
+        # Small JPEG for the log channel, when the file is an image
+        self.thumbnail = None
+        # Why the file cannot be kept, if it cannot
+        self.error = None
+
+
+def resizable(file_name: str) -> bool:
+    return Image is not None and file_name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _encode(image, image_format, quality) -> bytes:
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+    elif image_format == "WEBP":
+        image.save(buffer, "WEBP", quality=quality)
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _fit(image, limit) -> bytes | None:
+    """
+    Re-encodes an image in its own format, lowering the quality and then the
+    size until it is at most limit bytes.
+    """
+    image_format = image.format
+    width, height = image.size
+    scale = 1.0
+    while min(width, height) * scale >= MIN_SIDE:
+        if scale == 1.0:
+            resized = image
+        else:
+            resized = image.resize(
+                (round(width * scale), round(height * scale)), Image.LANCZOS
+            )
+        # PNG is lossless, so only its size can change
+        for quality in QUALITIES if image_format in ("JPEG", "WEBP") else (None,):
+            data = _encode(resized, image_format, quality)
+            if len(data) <= limit:
+                return data
+        scale *= SCALE_STEP
+    return None
+
+
+def _thumbnail(image) -> bytes:
+    thumbnail = image.copy()
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    return _encode(thumbnail, "JPEG", 70)
+
+
+def ingest_file(path, limit) -> MediaInfo:
+    """
+    Probes a saved attachment, shrinks it in place if it is an image over
+    the upload limit and makes its thumbnail. Runs in a worker process.
+
+    Args:
+        path: Where the attachment was saved
+        limit: The guild's upload limit in bytes
+
+    Returns:
+        A MediaInfo. The file should be removed if it has an error.
+    """
+    file_name = os.path.basename(path)
+    info = MediaInfo(file_name, os.path.getsize(path))
+    if not resizable(file_name):
+        if info.size > limit:
+            info.error = (
+                f"{file_name} is {info.size / 1024 / 1024:.1f} MiB, over the "
+                f"{limit / 1024 / 1024:.0f} MiB upload limit"
+            )
+        return info
+
+    try:
+        with Image.open(path) as image:
+            image.load()
+            info.width, info.height = image.size
+            if info.size > limit:
+                # Re-encoding would keep only the first frame
+                data = None if getattr(image, "is_animated", False) else _fit(
+                    image, limit
+                )
+                if data is None:
+                    info.error = (
+                        f"{file_name} is {info.size / 1024 / 1024:.1f} MiB and "
+                        f"could not be shrunk under the "
+                        f"{limit / 1024 / 1024:.0f} MiB upload limit"
+                    )
+                    return info
+                temp_path = path + ".tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+                info.original_size = info.size
+                info.size = len(data)
+                with Image.open(io.BytesIO(data)) as fitted:
+                    info.width, info.height = fitted.size
+            info.thumbnail = _thumbnail(image)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        # Pillow raises all of these for corrupt or truncated files
+        info.error = f"{file_name} could not be read as an image"
+    return info
+
+
+class MediaProcessor:
+    """
+    Ingests attachments in worker processes so probing and re-encoding
+    never run on the event loop.
+
+    Workers are spawned rather than forked, since the bot process runs
+    threads (logging, the loop watchdog) that a fork would copy mid-lock.
+    A spawned worker imports the bot's main module, so thgbot.py does
+    nothing at import beyond importing. The pool starts on first use.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def ingest(self, path, limit) -> MediaInfo:
+        """Runs ingest_file in a worker. See ingest_file."""
+        pool = self._pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                pool, ingest_file, path, limit
+            )
+        except BrokenProcessPool:
+            # A worker died, e.g. killed for memory. The next ingest starts
+            # a new pool.
+            if self._executor is pool:
+                self.shutdown()
+            info = MediaInfo(os.path.basename(path), 0)
+            info.error = f"{info.file_name} could not be processed. Please try again."
+            return info
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def media_from_env() -> MediaProcessor:
+    """Reads MEDIA_WORKERS, the number of worker processes (default 1)."""
+    try:
+        workers = int(os.environ.get("MEDIA_WORKERS") or 1)
+    except ValueError:
+        workers = 1
+    return MediaProcessor(max(1, workers))
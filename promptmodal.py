@@ -1,15 +1,21 @@
 from utils import split_message
 import discord
 from promptview import PromptView
+from promptrecord import PromptRecord
+from promptmedia import MediaInfo
 import datetime
+import io
 import os
 import asyncio
+import logging
 from typing import Optional
 
+logger = logging.getLogger(__name__)
+
 try:
     datadir = os.environ["SNAP_DATA"]
 except:
-    print("SNAP_DATA must be set")
+    logger.error("SNAP_DATA must be set")
 
 prompt_image_dir = os.path.join(datadir, "prompt_images")
 
@@ -75,15 +81,21 @@ class PromptModal(discord.ui.Modal):
 
         prompt_id = self.children[0].value.upper().strip().replace(" ", "_")
         prompt = self.children[1].value
-        self.bot.prompt_info[prompt_id] = {}
+        attachments = ()
 
         if len(prompt_id) > 5 or not prompt_id[1].isdigit():
             await interaction.response.send_message(
                 f"{prompt_id} is not written in the correct format. e.g. D1F, D1M",
                 ephemeral=True,
             )
-            del self.bot.prompt_info[prompt_id]
-            self.bot.save()
+            return
+        over_quota = self.bot.quotas.check_storage(
+            self.guild_id,
+            new_prompts=0 if prompt_id in self.bot.state.snapshot(self.guild_id) else 1,
+            new_bytes=len(prompt.encode()) + (self.file.size if self.file else 0),
+        )
+        if over_quota:
+            await interaction.response.send_message(over_quota, ephemeral=True)
             return
         # Saves files to prompt_image_dir if submitted
         if self.file:
@@ -93,7 +105,11 @@ class PromptModal(discord.ui.Modal):
             )
             os.makedirs(file_dir, exist_ok=True)
             await self.file.save(file_path)
-            self.bot.prompt_info[prompt_id]["image"] = file_path
+            attachments = (os.path.basename(file_path),)
+            # Resized and thumbnailed in a worker while the channel is chosen
+            ingest = asyncio.create_task(
+                self.bot.media.ingest(file_path, interaction.guild.filesize_limit)
+            )
         view = PromptView(self.channels, self.bot)
         msg = await interaction.response.send_message(
             "Select a channel:", view=view, ephemeral=True
@@ -104,13 +120,23 @@ class PromptModal(discord.ui.Modal):
         async def process_prompt(self, interaction: discord.Interaction):
             for count in range(0, 30):
                 if not view.is_finished():
-                    print("sleeping...")
+                    logger.debug(
+                        "Waiting for channel selection",
+                        extra={
+                            "guild": self.guild_id,
+                            "prompt_id": prompt_id,
+                            "sample": 10,
+                        },
+                    )
                     await asyncio.sleep(1)
                 else:
                     break
 
             if view.is_finished():
-                print("is finished")
+                logger.debug(
+                    "Channel selected",
+                    extra={"guild": self.guild_id, "prompt_id": prompt_id},
+                )
 
                 channel_id = view.channel_select.channel_id
 
@@ -119,17 +145,44 @@ class PromptModal(discord.ui.Modal):
                 if not prompt or not channel_id:
                     view.remove_item(view.channel_select)
                     msg = await interaction.original_response()
-                    print(
-                        f"ERROR: process_prompt prompt:{prompt}"
-                        f"channel_id:{channel_id}"
+                    logger.error(
+                        "process_prompt missing prompt or channel_id (channel_id=%s)",
+                        channel_id,
+                        extra={"guild": self.guild_id, "prompt_id": prompt_id},
                     )
                     await interaction.followup.edit_message(
                         msg.id, content="Channel or prompt does not exist", view=view
                     )
                     return
 
-                self.bot.prompt_info[prompt_id]["message"] = prompt
-                self.bot.prompt_info[prompt_id]["channel"] = channel_id
+                info = None
+                if attachments:
+                    try:
+                        info = await ingest
+                    except Exception:
+                        logger.exception(
+                            "Could not process %s",
+                            file_path,
+                            extra={"guild": self.guild_id, "prompt_id": prompt_id},
+                        )
+                        info = MediaInfo(attachments[0], 0)
+                        info.error = f"{attachments[0]} could not be processed."
+                    if info.error:
+                        try:
+                            os.unlink(file_path)
+                        except FileNotFoundError:
+                            pass
+                        view.remove_item(view.channel_select)
+                        msg = await interaction.original_response()
+                        await interaction.followup.edit_message(
+                            msg.id, content=f"Prompt not saved. {info.error}", view=view
+                        )
+                        return
+
+                record = PromptRecord(prompt_id, int(channel_id), prompt, attachments)
+                async with self.bot.state.write(self.guild_id) as prompts:
+                    prompts[prompt_id] = record
+                self.bot.search.update(self.guild_id, record)
                 log_channel = self.bot.get_channel(
                     self.bot.config[self.guild_id]["log_channel_id"]
                 )
@@ -151,15 +204,20 @@ class PromptModal(discord.ui.Modal):
                     messages = split_message(prompt)
                     for message in messages:
                         await log_channel.send(message)
-                    if "image" in self.bot.prompt_info[prompt_id].keys():
-                        file_name = self.bot.prompt_info[prompt_id]["image"]
-                        file_path = os.path.join(
-                            prompt_image_dir, self.guild_id, file_name
+                    if info and info.thumbnail:
+                        await log_channel.send(
+                            file=discord.File(
+                                io.BytesIO(info.thumbnail),
+                                filename=f"SPOILER_{prompt_id}_thumbnail.jpg",
+                            )
                         )
+                    elif info:
                         await log_channel.send(file=discord.File(file_path))
                 else:
-                    print(
-                        f"Log channel not found: {self.bot.config[self.guild_id]['log_channel_id']}"
+                    logger.warning(
+                        "Log channel not found: %s",
+                        self.bot.config[self.guild_id]["log_channel_id"],
+                        extra={"guild": self.guild_id, "prompt_id": prompt_id},
                     )
                 view.remove_item(view.channel_select)
                 msg = await interaction.original_response()
@@ -167,13 +225,20 @@ class PromptModal(discord.ui.Modal):
                     msg.id, content=f"Prompt saved with ID {prompt_id}", view=view
                 )
             else:
-                print("Not finished")
+                logger.info(
+                    "Channel selection timed out",
+                    extra={"guild": self.guild_id, "prompt_id": prompt_id},
+                )
                 view.remove_item(view.channel_select)
                 msg = await interaction.original_response()
                 await interaction.followup.edit_message(
                     msg.id, content="Timed out.", view=view
                 )
-                del self.bot.prompt_info[prompt_id]
+                # The prompt was never saved, so its upload is orphaned
+                for file_name in attachments:
+                    try:
+                        os.unlink(os.path.join(prompt_image_dir, self.guild_id, file_name))
+                    except FileNotFoundError:
+                        pass
 
         await process_prompt(self, interaction)
-        self.bot.save()
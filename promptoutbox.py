@@ -0,0 +1,182 @@
+import asyncio
+import datetime
+import json
+import os
+import secrets
+from promptstore import write_atomic
+
+# Outboxes currently being delivered, by guild ID
+_active = {}
+
+
+class Outbox:
+    """
+    Durable record of a guild's send-all, one operation per chunk, pin and
+    file, checkpointed to disk as each operation completes.
+
+    Every send carries a nonce stored with its operation. discord.py sends
+    nonces with enforce_nonce, so replaying an operation that reached
+    Discord but was never checkpointed returns the original message instead
+    of posting it twice. Webhook sends cannot carry one, so they are marked
+    attempted before sending instead (see promptsender._send_once).
+    """
+
+    def __init__(self, path, guild_id, data):
+        self.path = path
+        self.guild_id = guild_id
+        self.data = data
+        # Attachment bytes read ahead of time, by path; never persisted
+        self.preloaded = {}
+        # perf_counter() of each prompt's first chunk, for skew reporting
+        self.first_sent_at = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def prompts(self) -> dict:
+        return self.data["prompts"]
+
+    @classmethod
+    def load(cls, outbox_dir, guild_id) -> "Outbox | None":
+        if guild_id in _active:
+            return _active[guild_id]
+        path = os.path.join(outbox_dir, f"{guild_id}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return cls(path, guild_id, json.load(f))
+
+    @classmethod
+    def load_or_create(cls, outbox_dir, guild_id) -> "Outbox":
+        outbox = cls.load(outbox_dir, guild_id)
+        if outbox:
+            return outbox
+        os.makedirs(outbox_dir, exist_ok=True)
+        return cls(
+            os.path.join(outbox_dir, f"{guild_id}.json"),
+            guild_id,
+            {"created": datetime.datetime.now().isoformat(), "prompts": {}},
+        )
+
+    @staticmethod
+    def guild_ids(outbox_dir) -> list[str]:
+        if not os.path.isdir(outbox_dir):
+            return []
+        return [
+            name.removesuffix(".json")
+            for name in os.listdir(outbox_dir)
+            if name.endswith(".json")
+        ]
+
+    def add_prompt(self, prepared) -> bool:
+        """
+        Queues a prepared prompt. A prompt already in the outbox keeps its
+        progress, so re-running a send-all continues where it stopped.
+
+        A prompt edited or moved since it was queued is queued afresh if
+        none of it was sent yet. If part of it was, it is marked "changed"
+        and not sent, as neither the old nor the new version can be
+        finished without posting a mix of both.
+
+        Returns:
+            False if the prompt was marked changed, True otherwise
+        """
+        entry = self.prompts.get(prepared.prompt_id)
+        if entry:
+            if not _is_stale(entry, prepared.updated, prepared.channel.id):
+                if entry["state"] == "failed":
+                    entry["state"] = "pending"
+                return True
+            if _has_progress(entry):
+                entry["state"] = "changed"
+                return False
+        operations = []
+        for index, chunk in enumerate(prepared.chunks):
+            operations.append(
+                {"kind": "chunk", "text": chunk, "nonce": secrets.randbits(63)}
+            )
+            if index == 0:
+                operations.append({"kind": "pin"})
+        for (file_name, source), file_path in zip(
+            prepared.files, prepared.file_paths
+        ):
+            operations.append(
+                {
+                    "kind": "file",
+                    "name": file_name,
+                    "path": file_path,
+                    "nonce": secrets.randbits(63),
+                }
+            )
+            if isinstance(source, bytes):
+                self.preloaded[file_path] = source
+        self.prompts[prepared.prompt_id] = {
+            "channel": prepared.channel.id,
+            "updated": prepared.updated,
+            "state": "pending",
+            "operations": operations,
+        }
+        return True
+
+    def with_state(self, state) -> list[str]:
+        return [
+            prompt_id
+            for prompt_id, entry in self.prompts.items()
+            if entry["state"] == state
+        ]
+
+    def pending(self) -> list[str]:
+        return self.with_state("pending")
+
+    def prune(self, prompt_info):
+        """
+        Drops prompts that are no longer saved, i.e. sent prompts whose
+        removal has been persisted and prompts cleared since, and prompts
+        edited or moved since they were queued. Those that were partly
+        sent are kept, marked "changed", so they are neither finished nor
+        settled as sent.
+        """
+        for prompt_id, entry in list(self.prompts.items()):
+            record = prompt_info.get(prompt_id)
+            if record is None:
+                del self.prompts[prompt_id]
+            elif entry["state"] != "sent" and _is_stale(
+                entry, record.updated, record.channel
+            ):
+                if _has_progress(entry):
+                    entry["state"] = "changed"
+                else:
+                    del self.prompts[prompt_id]
+
+    @staticmethod
+    def is_active(guild_id) -> bool:
+        return guild_id in _active
+
+    def acquire(self):
+        _active[self.guild_id] = self
+
+    def release(self):
+        if _active.get(self.guild_id) is self:
+            del _active[self.guild_id]
+
+    async def checkpoint(self):
+        # Serialise on the loop so the snapshot is consistent, write off it
+        async with self._lock:
+            data = json.dumps(self.data)
+            await asyncio.to_thread(write_atomic, self.path, data)
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _is_stale(entry, updated, channel_id) -> bool:
+    # Entries written before updated was stored are taken as current
+    return channel_id != entry["channel"] or (
+        "updated" in entry and updated != entry["updated"]
+    )
+
+
+def _has_progress(entry) -> bool:
+    return any(operation.get("done") for operation in entry["operations"])
@@ -0,0 +1,57 @@
+import discord
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PromptPageView(discord.ui.View):
+    """
+    Pages through a prompt's chunks in one embed. Each page is the message
+    that chunk will be sent as, and is only rendered when it is shown.
+    """
+
+    def __init__(self, prompt_id, chunks, footer=None):
+        super().__init__(timeout=600)
+        self.prompt_id = prompt_id
+        self.chunks = chunks
+        self.footer = footer
+        self.page = 0
+
+        self.previous_button = discord.ui.Button(
+            label="Previous", style=discord.ButtonStyle.grey
+        )
+        self.previous_button.callback = self.previous_callback
+        self.add_item(self.previous_button)
+
+        self.next_button = discord.ui.Button(
+            label="Next", style=discord.ButtonStyle.grey
+        )
+        self.next_button.callback = self.next_callback
+        self.add_item(self.next_button)
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= len(self.chunks) - 1
+
+    def embed(self) -> discord.Embed:
+        embed = discord.Embed(
+            title=f"{self.prompt_id} ({self.page + 1}/{len(self.chunks)})",
+            description=self.chunks[self.page],
+            color=discord.Color.blue(),
+        )
+        if self.footer:
+            embed.set_footer(text=self.footer)
+        return embed
+
+    async def show(self, interaction: discord.Interaction, page):
+        self.page = page
+        self.update_buttons()
+        # Attachments sent with the first page stay on the message
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    async def previous_callback(self, interaction: discord.Interaction):
+        await self.show(interaction, max(0, self.page - 1))
+
+    async def next_callback(self, interaction: discord.Interaction):
+        await self.show(interaction, min(len(self.chunks) - 1, self.page + 1))
@@ -0,0 +1,118 @@
+import os
+import time
+
+# Version of the per-guild prompts file. Version 1 is the plain
+# {prompt_id: {"message", "channel", "image"}} mapping written before
+# records existed.
+SCHEMA_VERSION = 2
+
+
+class PromptRecord:
+    """
+    A saved prompt.
+
+    Attachments are file names inside the guild's prompt image directory.
+    Timestamps are unix seconds.
+    """
+
+    __slots__ = ("prompt_id", "channel", "message", "attachments", "created", "updated")
+
+    def __init__(
+        self,
+        prompt_id: str,
+        channel: int | None,
+        message: str = "",
+        attachments: tuple[str, ...] = (),
+        created: float | None = None,
+        updated: float | None = None,
+    ):
+        now = time.time()
+        self.prompt_id = prompt_id
+        self.channel = channel
+        self.message = message
+        self.attachments = attachments
+        self.created = created or now
+        self.updated = updated or self.created
+
+    def copy(self) -> "PromptRecord":
+        # Saved records are replaced rather than changed in place, so
+        # snapshots taken before a change keep the old version
+        return PromptRecord(
+            self.prompt_id,
+            self.channel,
+            self.message,
+            self.attachments,
+            self.created,
+            self.updated,
+        )
+
+    def touch(self):
+        self.updated = time.time()
+
+    def add_attachment(self, file_name: str):
+        self.attachments = (*self.attachments, file_name)
+        self.touch()
+
+    def to_dict(self) -> dict:
+        return {
+            "channel": self.channel,
+            "message": self.message,
+            "attachments": list(self.attachments),
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, prompt_id: str, data: dict) -> "PromptRecord":
+        return cls(
+            prompt_id,
+            data["channel"],
+            data["message"],
+            tuple(data["attachments"]),
+            data["created"],
+            data["updated"],
+        )
+
+    @classmethod
+    def from_legacy(cls, prompt_id: str, data: dict) -> "PromptRecord":
+        """
+        Converts a version 1 entry. "channel" may be an int, a str or
+        missing, and "image" a full path, a file name or a list of either.
+        """
+        channel = data.get("channel")
+        image = data.get("image") or ()
+        if isinstance(image, str):
+            image = (image,)
+        return cls(
+            prompt_id,
+            int(channel) if channel else None,
+            data.get("message") or "",
+            tuple(os.path.basename(path) for path in image),
+        )
+
+
+def decode_prompts(data: dict) -> dict[str, PromptRecord]:
+    """
+    Reads a guild's prompts file, migrating older schema versions.
+
+    Returns:
+        Mapping of prompt ID to PromptRecord
+    """
+    if not isinstance(data.get("version"), int):
+        return {
+            prompt_id: PromptRecord.from_legacy(prompt_id, entry)
+            for prompt_id, entry in data.items()
+        }
+    return {
+        prompt_id: PromptRecord.from_dict(prompt_id, entry)
+        for prompt_id, entry in data["prompts"].items()
+    }
+
+
+def encode_prompts(prompts: dict[str, PromptRecord]) -> dict:
+    return {
+        "version": SCHEMA_VERSION,
+        "prompts": {
+            prompt_id: record.to_dict() for prompt_id, record in prompts.items()
+        },
+    }
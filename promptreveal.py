@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+async def hide_channels(outbox, role, channels) -> list[str]:
+    """
+    Hides channels from a role for a reveal-mode send-all. The role's
+    current overwrites are checkpointed in the outbox before anything
+    changes, so a send interrupted by a restart still reveals them when it
+    resumes.
+
+    Args:
+        outbox: The send-all's Outbox
+        role: The role to hide the channels from, usually tributes
+        channels: The channels prompts are about to be sent to
+
+    Returns:
+        Problems, one per channel that could not be hidden
+    """
+    outbox.data["reveal"] = {
+        "role": role.id,
+        "channels": {
+            str(channel.id): [
+                permissions.value for permissions in channel.overwrites_for(role).pair()
+            ]
+            for channel in channels
+        },
+    }
+    await outbox.checkpoint()
+
+    async def hide(channel):
+        overwrite = channel.overwrites_for(role)
+        overwrite.view_channel = False
+        await channel.set_permissions(
+            role, overwrite=overwrite, reason="Hidden until every prompt is posted"
+        )
+
+    channels = list(channels)
+    results = await asyncio.gather(
+        *(hide(channel) for channel in channels), return_exceptions=True
+    )
+    problems = []
+    for channel, result in zip(channels, results):
+        if isinstance(result, Exception):
+            # Left as it was, so there is nothing to reveal
+            del outbox.data["reveal"]["channels"][str(channel.id)]
+            problems.append(f"{channel.mention} could not be hidden: {result}")
+    await outbox.checkpoint()
+    return problems
+
+
+async def reveal_channels(outbox, guild) -> tuple[float, list[str]]:
+    """
+    Restores the overwrites hide_channels replaced, one call per channel,
+    all at once, so every district sees its prompt within about one round
+    trip of the others. Channels that could not be revealed stay in the
+    outbox, so the next resume or send tries them again.
+
+    Returns:
+        (seconds the reveal took, problems)
+    """
+    reveal = outbox.data.get("reveal")
+    if not reveal:
+        return 0.0, []
+    role = guild.get_role(reveal["role"])
+
+    async def restore(channel, allow, deny):
+        overwrite = discord.PermissionOverwrite.from_pair(
+            discord.Permissions(allow), discord.Permissions(deny)
+        )
+        try:
+            await channel.set_permissions(
+                role,
+                overwrite=None if overwrite.is_empty() else overwrite,
+                reason="Prompts posted",
+            )
+        except discord.NotFound:
+            # There was no overwrite to remove
+            pass
+
+    pending = [
+        (guild.get_channel(int(channel_id)), allow, deny)
+        for channel_id, (allow, deny) in reveal["channels"].items()
+    ]
+    pending = [(channel, allow, deny) for channel, allow, deny in pending if channel]
+    problems = []
+    revealed = 0
+    started = time.perf_counter()
+    if role:
+        results = await asyncio.gather(
+            *(restore(*item) for item in pending), return_exceptions=True
+        )
+        for (channel, _, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                problems.append(f"{channel.mention} could not be revealed: {result}")
+            else:
+                del reveal["channels"][str(channel.id)]
+                revealed += 1
+    else:
+        problems.append("The tribute role no longer exists")
+    duration = time.perf_counter() - started
+
+    logger.info(
+        "Revealed %d channels in %.0fms",
+        revealed,
+        duration * 1000,
+        extra={"guild": outbox.guild_id, "duration": duration},
+    )
+    # Deleted channels and a deleted role have nothing left to reveal
+    if not role or not any(
+        guild.get_channel(int(channel_id)) for channel_id in reveal["channels"]
+    ):
+        del outbox.data["reveal"]
+    await outbox.checkpoint()
+    return duration, problems
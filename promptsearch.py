@@ -0,0 +1,190 @@
+import bisect
+import math
+import re
+
+TOKEN = re.compile(r"\w+")
+# A quoted phrase or a single word, optionally ending in * for a prefix
+QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+# Characters of context either side of a match in a snippet
+SNIPPET_CONTEXT = 80
+
+
+def tokenize(text: str) -> list[str]:
+    return [match.group().lower() for match in TOKEN.finditer(text)]
+
+
+class SearchResult:
+    def __init__(self, prompt_id, score, position, length):
+        self.prompt_id = prompt_id
+        self.score = score
+        # Token position and length of the first match, for the snippet
+        self.position = position
+        self.length = length
+
+
+class _GuildIndex:
+    """Inverted index of one guild's prompts: token -> prompt ID -> positions."""
+
+    def __init__(self):
+        self.postings = {}
+        # prompt ID -> (record.updated when indexed, set of its tokens)
+        self.documents = {}
+        self._vocabulary = None
+
+    def add(self, prompt_id, updated, message):
+        self.remove(prompt_id)
+        tokens = tokenize(message)
+        for position, token in enumerate(tokens):
+            self.postings.setdefault(token, {}).setdefault(prompt_id, []).append(
+                position
+            )
+        self.documents[prompt_id] = (updated, set(tokens))
+        self._vocabulary = None
+
+    def remove(self, prompt_id):
+        document = self.documents.pop(prompt_id, None)
+        if not document:
+            return
+        for token in document[1]:
+            documents = self.postings[token]
+            del documents[prompt_id]
+            if not documents:
+                del self.postings[token]
+        self._vocabulary = None
+
+    def vocabulary(self) -> list[str]:
+        # Sorted lazily so prefix queries can bisect instead of scanning
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    def word(self, token) -> dict[str, list[int]]:
+        return self.postings.get(token, {})
+
+    def prefix(self, prefix) -> dict[str, list[int]]:
+        vocabulary = self.vocabulary()
+        matches = {}
+        for index in range(bisect.bisect_left(vocabulary, prefix), len(vocabulary)):
+            token = vocabulary[index]
+            if not token.startswith(prefix):
+                break
+            for prompt_id, positions in self.postings[token].items():
+                matches.setdefault(prompt_id, []).extend(positions)
+        for positions in matches.values():
+            positions.sort()
+        return matches
+
+    def phrase(self, tokens) -> dict[str, list[int]]:
+        postings = [self.word(token) for token in tokens]
+        matches = {}
+        for prompt_id, starts in postings[0].items():
+            following = []
+            for documents in postings[1:]:
+                if prompt_id not in documents:
+                    break
+                following.append(set(documents[prompt_id]))
+            else:
+                found = [
+                    start
+                    for start in starts
+                    if all(
+                        start + offset in positions
+                        for offset, positions in enumerate(following, 1)
+                    )
+                ]
+                if found:
+                    matches[prompt_id] = found
+        return matches
+
+
+class PromptSearch:
+    """
+    Full-text search over each guild's saved prompts.
+
+    The modals update the index as prompts are written. Before each search
+    the index is reconciled against the records' updated timestamps, so
+    prompts changed or removed any other way are picked up too.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def update(self, guild_id, record):
+        self._guilds.setdefault(guild_id, _GuildIndex()).add(
+            record.prompt_id, record.updated, record.message
+        )
+
+    def _reconcile(self, guild_id, prompts) -> _GuildIndex:
+        index = self._guilds.setdefault(guild_id, _GuildIndex())
+        for prompt_id in list(index.documents):
+            if prompt_id not in prompts:
+                index.remove(prompt_id)
+        for prompt_id, record in prompts.items():
+            document = index.documents.get(prompt_id)
+            if not document or document[0] != record.updated:
+                index.add(prompt_id, record.updated, record.message)
+        return index
+
+    def search(self, guild_id, prompts, query: str) -> list[SearchResult]:
+        """
+        Finds prompts containing every term of a query. Terms are words,
+        "quoted phrases" or prefixes ending in *.
+
+        Args:
+            guild_id: The guild ID as a string
+            prompts: The guild's prompts, by prompt ID
+            query: The search query
+
+        Returns:
+            Matching prompts, best first
+        """
+        index = self._reconcile(guild_id, prompts)
+        terms = []
+        for phrase, word in QUERY_TERM.findall(query):
+            if word.endswith("*") and TOKEN.fullmatch(word[:-1]):
+                terms.append((index.prefix(word[:-1].lower()), 1))
+                continue
+            tokens = tokenize(phrase or word)
+            if not tokens:
+                continue
+            if len(tokens) == 1:
+                terms.append((index.word(tokens[0]), 1))
+            else:
+                terms.append((index.phrase(tokens), len(tokens)))
+        if not terms:
+            return []
+
+        candidates = set(terms[0][0])
+        for matches, _ in terms[1:]:
+            candidates &= matches.keys()
+
+        # tf-idf: frequent matches score higher, terms found in fewer
+        # prompts weigh more
+        total = len(index.documents)
+        results = []
+        for prompt_id in candidates:
+            score = sum(
+                len(matches[prompt_id]) * math.log(1 + total / len(matches))
+                for matches, _ in terms
+            )
+            matches, length = terms[0]
+            results.append(
+                SearchResult(prompt_id, score, matches[prompt_id][0], length)
+            )
+        results.sort(key=lambda result: (-result.score, result.prompt_id))
+        return results
+
+
+def snippet(message: str, position: int, length: int) -> str:
+    """Returns the text around a match, with the match in bold."""
+    spans = [match.span() for match in TOKEN.finditer(message)]
+    start = spans[position][0]
+    end = spans[position + length - 1][1]
+    before = message[max(0, start - SNIPPET_CONTEXT) : start]
+    after = message[end : end + SNIPPET_CONTEXT]
+    text = f"{before}**{message[start:end]}**{after}".replace("\n", " ")
+    if start > SNIPPET_CONTEXT:
+        text = "..." + text
+    if end + SNIPPET_CONTEXT < len(message):
+        text += "..."
+    return text
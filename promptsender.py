@@ -1,133 +1,640 @@
 import discord
 import asyncio
+import datetime
+import io
 import os
+import logging
+import time
+from promptoutbox import Outbox
+from deliveryqueue import DeliveryError
+from promptreveal import hide_channels, reveal_channels
 from utils import split_message
 
+logger = logging.getLogger(__name__)
 
-async def send_single_prompt(bot, interaction, prompt_id, guild_id, prompt_image_dir):
+# Recent messages searched for a webhook send that may have gone through
+RETRY_HISTORY = 50
+
+
+class PreparedPrompt:
     """
-    Sends a single prompt to its designated channel.
+    Everything needed to deliver one prompt, resolved ahead of time so that
+    only the HTTP calls are left when it is actually sent.
+    """
+
+    def __init__(
+        self, prompt_id, channel, chunks, files, file_paths, missing, updated=None
+    ):
+        self.prompt_id = prompt_id
+        self.channel = channel
+        # The record's updated time, so an outbox notices later edits
+        self.updated = updated
+        self.chunks = chunks
+        # (filename, bytes) when preloaded, (filename, path) otherwise
+        self.files = files
+        self.file_paths = file_paths
+        self.missing = missing
+        self.missing_permissions = []
+
+
+# Permissions needed to send, pin and clean up after a prompt
+REQUIRED_PERMISSIONS = (
+    "view_channel",
+    "send_messages",
+    "attach_files",
+    "manage_messages",
+    "read_message_history",
+    "view_audit_log",
+)
+
+
+def _read_file(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+async def prepare_prompt(
+    bot, guild, record, guild_id, prompt_image_dir, preload=False
+) -> PreparedPrompt | None:
+    """
+    Resolves the channel, chunks and attachments for a prompt.
 
     Args:
         bot: The bot instance
-        interaction: The discord interaction
-        prompt_id: The ID of the prompt to send
+        guild: The guild the prompt belongs to
+        record: The PromptRecord to prepare, usually from a snapshot
         guild_id: The guild ID as a string
         prompt_image_dir: Directory where prompt images are stored
+        preload: Read attachments into memory instead of opening them at send
 
     Returns:
-        prompt_id if successful, None otherwise
+        A PreparedPrompt, or None if the prompt's channel does not exist
     """
-    if not interaction.guild.get_channel(int(bot.prompt_info[prompt_id]["channel"])):
+    prompt_id = record.prompt_id
+    channel = guild.get_channel(record.channel) if record.channel else None
+    if not channel:
         return None
 
-    channel_id = bot.prompt_info[prompt_id]["channel"]
-    channel = interaction.guild.get_channel(int(channel_id))
+    files = []
+    file_paths = []
+    missing = []
+    for file_name in record.attachments:
+        file_path = os.path.join(prompt_image_dir, guild_id, file_name)
+        try:
+            if preload:
+                data = await asyncio.to_thread(_read_file, file_path)
+                files.append((os.path.basename(file_path), data))
+            elif os.path.exists(file_path):
+                files.append((os.path.basename(file_path), file_path))
+            else:
+                raise FileNotFoundError(file_path)
+            file_paths.append(file_path)
+        except FileNotFoundError:
+            missing.append(file_name)
+
+    prepared = PreparedPrompt(
+        prompt_id,
+        channel,
+        split_message(record.message),
+        files,
+        file_paths,
+        missing,
+        record.updated,
+    )
+    permissions = channel.permissions_for(guild.me)
+    prepared.missing_permissions = [
+        name
+        for name in REQUIRED_PERMISSIONS
+        if not getattr(permissions, name) and (name != "attach_files" or files)
+    ]
+    return prepared
+
+
+async def send_prompt_message(bot, channel, nonce=None, content=None, open_file=None):
+    """
+    Sends one prompt chunk or file. Guilds set to deliver by webhook send
+    through the channel's webhook, falling back to the bot's own message
+    when the channel has none.
+
+    Args:
+        bot: The bot instance
+        channel: The prompt's channel
+        nonce: Nonce for the bot's message. Webhooks do not take one.
+        content: Text to send
+        open_file: Returns a new discord.File to upload. A File is closed
+            once sent, so the fallback needs a fresh one.
+
+    Returns:
+        The sent message
+    """
+    if bot.config.get(str(channel.guild.id), {}).get("delivery") == "webhook":
+        webhook = await bot.webhooks.get(channel)
+        if webhook:
+            try:
+                return await webhook.send(
+                    content or discord.utils.MISSING,
+                    file=open_file() if open_file else discord.utils.MISSING,
+                    wait=True,
+                )
+            except discord.NotFound:
+                # Deleted since it was cached
+                bot.webhooks.invalidate(channel.id)
+    return await channel.send(
+        content, file=open_file() if open_file else None, nonce=nonce
+    )
+
+
+async def _send_once(bot, outbox, channel, operation, content=None, open_file=None):
+    """
+    Sends an operation's chunk or file so that replaying it never posts it
+    twice. Webhook sends take no nonce, so under webhook delivery the
+    operation is checkpointed as attempted before it is sent. A replayed
+    attempt is looked for in the channel's recent webhook messages and,
+    if it never arrived, sent as the bot's own message with its nonce.
+    """
+    if bot.config.get(str(channel.guild.id), {}).get("delivery") != "webhook":
+        return await send_prompt_message(
+            bot, channel, operation["nonce"], content=content, open_file=open_file
+        )
+    if operation.get("attempted"):
+        message = await _find_webhook_send(channel, operation)
+        if message:
+            return message
+        return await channel.send(
+            content, file=open_file() if open_file else None, nonce=operation["nonce"]
+        )
+    operation["attempted"] = True
+    await outbox.checkpoint()
+    return await send_prompt_message(
+        bot, channel, operation["nonce"], content=content, open_file=open_file
+    )
+
+
+async def _find_webhook_send(channel, operation):
+    if operation["kind"] == "file":
+        # Discord replaces spaces in uploaded file names
+        names = {operation["name"], operation["name"].replace(" ", "_")}
+    try:
+        async for message in channel.history(limit=RETRY_HISTORY):
+            if message.webhook_id is None:
+                continue
+            if operation["kind"] == "chunk":
+                if message.content.strip() == operation["text"].strip():
+                    return message
+            elif any(attachment.filename in names for attachment in message.attachments):
+                return message
+    except discord.Forbidden:
+        pass
+    return None
+
+
+async def pin_and_clean(bot, channel, message):
+    """Pins a message and deletes the bot's own "pinned a message" notice."""
+    # Pinned through the channel so webhook messages are pinned by the bot
+    await channel.get_partial_message(message.id).pin()
+    async for message in channel.history(limit=3):
+        if message.type == discord.MessageType.pins_add:
+            # Get the audit log to see who pinned
+            async for entry in message.guild.audit_logs(
+                limit=1,
+                action=discord.AuditLogAction.message_pin,
+            ):
+                if entry.user.id == bot.user.id:
+                    await message.delete()
+                    break
+            break
+
+
+async def deliver_prompt(bot, outbox, prompt_id, channel):
+    """
+    Runs the outstanding operations of one prompt in an outbox, in order,
+    checkpointing after each one.
+
+    Attachments are deleted from disk once their upload is checkpointed.
+    Raises discord.Forbidden and discord.HTTPException to the caller, leaving
+    the failed operation pending. Commands go through deliver(); sender
+    workers call this directly.
+
+    Returns:
+        List of attachment names that were missing from disk
+    """
+    entry = outbox.prompts[prompt_id]
+    missing = []
+    first_message_id = None
+    for operation in entry["operations"]:
+        if operation["kind"] == "chunk" and first_message_id is None:
+            first_message_id = operation.get("message_id")
+        if operation.get("done"):
+            continue
+
+        if operation["kind"] == "chunk":
+            message = await _send_once(
+                bot, outbox, channel, operation, content=operation["text"]
+            )
+            operation["message_id"] = message.id
+            operation["webhook_id"] = message.webhook_id
+            if first_message_id is None:
+                first_message_id = message.id
+                outbox.first_sent_at[prompt_id] = time.perf_counter()
+        elif operation["kind"] == "pin":
+            message = channel.get_partial_message(first_message_id)
+            await pin_and_clean(bot, channel, message)
+        elif operation["kind"] == "file":
+            data = outbox.preloaded.get(operation["path"])
+            if data is not None:
+                open_file = lambda: discord.File(
+                    io.BytesIO(data), filename=operation["name"]
+                )
+            elif os.path.exists(operation["path"]):
+                open_file = lambda: discord.File(operation["path"])
+            else:
+                operation["missing"] = True
+                missing.append(operation["name"])
+            if not operation.get("missing"):
+                message = await _send_once(
+                    bot, outbox, channel, operation, open_file=open_file
+                )
+                operation["message_id"] = message.id
+                operation["webhook_id"] = message.webhook_id
+
+        operation["done"] = True
+        await outbox.checkpoint()
+        if operation["kind"] == "file":
+            try:
+                os.unlink(operation["path"])
+            except FileNotFoundError:
+                pass
+
+    entry["state"] = "sent"
+    await outbox.checkpoint()
+    return missing
+
+
+async def deliver(bot, outbox, prompt_id, channel):
+    """
+    Delivers one prompt of an outbox and remembers the messages it was sent
+    as. When sender workers are running, a worker process does the sending
+    through bot.delivery and this only waits for its result, so uploads
+    and rate limit waits stay off the gateway's event loop.
+
+    Raises discord.HTTPException when sending here and DeliveryError when a
+    worker failed, leaving the failed operation pending either way.
+
+    Returns:
+        List of attachment names that were missing from disk
+    """
+    if bot.delivery:
+        missing = await _deliver_queued(bot, outbox, prompt_id, channel)
+    else:
+        missing = await deliver_prompt(bot, outbox, prompt_id, channel)
+    entry = outbox.prompts[prompt_id]
+    # Kept so /edit-sent-prompt can correct the prompt in place
+    bot.sent.record(
+        outbox.guild_id,
+        prompt_id,
+        channel.id,
+        [
+            {
+                "id": operation["message_id"],
+                "text": operation["text"],
+                "webhook_id": operation.get("webhook_id"),
+            }
+            for operation in entry["operations"]
+            if operation["kind"] == "chunk"
+        ],
+        [
+            {
+                "id": operation["message_id"],
+                "name": operation["name"],
+                "webhook_id": operation.get("webhook_id"),
+            }
+            for operation in entry["operations"]
+            if operation["kind"] == "file" and "message_id" in operation
+        ],
+        batch=outbox.data["created"],
+    )
+    return missing
+
+
+async def _deliver_queued(bot, outbox, prompt_id, channel):
+    entry = outbox.prompts[prompt_id]
+    job_id = await asyncio.to_thread(
+        bot.delivery.submit,
+        outbox.guild_id,
+        outbox.data["created"],
+        prompt_id,
+        {
+            "channel": channel.id,
+            "delivery": bot.config.get(outbox.guild_id, {}).get("delivery"),
+            "operations": entry["operations"],
+        },
+    )
+    job = await bot.delivery.wait(job_id)
+    entry["operations"] = job.payload["operations"]
+    if job.state == "withdrawn":
+        logger.warning(
+            "No sender worker took the prompt; sending it from the bot",
+            extra={"guild": outbox.guild_id, "prompt_id": prompt_id},
+        )
+        await outbox.checkpoint()
+        return await deliver_prompt(bot, outbox, prompt_id, channel)
+    if job.first_sent:
+        # The worker reports wall clock time; skew is measured in perf_counter
+        outbox.first_sent_at[prompt_id] = time.perf_counter() - (
+            time.time() - job.first_sent
+        )
+    if job.state == "done":
+        entry["state"] = "sent"
+    await outbox.checkpoint()
+    # Only once the outbox has the result, so a restart in between waits on
+    # the finished job again rather than sending it twice
+    await asyncio.to_thread(bot.delivery.remove, job_id)
+    if job.error:
+        raise DeliveryError(job.error, job.permanent)
+    return [
+        operation["name"]
+        for operation in entry["operations"]
+        if operation.get("missing")
+    ]
+
+
+async def send_single_prompt(bot, interaction, outbox, prompt_id, guild_id):
+    """
+    Sends a single prompt from an outbox to its designated channel.
+
+    Args:
+        bot: The bot instance
+        interaction: The discord interaction
+        outbox: The guild's Outbox holding the prompt's operations
+        prompt_id: The ID of the prompt to send
+        guild_id: The guild ID as a string
+
+    Returns:
+        prompt_id if successful, None otherwise
+    """
+    entry = outbox.prompts[prompt_id]
+    channel = interaction.guild.get_channel(entry["channel"])
     if not channel:
-        await interaction.followup.send(
-            f"Channel {channel} does not exist", ephemeral=True
+        logger.warning(
+            "Channel %s does not exist",
+            entry["channel"],
+            extra={"guild": guild_id, "prompt_id": prompt_id},
         )
-        print(f"Channel {channel} does not exist")
+        entry["state"] = "failed"
         return None
 
     try:
-        message = bot.prompt_info[prompt_id]["message"]
-        messages = split_message(message)
-        first_message = True
-
-        for msg in messages:
-            pin_message = await channel.send(msg)
-            if first_message:
-                await pin_message.pin()
-                first_message = False
-                async for message in channel.history(limit=3):
-                    if message.type == discord.MessageType.pins_add:
-                        # Get the audit log to see who pinned
-                        async for entry in message.guild.audit_logs(
-                            limit=1,
-                            action=discord.AuditLogAction.message_pin,
-                        ):
-                            if entry.user.id == bot.user.id:
-                                await message.delete()
-                                break
-                        break
-
-        # Handle image attachments
-        if "image" in bot.prompt_info[prompt_id].keys():
-            if isinstance(bot.prompt_info[prompt_id]["image"], list):
-                for image in bot.prompt_info[prompt_id]["image"]:
-                    file_name = image
-                    file_path = os.path.join(prompt_image_dir, guild_id, file_name)
-                    if os.path.exists(file_path):
-                        await channel.send(file=discord.File(file_path))
-                        try:
-                            os.unlink(file_path)
-                        except FileNotFoundError:
-                            pass
-                    else:
-                        await interaction.followup.send(
-                            "File is missing, please reattach the file.",
-                            ephemeral=True,
-                        )
-            else:
-                file_name = bot.prompt_info[prompt_id]["image"]
-                file_path = os.path.join(prompt_image_dir, guild_id, file_name)
-                if os.path.exists(file_path):
-                    await channel.send(file=discord.File(file_path))
-                    try:
-                        os.unlink(file_path)
-                    except FileNotFoundError:
-                        pass
-                else:
-                    await interaction.followup.send(
-                        "File is missing, please reattach the file.",
-                        ephemeral=True,
-                    )
+        missing = await deliver(bot, outbox, prompt_id, channel)
+        for file_name in missing:
+            await interaction.followup.send(
+                "File is missing, please reattach the file.",
+                ephemeral=True,
+            )
 
         return prompt_id  # Return the prompt_id if successful
 
     except discord.Forbidden:
+        # Retrying will not help, so the prompt is not resumed later
+        entry["state"] = "failed"
         await interaction.followup.send(
             f"The bot doesn't have permission to send files in {channel.name}",
             ephemeral=True,
         )
-        print(f"Forbidden to send messages to {channel.name}")
+        logger.warning(
+            "Forbidden to send messages to %s",
+            channel.name,
+            extra={"guild": guild_id, "prompt_id": prompt_id},
+        )
         return None
     except discord.HTTPException as e:
-        print(f"HTTP exception while sending message to {channel.name}: {e}")
+        logger.error(
+            "HTTP exception while sending message to %s: %s",
+            channel.name,
+            e,
+            extra={"guild": guild_id, "prompt_id": prompt_id},
+        )
+        return None
+    except DeliveryError as e:
+        logger.error(
+            "Sender worker failed to send to %s: %s",
+            channel.name,
+            e,
+            extra={"guild": guild_id, "prompt_id": prompt_id},
+        )
+        if e.permanent:
+            entry["state"] = "failed"
+            await interaction.followup.send(
+                f"The bot doesn't have permission to send files in {channel.name}",
+                ephemeral=True,
+            )
         return None
 
 
-async def send_all_prompts_concurrent(bot, interaction, guild_id, prompt_image_dir):
+async def send_all_prompts_concurrent(
+    bot, interaction, guild_id, prompt_image_dir, outbox_dir, reveal_role=None
+):
     """
     Sends all prompts concurrently using asyncio.gather().
 
+    The send is recorded in the guild's outbox first, so a send-all that is
+    interrupted resumes from the last completed operation, either when this
+    is run again or when the bot restarts.
+
     Args:
         bot: The bot instance
         interaction: The discord interaction
         guild_id: The guild ID as a string
         prompt_image_dir: Directory where prompt images are stored
+        outbox_dir: Directory where outboxes are stored
+        reveal_role: Hide the channels from this role until every prompt
+            is posted, then reveal them all at once
 
     Returns:
         List of successfully sent prompt IDs
     """
-    # Create tasks for all prompts
-    tasks = []
-    for prompt_id in bot.prompt_info.keys():
-        if interaction.guild.get_channel(int(bot.prompt_info[prompt_id]["channel"])):
-            tasks.append(
-                send_single_prompt(
-                    bot, interaction, prompt_id, guild_id, prompt_image_dir
-                )
+    started = time.perf_counter()
+    outbox = Outbox.load_or_create(outbox_dir, guild_id)
+    outbox.acquire()
+    try:
+        # The snapshot stays the same while prompts are prepared across awaits
+        prompts = bot.state.snapshot(guild_id)
+        outbox.prune(prompts)
+        for record in prompts.values():
+            prepared = await prepare_prompt(
+                bot, interaction.guild, record, guild_id, prompt_image_dir
+            )
+            if prepared:
+                outbox.add_prompt(prepared)
+        await outbox.checkpoint()
+        changed = outbox.with_state("changed")
+        if changed:
+            await interaction.followup.send(
+                (
+                    "Not sent, as these were edited after part of them was sent: "
+                    f"{', '.join(changed)}. Send the new version with /send-prompt."
+                )[:2000],
+                ephemeral=True,
             )
 
-    # Execute all tasks concurrently
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Channels hidden by an interrupted reveal are still hidden and
+        # their original overwrites are already in the outbox
+        problems = []
+        if reveal_role and "reveal" not in outbox.data:
+            channels = {
+                interaction.guild.get_channel(outbox.prompts[prompt_id]["channel"])
+                for prompt_id in outbox.pending()
+            }
+            problems = await hide_channels(outbox, reveal_role, channels - {None})
 
-    # Collect successfully sent prompts
-    prompts_to_del = []
-    for result in results:
-        if result and not isinstance(result, Exception):
-            prompts_to_del.append(result)
+        try:
+            # Create tasks for all prompts
+            tasks = [
+                send_single_prompt(bot, interaction, outbox, prompt_id, guild_id)
+                for prompt_id in outbox.pending()
+            ]
+
+            # Execute all tasks concurrently
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(
+                        "Prompt send failed",
+                        exc_info=result,
+                        extra={"guild": guild_id},
+                    )
+        finally:
+            # Revealed whatever happened, so no channel stays hidden
+            if "reveal" in outbox.data:
+                duration, reveal_problems = await reveal_channels(
+                    outbox, interaction.guild
+                )
+                problems += reveal_problems
+                await interaction.followup.send(
+                    (
+                        f"Channels revealed in {duration * 1000:.0f}ms."
+                        + "".join(f"\n{problem}" for problem in problems)
+                    )[:2000],
+                    ephemeral=True,
+                )
+        await outbox.checkpoint()
+    finally:
+        outbox.release()
 
+    # Collect successfully sent prompts. Their outbox entries are kept until
+    # the caller has saved their removal, so a crash in between cannot
+    # cause a resend.
+    prompts_to_del = outbox.with_state("sent")
+    logger.info(
+        "Sent %d of %d prompts",
+        len(prompts_to_del),
+        len(outbox.prompts),
+        extra={"guild": guild_id, "duration": time.perf_counter() - started},
+    )
     return prompts_to_del
+
+
+async def settle_outbox(bot, outbox):
+    """
+    Archives sent prompts, removes them from prompt_info and saves, then
+    drops the outbox once nothing in it is outstanding.
+
+    Returns:
+        List of prompt IDs that were sent
+    """
+    sent = outbox.with_state("sent")
+    async with bot.state.write(outbox.guild_id) as prompts:
+        # A prompt edited since it was queued was not sent as it is now,
+        # so it is kept to be sent again
+        settled = [
+            prompts[prompt_id]
+            for prompt_id in sent
+            if prompt_id in prompts
+            and outbox.prompts[prompt_id].get("updated", prompts[prompt_id].updated)
+            == prompts[prompt_id].updated
+        ]
+        await bot.archive_prompts(outbox.guild_id, settled, "sent")
+        for record in settled:
+            del prompts[record.prompt_id]
+    # Their removal is saved, so they can no longer be sent twice
+    for prompt_id in sent:
+        del outbox.prompts[prompt_id]
+    outbox.prune(prompts)
+    # Kept while channels are still waiting to be revealed
+    if outbox.prompts or "reveal" in outbox.data:
+        await outbox.checkpoint()
+    else:
+        outbox.remove()
+    return sent
+
+
+async def resume_outboxes(bot, outbox_dir):
+    """
+    Finishes send-alls that were interrupted by a restart or disconnect,
+    and reports the result to each guild's log channel.
+    """
+    for guild_id in Outbox.guild_ids(outbox_dir):
+        guild = bot.get_guild(int(guild_id))
+        if not guild or Outbox.is_active(guild_id):
+            continue
+        outbox = Outbox.load(outbox_dir, guild_id)
+        outbox.acquire()
+        failed = []
+        try:
+            outbox.prune(bot.state.snapshot(guild_id))
+            failed += outbox.with_state("changed")
+            for prompt_id in outbox.pending():
+                entry = outbox.prompts[prompt_id]
+                channel = guild.get_channel(entry["channel"])
+                try:
+                    if not channel:
+                        entry["state"] = "failed"
+                    else:
+                        await deliver(bot, outbox, prompt_id, channel)
+                except discord.Forbidden:
+                    entry["state"] = "failed"
+                except DeliveryError as e:
+                    if e.permanent:
+                        entry["state"] = "failed"
+                    logger.error(
+                        "Resume failed in sender worker: %s",
+                        e,
+                        extra={"guild": guild_id, "prompt_id": prompt_id},
+                    )
+                except discord.HTTPException as e:
+                    logger.error(
+                        "Resume failed: %s",
+                        e,
+                        extra={"guild": guild_id, "prompt_id": prompt_id},
+                    )
+                if entry["state"] != "sent":
+                    failed.append(prompt_id)
+            # Channels hidden for a reveal-mode send-all
+            await reveal_channels(outbox, guild)
+
+            sent = await settle_outbox(bot, outbox)
+        finally:
+            outbox.release()
+
+        if not sent and not failed:
+            continue
+        logger.info(
+            "Resumed send-all: %d sent, %d failed",
+            len(sent),
+            len(failed),
+            extra={"guild": guild_id},
+        )
+        log_channel = bot.get_channel(
+            bot.config.get(guild_id, {}).get("log_channel_id")
+        )
+        if log_channel:
+            log_embed = discord.Embed(
+                title="Interrupted send-all resumed.", color=discord.Color.orange()
+            )
+            log_embed.add_field(
+                name="Sent", value="\n".join(sent) or "None", inline=True
+            )
+            log_embed.add_field(
+                name="Failed", value="\n".join(failed) or "None", inline=True
+            )
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
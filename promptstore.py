@@ -0,0 +1,156 @@
+import fcntl
+import json
+import os
+import re
+from contextlib import contextmanager
+
+# Per-guild state files are named <guild_id>.json
+GUILD_FILE = re.compile(r"(\d+)\.json")
+
+
+def write_atomic(path, data: str):
+    """Writes a file via a temporary file so readers never see half of it."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def directory_lock(directory):
+    """
+    Holds an exclusive lock on a directory's .lock file, so processes that
+    share the data directory do not rewrite the same file at once.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def hold_running_lock(directory):
+    """
+    Takes a shared lock on the data directory's .running file for the life
+    of the process, so offline tools can tell the bot is running. Every
+    shard process holds it at once.
+
+    Returns:
+        The open lock file, which must be kept referenced
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, ".running"), "w")
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    return lock_file
+
+
+def is_running(directory) -> bool:
+    path = os.path.join(directory, ".running")
+    if not os.path.exists(path):
+        return False
+    with open(path, "r") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+
+def guild_ids(directory) -> list[str]:
+    if not os.path.isdir(directory):
+        return []
+    return [
+        match.group(1)
+        for name in os.listdir(directory)
+        if (match := GUILD_FILE.fullmatch(name))
+    ]
+
+
+def load_guilds(directory, owns=lambda guild_id: True) -> dict[str, dict]:
+    """
+    Loads every per-guild file in a directory that this process owns.
+
+    Args:
+        directory: Directory holding <guild_id>.json files
+        owns: Returns whether this process owns a guild ID
+
+    Returns:
+        Mapping of guild ID to that guild's data
+    """
+    guilds = {}
+    for guild_id in guild_ids(directory):
+        if not owns(guild_id):
+            continue
+        with open(os.path.join(directory, f"{guild_id}.json"), "r") as f:
+            guilds[guild_id] = json.load(f)
+    return guilds
+
+
+def save_guild(directory, guild_id, data):
+    os.makedirs(directory, exist_ok=True)
+    write_atomic(os.path.join(directory, f"{guild_id}.json"), json.dumps(data))
+
+
+def migrate_legacy(
+    directory,
+    legacy_name,
+    assign,
+    keyed_by_guild=False,
+    merge=lambda legacy, existing: {**legacy, **existing},
+) -> dict[str, dict]:
+    """
+    Moves entries out of a legacy single-file store into per-guild files.
+
+    Entries that assign() cannot place, or that belong to guilds owned by
+    another process, are written back to the legacy file for whoever owns
+    them. The legacy file is removed once it is empty. Existing per-guild
+    data wins over legacy data.
+
+    Args:
+        directory: Directory holding the legacy file and per-guild files
+        legacy_name: File name of the legacy store, e.g. "prompt_info.json"
+        assign: Called with (key, value), returns the owning guild ID or None
+        keyed_by_guild: The legacy keys are guild IDs and each value is that
+            guild's whole file, as in config.json
+        merge: Combines a guild's legacy data with its existing file
+
+    Returns:
+        Mapping of guild ID to that guild's data after migration
+    """
+    legacy_path = os.path.join(directory, legacy_name)
+    if not os.path.exists(legacy_path):
+        return {}
+
+    migrated = {}
+    with directory_lock(directory):
+        if not os.path.exists(legacy_path):
+            return {}
+        with open(legacy_path, "r") as f:
+            legacy = json.load(f)
+
+        leftover = {}
+        for key, value in legacy.items():
+            guild_id = assign(key, value)
+            if guild_id is None:
+                leftover[key] = value
+            elif keyed_by_guild:
+                migrated[guild_id] = value
+            else:
+                migrated.setdefault(guild_id, {})[key] = value
+
+        for guild_id, data in migrated.items():
+            path = os.path.join(directory, f"{guild_id}.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    data = merge(data, json.load(f))
+                migrated[guild_id] = data
+            save_guild(directory, guild_id, data)
+
+        if leftover:
+            write_atomic(legacy_path, json.dumps(leftover))
+        else:
+            os.unlink(legacy_path)
+    return migrated
@@ -0,0 +1,199 @@
+import csv
+import io
+import json
+import os
+import re
+import time
+from promptstore import save_guild
+
+# {{name}}, {{#name}}, {{^name}} and {{/name}}
+TAG = re.compile(r"\{\{\s*([#^/]?)\s*([A-Za-z0-9_]+)\s*\}\}")
+# Template names, e.g. arena-intro
+TEMPLATE_NAME = re.compile(r"^[a-z0-9_-]{1,32}$")
+DISTRICT_NUMBER = re.compile(r"district-(\d+)")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+class Template:
+    """
+    A prompt template compiled into a tree, so it is parsed once and
+    rendered any number of times.
+
+    {{name}} is replaced with a value. {{#name}}...{{/name}} is kept only
+    when name has a non-empty value and {{^name}}...{{/name}} only when it
+    has none, so one template can cover districts that differ, e.g. a
+    {{#equipped}}EQUIPPED: {{equipped}}{{/equipped}} line. Names are not
+    case sensitive.
+
+    Raises TemplateError when tags are not balanced.
+    """
+
+    __slots__ = ("source", "names", "_nodes")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.names = set()
+        # Literal text is a str, a value is (name,) and a section is
+        # (name, inverted, children)
+        root = []
+        stack = [(None, root)]
+        position = 0
+        for match in TAG.finditer(source):
+            nodes = stack[-1][1]
+            if match.start() > position:
+                nodes.append(source[position : match.start()])
+            position = match.end()
+            kind, name = match.group(1), match.group(2).lower()
+            self.names.add(name)
+            if kind == "/":
+                if stack[-1][0] != name:
+                    raise TemplateError(
+                        f"{{{{/{name}}}}} does not close "
+                        + (f"{{{{#{stack[-1][0]}}}}}" if stack[-1][0] else "a section")
+                    )
+                stack.pop()
+            elif kind:
+                children = []
+                nodes.append((name, kind == "^", children))
+                stack.append((name, children))
+            else:
+                nodes.append((name,))
+        if len(stack) > 1:
+            raise TemplateError(f"{{{{#{stack[-1][0]}}}}} is never closed")
+        if position < len(source):
+            root.append(source[position:])
+        self._nodes = root
+
+    def render(self, values: dict) -> str:
+        """
+        Fills the template in.
+
+        Args:
+            values: Value for each name, keyed in lower case
+
+        Raises TemplateError naming the first value that is needed but
+        missing.
+        """
+        parts = []
+        self._render(self._nodes, values, parts)
+        return "".join(parts)
+
+    def _render(self, nodes, values, parts):
+        for node in nodes:
+            if isinstance(node, str):
+                parts.append(node)
+            elif len(node) == 1:
+                value = values.get(node[0])
+                if value is None:
+                    raise TemplateError(f"no value for {{{{{node[0]}}}}}")
+                parts.append(value)
+            elif bool(values.get(node[0])) != node[1]:
+                self._render(node[2], values, parts)
+
+
+def template_name(name: str) -> str | None:
+    """Normalises a template name, or returns None if it is not valid."""
+    name = name.lower().strip().replace(" ", "-")
+    return name if TEMPLATE_NAME.match(name) else None
+
+
+def district_values(channel) -> dict:
+    """The values every district channel has, {{district}} and {{channel}}."""
+    match = DISTRICT_NUMBER.search(channel.name)
+    return {
+        "district": match.group(1) if match else channel.name,
+        "channel": channel.name,
+    }
+
+
+def read_values(data: bytes, file_name: str) -> dict[str, dict]:
+    """
+    Reads the per-district values for a render, as a .csv with a district
+    column and one column per name, or a .json object of district to
+    {name: value}. Districts are given by number or channel name.
+
+    Returns:
+        {district: {name: value}}, keyed in lower case
+    """
+    text = data.decode("utf-8-sig")
+    file_name = file_name.lower()
+    if file_name.endswith(".csv"):
+        rows = csv.DictReader(io.StringIO(text))
+        if not rows.fieldnames or "district" not in (
+            field.lower().strip() for field in rows.fieldnames
+        ):
+            raise TemplateError("The CSV needs a district column.")
+        values = {}
+        for line, row in enumerate(rows, 2):
+            row = {
+                (name or "").lower().strip(): value or ""
+                for name, value in row.items()
+            }
+            district = row.pop("district").lower().strip()
+            if not district:
+                raise TemplateError(f"Line {line} has no district.")
+            values[district] = row
+        return values
+    if file_name.endswith(".json"):
+        data = json.loads(text)
+        if not isinstance(data, dict) or not all(
+            isinstance(row, dict) for row in data.values()
+        ):
+            raise TemplateError("The JSON must map each district to its values.")
+        return {
+            str(district).lower().strip(): {
+                str(name).lower(): "" if value is None else str(value)
+                for name, value in row.items()
+            }
+            for district, row in data.items()
+        }
+    raise TemplateError("Upload the values as a .csv or .json file.")
+
+
+class PromptTemplates:
+    """
+    Each guild's saved templates, compiled on first use after loading or
+    saving. One file per guild, read on first use:
+
+        {name: {"source": str, "updated": time}}
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._guilds = {}
+        # guild_id -> {name: Template}
+        self._compiled = {}
+
+    def guild(self, guild_id) -> dict:
+        if guild_id not in self._guilds:
+            path = os.path.join(self.directory, f"{guild_id}.json")
+            try:
+                with open(path, "r") as f:
+                    self._guilds[guild_id] = json.load(f)
+            except FileNotFoundError:
+                self._guilds[guild_id] = {}
+        return self._guilds[guild_id]
+
+    def get(self, guild_id, name) -> Template | None:
+        compiled = self._compiled.setdefault(guild_id, {})
+        template = compiled.get(name)
+        if template is None:
+            entry = self.guild(guild_id).get(name)
+            if entry is None:
+                return None
+            template = compiled[name] = Template(entry["source"])
+        return template
+
+    def save(self, guild_id, name, source: str) -> Template:
+        """
+        Compiles and saves a template, replacing any of the same name.
+        Raises TemplateError, saving nothing, if it does not compile.
+        """
+        template = Template(source)
+        self.guild(guild_id)[name] = {"source": source, "updated": time.time()}
+        self._compiled.setdefault(guild_id, {})[name] = template
+        save_guild(self.directory, guild_id, self.guild(guild_id))
+        return template
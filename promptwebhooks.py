@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Seconds before trying again in a channel where no webhook could be made
+RETRY_AFTER = 600
+
+
+class WebhookCache:
+    """
+    One webhook per district channel, for guilds that deliver prompts by
+    webhook. Webhook sends have their own rate limits, separate from the
+    bot's channel and interaction traffic.
+
+    A channel's webhook is found, or created with the bot's name and
+    avatar, the first time a prompt goes to it and then kept for the life
+    of the process. Channels where that fails, usually for lack of Manage
+    Webhooks, are skipped for a while and get the bot's own messages.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._webhooks = {}
+        # channel ID -> time.monotonic() of the last failure
+        self._failed = {}
+        self._locks = {}
+
+    async def get(self, channel) -> discord.Webhook | None:
+        # Concurrent sends to one channel must not create two webhooks
+        async with self._locks.setdefault(channel.id, asyncio.Lock()):
+            webhook = self._webhooks.get(channel.id)
+            if webhook:
+                return webhook
+            failed = self._failed.get(channel.id)
+            if failed and time.monotonic() - failed < RETRY_AFTER:
+                return None
+            webhook = await self._provision(channel)
+            if webhook:
+                self._webhooks[channel.id] = webhook
+            return webhook
+
+    async def _provision(self, channel) -> discord.Webhook | None:
+        # Sender workers have no member cache, so they ask and let Discord
+        # refuse
+        me = channel.guild.me
+        if me and not channel.permissions_for(me).manage_webhooks:
+            self._failed[channel.id] = time.monotonic()
+            return None
+        try:
+            for webhook in await channel.webhooks():
+                if (
+                    webhook.type == discord.WebhookType.incoming
+                    and webhook.user
+                    and webhook.user.id == self.bot.user.id
+                    and webhook.token
+                ):
+                    return webhook
+            return await channel.create_webhook(
+                name=self.bot.user.name,
+                avatar=await self.bot.user.display_avatar.read(),
+                reason="Prompt delivery",
+            )
+        except discord.HTTPException as e:
+            self._failed[channel.id] = time.monotonic()
+            logger.warning(
+                "Could not set up a webhook in %s: %s",
+                channel.name,
+                e,
+                extra={"guild": channel.guild.id},
+            )
+            return None
+
+    def invalidate(self, channel_id):
+        """Forgets a channel's webhook, e.g. after it was deleted."""
+        self._webhooks.pop(channel_id, None)
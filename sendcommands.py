@@ -0,0 +1,507 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from confirmationview import ConfirmationView
+from commandutils import prompt_ids_list, deferred
+from promptsender import (
+    send_all_prompts_concurrent,
+    settle_outbox,
+    prepare_prompt,
+    deliver,
+)
+from deliveryqueue import DeliveryError
+from promptoutbox import Outbox
+from sentprompts import plan_edit, apply_edit, retract_prompts
+from editpromptmodal import EditPromptModal, MODAL_TEXT_LIMIT
+from sendscheduler import parse_send_time
+from sendplanner import plan_send_all
+import datetime
+from typing import Optional
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SendCommands(commands.Cog):
+    """Sending prompts, now or on a schedule."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(name="send-prompt", description="Send a prompt")
+    @deferred
+    async def sendPrompt(self, interaction: discord.Interaction, prompt_id: str):
+        # Sends the prompt
+        prompt_id = prompt_id.strip().upper()
+        guild_id = str(interaction.guild.id)
+        record = self.bot.state.snapshot(guild_id).get(prompt_id)
+        prepared = record and await prepare_prompt(
+            self.bot, interaction.guild, record, guild_id, self.bot.prompt_image_dir
+        )
+        if not prepared:
+            await interaction.followup.send("Prompt not found", ephemeral=True)
+            return
+        if Outbox.is_active(guild_id):
+            await interaction.followup.send(
+                "A send-all is in progress. Send the prompt once it has finished.",
+                ephemeral=True,
+            )
+            return
+
+        # Sent through the guild's outbox like a send-all, so an interrupted
+        # send resumes instead of posting twice, and sender workers do the
+        # sending when they run
+        channel = prepared.channel
+        outbox = Outbox.load_or_create(self.bot.outbox_dir, guild_id)
+        outbox.acquire()
+        try:
+            if not outbox.add_prompt(prepared):
+                await outbox.checkpoint()
+                await interaction.followup.send(
+                    f"`{prompt_id}` was edited after part of it was sent, so it "
+                    "was not sent again. Delete what was posted and save it again.",
+                    ephemeral=True,
+                )
+                return
+            await outbox.checkpoint()
+            entry = outbox.prompts[prompt_id]
+            try:
+                missing = await deliver(self.bot, outbox, prompt_id, channel)
+            except discord.Forbidden:
+                entry["state"] = "failed"
+                missing = None
+                problem = f"The bot doesn't have permission to send in {channel.mention}."
+            except DeliveryError as e:
+                if e.permanent:
+                    entry["state"] = "failed"
+                missing = None
+                problem = f"Sending failed: {e}"
+            except discord.HTTPException as e:
+                missing = None
+                problem = f"Discord refused the prompt: {e.text or e.status}"
+            if missing is None:
+                logger.warning(
+                    "Failed to send prompt: %s",
+                    problem,
+                    extra={"guild": guild_id, "prompt_id": prompt_id},
+                )
+            await settle_outbox(self.bot, outbox)
+        finally:
+            outbox.release()
+        if missing is None:
+            await interaction.followup.send(problem, ephemeral=True)
+            return
+
+        for file_name in missing:
+            await interaction.followup.send(
+                "File is missing, please reattach the file.",
+                ephemeral=True,
+            )
+        await interaction.followup.send(
+            f"Prompt {prompt_id} sent in channel {channel.mention}", ephemeral=True
+        )
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"{prompt_id} prompt sent to {channel.mention}",
+                color=discord.Color.green(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+    @app_commands.command(name="send-all-prompts", description="Send all prompts")
+    @app_commands.describe(
+        reveal="Hide the districts from tributes while posting, then reveal them all at once"
+    )
+    async def sendAllPrompts(self, interaction: discord.Interaction, reveal: bool = False):
+        # Sends all the prompts
+        guild_id = str(interaction.guild.id)
+        if Outbox.is_active(guild_id):
+            await interaction.response.send_message(
+                "A send-all is still running. Try again once it finishes.",
+                ephemeral=True,
+            )
+            return
+        reveal_role = None
+        if reveal:
+            reveal_role = interaction.guild.get_role(
+                self.bot.config[guild_id].get("tribute_role_id") or 0
+            )
+            if not reveal_role:
+                await interaction.response.send_message(
+                    "Set the tribute role with /set-tribute-role to use reveal.",
+                    ephemeral=True,
+                )
+                return
+        prompts = self.bot.state.snapshot(guild_id)
+        confirmSend = ConfirmationView()
+        length = 0
+        for record in prompts.values():
+            if interaction.guild.get_channel(record.channel):
+                length += 1
+        await interaction.response.send_message(
+            f"There are {length} prompts saved. Are you sure you want to send all prompts? This will also clear them from the list.",
+            ephemeral=True,
+            view=confirmSend,
+        )
+        await confirmSend.wait()
+        # Another send-all, scheduled send or resume may have started
+        # while waiting for confirmation
+        if confirmSend.confirmed and Outbox.is_active(guild_id):
+            msg = await interaction.original_response()
+            await msg.edit(
+                content="A send-all is still running. Try again once it finishes."
+            )
+            return
+        # Prompts may have changed while waiting for confirmation
+        prompts = self.bot.state.snapshot(guild_id)
+        prompt_keys = []
+        prompt_mentions = []
+        log_channel = self.bot.config[guild_id]["log_channel_id"]
+        for prompt_id, record in prompts.items():
+            if interaction.guild.get_channel(record.channel):
+                prompt_keys.append(prompt_id)
+                prompt_mentions.append(f"<#{record.channel}>")
+
+        if confirmSend.confirmed:
+            await send_all_prompts_concurrent(
+                self.bot,
+                interaction,
+                guild_id,
+                self.bot.prompt_image_dir,
+                self.bot.outbox_dir,
+                reveal_role,
+            )
+
+            if len(prompt_keys) > 0:
+                await prompt_ids_list(self.bot, interaction, "All prompts send", log_channel)
+
+            # Removes the sent prompts and saves, then clears the outbox,
+            # unless another send has taken it over since
+            outbox = Outbox.load(self.bot.outbox_dir, guild_id)
+            if outbox and not Outbox.is_active(guild_id):
+                await settle_outbox(self.bot, outbox)
+
+            msg = await interaction.original_response()
+            await msg.edit(content="All prompts sent.")
+        else:
+            msg = await interaction.original_response()
+            await msg.edit(content="Cancelled sending all prompts.")
+
+    @app_commands.command(
+        name="plan-send-all", description="Dry run of send-all-prompts with estimates"
+    )
+    async def plan_send_all_prompts(self, interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        await interaction.response.defer(ephemeral=True)
+        plan = await plan_send_all(self.bot, interaction.guild, guild_id, self.bot.prompt_image_dir)
+        if not plan.prompts:
+            await interaction.followup.send("No prompts found in guild.", ephemeral=True)
+            return
+
+        problems = plan.problems
+        plan_embed = discord.Embed(
+            title="**Send-all plan**",
+            color=discord.Color.red() if problems else discord.Color.green(),
+        )
+        plan_embed.description = "\n".join(
+            f"**{p.prompt_id}** {p.channel.mention}: {p.messages} messages, "
+            f"{p.calls} calls, {p.upload_bytes / 1024:.0f} KiB"
+            for p in plan.prompts
+        )[:4096]
+        plan_embed.add_field(name="REST calls", value=str(plan.calls), inline=True)
+        plan_embed.add_field(
+            name="Uploads",
+            value=f"{plan.upload_bytes / 1024 / 1024:.1f} MiB",
+            inline=True,
+        )
+        plan_embed.add_field(
+            name="Estimated time", value=f"~{plan.estimate():.1f}s", inline=True
+        )
+        plan_embed.add_field(
+            name="Problems",
+            value="\n".join(problems)[:1024] if problems else "None",
+            inline=False,
+        )
+        plan_embed.timestamp = datetime.datetime.now()
+        operations = discord.File(
+            io.BytesIO(plan.operation_log().encode()), filename="send-plan.txt"
+        )
+        await interaction.followup.send(embed=plan_embed, file=operations, ephemeral=True)
+
+    @app_commands.command(
+        name="schedule-send-all",
+        description="Send all prompts at a set time (HH:MM UTC, ISO date or Discord timestamp)",
+    )
+    @app_commands.rename(send_at="time")
+    async def schedule_send_all(self, interaction: discord.Interaction, send_at: str):
+        guild_id = str(interaction.guild.id)
+        when = parse_send_time(send_at, discord.utils.utcnow())
+        if not when:
+            await interaction.response.send_message(
+                "Could not read that time. Use HH:MM (UTC), 2025-01-31 18:00 or a Discord timestamp.",
+                ephemeral=True,
+            )
+            return
+        if when <= discord.utils.utcnow():
+            await interaction.response.send_message(
+                "That time has already passed.", ephemeral=True
+            )
+            return
+
+        self.bot.scheduler.schedule(guild_id, when, interaction.user.id)
+        timestamp = int(when.timestamp())
+        await interaction.response.send_message(
+            f"All prompts will be sent <t:{timestamp}:F> (<t:{timestamp}:R>).",
+            ephemeral=True,
+        )
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"Send-all scheduled for <t:{timestamp}:F>",
+                color=discord.Color.blue(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+    @app_commands.command(
+        name="cancel-scheduled-send", description="Cancel a scheduled send-all"
+    )
+    async def cancel_scheduled_send(self, interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        if self.bot.scheduler.cancel(guild_id):
+            await interaction.response.send_message(
+                "Scheduled send cancelled.", ephemeral=True
+            )
+        else:
+            await interaction.response.send_message(
+                "There is no scheduled send.", ephemeral=True
+            )
+
+    @app_commands.command(
+        name="edit-sent-prompt", description="Correct a prompt that was already sent"
+    )
+    @app_commands.describe(
+        prompt_id="The sent prompt to correct",
+        file="The corrected prompt as a .txt, for prompts too long to edit in a form",
+    )
+    async def edit_sent_prompt(
+        self,
+        interaction: discord.Interaction,
+        prompt_id: str,
+        file: Optional[discord.Attachment] = None,
+    ):
+        prompt_id = prompt_id.upper().strip().replace(" ", "_")
+        guild_id = str(interaction.guild.id)
+        entry = self.bot.sent.get(guild_id, prompt_id)
+        if not entry:
+            await interaction.response.send_message(
+                f"No sent prompt with ID `{prompt_id}` was found.", ephemeral=True
+            )
+            return
+
+        if file:
+            if not file.filename.lower().endswith(".txt"):
+                await interaction.response.send_message(
+                    "Please upload a .txt file.", ephemeral=True
+                )
+                return
+            await interaction.response.defer(ephemeral=True)
+            text = (await file.read()).decode("utf-8", errors="replace")
+            await self.edit_sent(interaction, guild_id, prompt_id, text)
+            return
+
+        # Chunks are split before a newline, so joining them gives the text back
+        text = "".join(chunk["text"] for chunk in entry["chunks"])
+        if len(text) > MODAL_TEXT_LIMIT:
+            await interaction.response.send_message(
+                f"`{prompt_id}` is {len(text)} characters, too long to edit in a form. "
+                "Attach the corrected prompt as a .txt file instead.",
+                ephemeral=True,
+            )
+            return
+
+        async def on_text(interaction, text):
+            await interaction.response.defer(ephemeral=True)
+            await self.edit_sent(interaction, guild_id, prompt_id, text)
+
+        await interaction.response.send_modal(EditPromptModal(prompt_id, text, on_text))
+
+    async def edit_sent(self, interaction, guild_id, prompt_id, text):
+        """Edits a sent prompt to match text, touching only the chunks that changed."""
+        if not text.strip():
+            await interaction.followup.send(
+                "A prompt cannot be empty. Delete it by hand instead.", ephemeral=True
+            )
+            return
+        async with self.bot.sent.lock(guild_id):
+            entry = self.bot.sent.get(guild_id, prompt_id)
+            if not entry:
+                # Retracted while the form was open
+                await interaction.followup.send(
+                    f"`{prompt_id}` is no longer sent, so there is nothing to edit.",
+                    ephemeral=True,
+                )
+                return
+            channel = interaction.guild.get_channel(entry["channel"])
+            if not channel:
+                await interaction.followup.send(
+                    f"The channel `{prompt_id}` was sent to no longer exists.",
+                    ephemeral=True,
+                )
+                return
+            plan = plan_edit(entry["chunks"], text)
+            if not plan:
+                await interaction.followup.send("Nothing changed.", ephemeral=True)
+                return
+            try:
+                await apply_edit(self.bot, channel, guild_id, prompt_id, plan)
+            except ValueError as e:
+                await interaction.followup.send(str(e), ephemeral=True)
+                return
+            except discord.HTTPException as e:
+                logger.warning(
+                    "Failed to edit sent prompt: %s",
+                    e,
+                    extra={"guild": guild_id, "prompt_id": prompt_id},
+                )
+                await interaction.followup.send(
+                    f"Discord refused part of the edit: {e.text or e.status}",
+                    ephemeral=True,
+                )
+                return
+
+        summary = (
+            f"{len(plan.edits)} edited, {len(plan.appends)} added, "
+            f"{len(plan.deletes)} removed"
+        )
+        await interaction.followup.send(
+            f"`{prompt_id}` corrected in {channel.mention}: {summary}.", ephemeral=True
+        )
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"{prompt_id} sent prompt edited in {channel.mention}",
+                description=summary,
+                color=discord.Color.blue(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+    @app_commands.command(
+        name="retract-prompt",
+        description="Delete a sent prompt's messages and put the prompt back",
+    )
+    async def retract_prompt(self, interaction: discord.Interaction, prompt_id: str):
+        prompt_id = prompt_id.upper().strip().replace(" ", "_")
+        guild_id = str(interaction.guild.id)
+        if not self.bot.sent.get(guild_id, prompt_id):
+            await interaction.response.send_message(
+                f"No sent prompt with ID `{prompt_id}` was found.", ephemeral=True
+            )
+            return
+        await interaction.response.defer(ephemeral=True)
+        await self.retract(interaction, guild_id, [prompt_id])
+
+    @app_commands.command(
+        name="retract-all",
+        description="Delete every prompt from the last send-all and put them back",
+    )
+    async def retract_all(self, interaction: discord.Interaction):
+        guild_id = str(interaction.guild.id)
+        if Outbox.is_active(guild_id):
+            await interaction.response.send_message(
+                "A send-all is still running. Try again once it finishes.",
+                ephemeral=True,
+            )
+            return
+        prompt_ids = self.bot.sent.latest_batch(guild_id)
+        if not prompt_ids:
+            await interaction.response.send_message(
+                "No send-all to retract was found.", ephemeral=True
+            )
+            return
+        confirmSend = ConfirmationView()
+        await interaction.response.send_message(
+            f"The last send-all sent {len(prompt_ids)} prompts. Are you sure you want to delete them from every channel?",
+            ephemeral=True,
+            view=confirmSend,
+        )
+        await confirmSend.wait()
+        if not confirmSend.confirmed:
+            await interaction.followup.send("Cancelled retracting prompts!", ephemeral=True)
+            return
+        # Another retraction may have run while waiting for confirmation
+        prompt_ids = [
+            prompt_id
+            for prompt_id in prompt_ids
+            if self.bot.sent.get(guild_id, prompt_id)
+        ]
+        await self.retract(interaction, guild_id, prompt_ids)
+
+    async def retract(self, interaction, guild_id, prompt_ids):
+        """Retracts sent prompts and reports the result to the user and log channel."""
+        async with self.bot.sent.lock(guild_id):
+            restored, kept, failed = await retract_prompts(
+                self.bot, interaction.guild, guild_id, prompt_ids
+            )
+        logger.info(
+            "Retracted %d prompts, %d failed",
+            len(restored) + len(kept),
+            len(failed),
+            extra={"guild": guild_id, "command": interaction.command.name},
+        )
+        lines = []
+        if restored:
+            lines.append(f"Retracted and restored: {', '.join(restored)}")
+        if kept:
+            lines.append(
+                f"Retracted, but a prompt with the same ID is saved so it was kept: {', '.join(kept)}"
+            )
+        if failed:
+            lines.append(
+                f"Could not be retracted, check the bot can manage messages: {', '.join(failed)}"
+            )
+        await interaction.followup.send(
+            ("\n".join(lines) or "Nothing was left to retract.")[:2000], ephemeral=True
+        )
+
+        log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+        if log_channel and (restored or kept):
+            log_embed = discord.Embed(
+                title="Sent prompts retracted.", color=discord.Color.orange()
+            )
+            log_embed.add_field(
+                name="Prompt IDs", value="\n".join(restored + kept)[:1024], inline=True
+            )
+            if failed:
+                log_embed.add_field(
+                    name="Failed", value="\n".join(failed)[:1024], inline=True
+                )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+
+async def setup(bot):
+    await bot.add_cog(SendCommands(bot))
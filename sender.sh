@@ -0,0 +1,13 @@
+#!/bin/bash
+# Sender workers for the delivery queue; idle unless sender-workers is set
+TOKEN=$(snapctl get token)
+SENDER_WORKERS=$(snapctl get sender-workers)
+
+if [ -z "$TOKEN" ] || [ -z "$SENDER_WORKERS" ] || [ "$SENDER_WORKERS" -lt 1 ]; then
+    exit 0
+fi
+
+export TOKEN SENDER_WORKERS
+export LOG_LEVEL=$(snapctl get log-level)
+export LOG_LEVELS=$(snapctl get log-levels)
+exec python3 $SNAP/bin/senderworker.py "$@"
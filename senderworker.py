@@ -0,0 +1,214 @@
+# Sender worker: delivers prompts the bot queues in its delivery queue.
+# It only uses Discord's REST API and never connects to the gateway, so
+# uploads and rate limit waits here cannot delay heartbeats or command
+# handling in the bot. Started by sender.sh when sender-workers is set.
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import discord
+from botlog import setup_logging
+from deliveryqueue import DeliveryQueue, POLL_INTERVAL
+from promptoutbox import Outbox
+from promptsender import deliver_prompt
+from promptstore import hold_running_lock
+from promptwebhooks import WebhookCache
+from shardlauncher import RESTART_DELAY
+
+logger = logging.getLogger(__name__)
+
+# Prompts one worker process delivers at once
+CONCURRENCY = 8
+
+
+class JobOutbox(Outbox):
+    """
+    A single-prompt outbox whose checkpoints go into its delivery job, so
+    the bot sees progress and another worker can continue the job.
+    """
+
+    def __init__(self, queue, job):
+        super().__init__(
+            None,
+            job.guild_id,
+            {
+                "created": job.batch,
+                "prompts": {
+                    job.prompt_id: {
+                        "channel": job.payload["channel"],
+                        "state": "pending",
+                        "operations": job.payload["operations"],
+                    }
+                },
+            },
+        )
+        self.queue = queue
+        self.job = job
+
+    async def checkpoint(self):
+        first_sent = self.first_sent_at.get(self.job.prompt_id)
+        if first_sent is not None:
+            # Reported as wall clock time, which the bot can compare
+            first_sent = time.time() - (time.perf_counter() - first_sent)
+        await asyncio.to_thread(self.queue.checkpoint, self.job, first_sent)
+
+
+class SenderWorker:
+    """
+    Claims delivery jobs and runs them with deliver_prompt, the same code
+    the bot uses when it sends prompts itself.
+
+    Holds what deliver_prompt expects of a bot: a REST-only client's user
+    and HTTP session, each job's delivery setting as config, and its own
+    webhook cache.
+    """
+
+    def __init__(self, queue: DeliveryQueue, token: str, name: str):
+        self.queue = queue
+        self.token = token
+        self.name = name
+        self.client = discord.Client(intents=discord.Intents.none())
+        self.config = {}
+        self.webhooks = WebhookCache(self)
+        self._channels = {}
+        self._slots = asyncio.Semaphore(CONCURRENCY)
+        self._tasks = set()
+
+    @property
+    def user(self):
+        return self.client.user
+
+    async def channel(self, channel_id):
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = await self.client.fetch_channel(channel_id)
+            self._channels[channel_id] = channel
+        return channel
+
+    async def run(self):
+        # login() only authenticates over REST; there is no gateway session
+        await self.client.login(self.token)
+        logger.info("Sender worker %s ready as %s", self.name, self.client.user)
+        try:
+            while True:
+                await self._slots.acquire()
+                job = await asyncio.to_thread(self.queue.claim, self.name)
+                if job is None:
+                    self._slots.release()
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+                task = asyncio.create_task(self._deliver(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            await self.client.close()
+
+    async def _deliver(self, job):
+        started = time.perf_counter()
+        outbox = JobOutbox(self.queue, job)
+        error = None
+        permanent = False
+        try:
+            self.config[job.guild_id] = {"delivery": job.payload["delivery"]}
+            channel = await self.channel(job.payload["channel"])
+            await deliver_prompt(self, outbox, job.prompt_id, channel)
+        except discord.Forbidden as e:
+            error = str(e)
+            permanent = True
+        except discord.NotFound as e:
+            # The channel was deleted
+            error = str(e)
+            permanent = True
+        except discord.HTTPException as e:
+            error = str(e)
+        except Exception as e:
+            logger.exception(
+                "Delivery failed",
+                extra={"guild": job.guild_id, "prompt_id": job.prompt_id},
+            )
+            error = repr(e)
+        finally:
+            self._slots.release()
+        await asyncio.to_thread(self.queue.finish, job, error, permanent)
+        extra = {
+            "guild": job.guild_id,
+            "prompt_id": job.prompt_id,
+            "duration": time.perf_counter() - started,
+        }
+        if error:
+            logger.warning("Failed to deliver %s: %s", job.prompt_id, error, extra=extra)
+        else:
+            logger.info("Delivered %s", job.prompt_id, extra=extra)
+
+
+def supervise(processes: int):
+    """Runs SENDER_WORKERS single worker processes and restarts any that exit."""
+    worker_path = os.path.abspath(__file__)
+
+    def start(index):
+        env = dict(os.environ, SENDER_WORKERS="1", SENDER_NAME=f"sender-{index}")
+        return subprocess.Popen([sys.executable, worker_path], env=env)
+
+    children = {index: start(index) for index in range(processes)}
+
+    def stop(signum, frame):
+        for child in children.values():
+            child.terminate()
+        for child in children.values():
+            child.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while True:
+        time.sleep(1)
+        for index, child in list(children.items()):
+            if child.poll() is None:
+                continue
+            logger.warning(
+                "Sender worker %d exited with %s, restarting in %ds",
+                index,
+                child.returncode,
+                RESTART_DELAY,
+            )
+            time.sleep(RESTART_DELAY)
+            children[index] = start(index)
+
+
+def main():
+    setup_logging()
+    try:
+        datadir = os.environ["SNAP_DATA"].replace(os.environ["SNAP_REVISION"], "current")
+        token = os.environ["TOKEN"]
+    except KeyError as e:
+        logger.critical("%s must be set", e.args[0])
+        return 1
+    processes = int(os.environ.get("SENDER_WORKERS") or 1)
+    if processes > 1:
+        supervise(processes)
+        return 0
+
+    # Attachments are deleted once sent, so offline tools must see this
+    # process as the bot running
+    running_lock = hold_running_lock(datadir)
+    worker = SenderWorker(
+        DeliveryQueue(os.path.join(datadir, "delivery.db")),
+        token,
+        os.environ.get("SENDER_NAME") or f"sender-{os.getpid()}",
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        running_lock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
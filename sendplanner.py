@@ -0,0 +1,130 @@
+import os
+import math
+from promptsender import prepare_prompt
+
+# Discord allows 5 messages per 5 seconds in a channel and 50 requests per
+# second per bot across all routes
+CHANNEL_MESSAGES_PER_WINDOW = 5
+CHANNEL_WINDOW_SECONDS = 5.0
+GLOBAL_REQUESTS_PER_SECOND = 50
+# Used when the gateway latency is not known yet
+DEFAULT_ROUND_TRIP = 0.15
+# Rough upload throughput used to cost attachments
+UPLOAD_BYTES_PER_SECOND = 2 * 1024 * 1024
+
+
+class PromptPlan:
+    def __init__(self, prompt_id, channel):
+        self.prompt_id = prompt_id
+        self.channel = channel
+        self.operations = []
+        self.problems = []
+        self.messages = 0
+        self.upload_bytes = 0
+
+    @property
+    def calls(self):
+        return len(self.operations)
+
+    def estimate(self, round_trip):
+        """Seconds this prompt's channel needs, sending serially."""
+        seconds = self.calls * round_trip
+        # Every message beyond the first window waits for the bucket to reset
+        windows = math.ceil(self.messages / CHANNEL_MESSAGES_PER_WINDOW) - 1
+        seconds += max(0, windows) * CHANNEL_WINDOW_SECONDS
+        return seconds + self.upload_bytes / UPLOAD_BYTES_PER_SECOND
+
+
+class SendPlan:
+    def __init__(self, prompts, round_trip):
+        self.prompts = prompts
+        self.round_trip = round_trip
+
+    @property
+    def calls(self):
+        return sum(plan.calls for plan in self.prompts)
+
+    @property
+    def upload_bytes(self):
+        return sum(plan.upload_bytes for plan in self.prompts)
+
+    @property
+    def problems(self):
+        return [
+            f"{plan.prompt_id}: {problem}"
+            for plan in self.prompts
+            for problem in plan.problems
+        ]
+
+    def estimate(self):
+        """
+        Estimated wall-clock seconds for a concurrent send-all: the slowest
+        channel, or the global rate limit if that is the tighter bound.
+        """
+        if not self.prompts:
+            return 0.0
+        slowest = max(plan.estimate(self.round_trip) for plan in self.prompts)
+        return max(slowest, self.calls / GLOBAL_REQUESTS_PER_SECOND)
+
+    def operation_log(self) -> str:
+        lines = []
+        for plan in self.prompts:
+            lines.append(f"[{plan.prompt_id}] #{plan.channel.name}")
+            lines.extend(f"  {operation}" for operation in plan.operations)
+            lines.extend(f"  ! {problem}" for problem in plan.problems)
+        return "\n".join(lines)
+
+
+async def plan_send_all(bot, guild, guild_id, prompt_image_dir) -> SendPlan:
+    """
+    Compiles the operations send_all_prompts_concurrent would perform,
+    without sending anything.
+
+    Args:
+        bot: The bot instance
+        guild: The guild to plan for
+        guild_id: The guild ID as a string
+        prompt_image_dir: Directory where prompt images are stored
+
+    Returns:
+        A SendPlan with per-prompt operations, problems and estimates
+    """
+    plans = []
+    for prompt_id, record in bot.state.snapshot(guild_id).items():
+        prepared = await prepare_prompt(
+            bot, guild, record, guild_id, prompt_image_dir
+        )
+        if not prepared:
+            continue
+        plan = PromptPlan(prompt_id, prepared.channel)
+        for index, chunk in enumerate(prepared.chunks):
+            plan.operations.append(f"send chunk {index + 1} ({len(chunk)} chars)")
+            plan.messages += 1
+            if index == 0:
+                plan.operations.append("pin chunk 1")
+                plan.operations.append("read last 3 messages for pin notice")
+                plan.operations.append("read audit log for pin author")
+                plan.operations.append("delete pin notice")
+        for file_name, file_path in prepared.files:
+            size = os.path.getsize(file_path)
+            plan.operations.append(f"upload {file_name} ({size / 1024:.0f} KiB)")
+            plan.messages += 1
+            plan.upload_bytes += size
+            if size > guild.filesize_limit:
+                plan.problems.append(
+                    f"{file_name} is {size / 1024 / 1024:.1f} MiB, over the "
+                    f"{guild.filesize_limit / 1024 / 1024:.0f} MiB upload limit"
+                )
+        for file_name in prepared.missing:
+            plan.problems.append(f"file {file_name} is missing")
+        if prepared.missing_permissions:
+            plan.problems.append(
+                f"missing {', '.join(prepared.missing_permissions)} "
+                f"in {prepared.channel.mention}"
+            )
+        plans.append(plan)
+
+    round_trip = bot.latency
+    if not round_trip or math.isinf(round_trip) or math.isnan(round_trip):
+        round_trip = DEFAULT_ROUND_TRIP
+    return SendPlan(plans, round_trip)
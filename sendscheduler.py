@@ -0,0 +1,288 @@
+import discord
+import asyncio
+import datetime
+import logging
+import re
+import time
+from promptoutbox import Outbox
+from promptsender import prepare_prompt, deliver, settle_outbox
+from deliveryqueue import DeliveryError
+from promptreveal import reveal_channels
+
+logger = logging.getLogger(__name__)
+
+# How long before the target time prompts are chunked, read and checked
+PREWARM_SECONDS = 5
+# Schedules missed by less than this while the bot was down still fire
+MISSED_GRACE = datetime.timedelta(minutes=5)
+
+
+def parse_send_time(value: str, now: datetime.datetime) -> datetime.datetime | None:
+    """
+    Parses a send time given as HH:MM (UTC, next occurrence), an ISO date
+    and time (UTC unless it has an offset), a unix timestamp or a Discord
+    timestamp such as <t:1700000000:F>.
+
+    Returns:
+        An aware UTC datetime, or None if the value could not be parsed
+    """
+    value = value.strip()
+    match = re.fullmatch(r"<t:(\d+)(?::\w)?>|(\d{9,})", value)
+    if match:
+        timestamp = int(match.group(1) or match.group(2))
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+    match = re.fullmatch(r"(\d{1,2}):(\d{2})", value)
+    if match:
+        when = now.replace(
+            hour=int(match.group(1)),
+            minute=int(match.group(2)),
+            second=0,
+            microsecond=0,
+        )
+        if when <= now:
+            when += datetime.timedelta(days=1)
+        return when
+
+    try:
+        when = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.astimezone(datetime.timezone.utc)
+
+
+class SendScheduler:
+    """
+    Runs scheduled send-alls. Schedules are stored in the guild config under
+    "scheduled_send" so they survive restarts.
+    """
+
+    def __init__(self, bot, prompt_image_dir, outbox_dir):
+        self.bot = bot
+        self.prompt_image_dir = prompt_image_dir
+        self.outbox_dir = outbox_dir
+        self.tasks = {}
+
+    def schedule(self, guild_id: str, when: datetime.datetime, user_id: int):
+        self.cancel(guild_id)
+        self.bot.config[guild_id]["scheduled_send"] = {
+            "at": when.isoformat(),
+            "user_id": user_id,
+        }
+        self.bot.save()
+        self._start(guild_id, when)
+
+    def cancel(self, guild_id: str) -> bool:
+        task = self.tasks.pop(guild_id, None)
+        if task:
+            task.cancel()
+        scheduled = self.bot.config.get(guild_id, {}).pop("scheduled_send", None)
+        if scheduled:
+            self.bot.save()
+        return bool(scheduled)
+
+    def restore(self):
+        """Restarts timers for schedules persisted in the config."""
+        now = discord.utils.utcnow()
+        for guild_id, guild_config in self.bot.config.items():
+            scheduled = guild_config.get("scheduled_send")
+            if not scheduled or guild_id in self.tasks:
+                continue
+            when = datetime.datetime.fromisoformat(scheduled["at"])
+            if now - when > MISSED_GRACE:
+                logger.warning(
+                    "Dropping scheduled send missed at %s",
+                    scheduled["at"],
+                    extra={"guild": guild_id},
+                )
+                del guild_config["scheduled_send"]
+                self.bot.save()
+                continue
+            self._start(guild_id, when)
+
+    def _start(self, guild_id, when):
+        task = asyncio.create_task(self._run(guild_id, when))
+        self.tasks[guild_id] = task
+        task.add_done_callback(lambda t: self._finished(guild_id, t))
+
+    def _finished(self, guild_id, task):
+        if self.tasks.get(guild_id) is task:
+            del self.tasks[guild_id]
+        if not task.cancelled() and task.exception():
+            logger.error(
+                "Scheduled send failed",
+                exc_info=task.exception(),
+                extra={"guild": guild_id, "command": "schedule-send-all"},
+            )
+
+    async def _sleep_until(self, target: float):
+        # Sleep in bounded steps so wall clock adjustments are picked up,
+        # then finish on the loop's monotonic clock for the last stretch
+        while target - time.time() > 60:
+            await asyncio.sleep(60)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, target - time.time())
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    async def _run(self, guild_id: str, when: datetime.datetime):
+        target = when.timestamp()
+        await self._sleep_until(target - PREWARM_SECONDS)
+
+        guild = self.bot.get_guild(int(guild_id))
+        if not guild:
+            logger.warning("Scheduled send guild not found", extra={"guild": guild_id})
+            self.bot.config.get(guild_id, {}).pop("scheduled_send", None)
+            self.bot.save()
+            return
+
+        # A send-all or resume already drives this guild's outbox, and
+        # running both would send its prompts twice
+        if Outbox.is_active(guild_id):
+            logger.warning(
+                "Scheduled send skipped, a send-all is running",
+                extra={"guild": guild_id, "command": "schedule-send-all"},
+            )
+            self.bot.config.get(guild_id, {}).pop("scheduled_send", None)
+            self.bot.save()
+            log_channel = self.bot.get_channel(
+                self.bot.config.get(guild_id, {}).get("log_channel_id")
+            )
+            if log_channel:
+                log_embed = discord.Embed(
+                    title="Scheduled send skipped.",
+                    description="Another send-all was still running. "
+                    "Check what was sent and send the rest with /send-all-prompts.",
+                    color=discord.Color.red(),
+                )
+                log_embed.timestamp = datetime.datetime.now()
+                await log_channel.send(embed=log_embed)
+            return
+
+        # Pre-warm: chunk, read attachments and check permissions now so
+        # only the HTTP calls are left when the timer fires
+        outbox = Outbox.load_or_create(self.outbox_dir, guild_id)
+        outbox.acquire()
+        try:
+            prompts = self.bot.state.snapshot(guild_id)
+            outbox.prune(prompts)
+            problems = []
+            for prompt_id, record in prompts.items():
+                prepared = await prepare_prompt(
+                    self.bot,
+                    guild,
+                    record,
+                    guild_id,
+                    self.prompt_image_dir,
+                    preload=True,
+                )
+                if not prepared:
+                    continue
+                if prepared.missing_permissions:
+                    problems.append(
+                        f"{prompt_id}: missing {', '.join(prepared.missing_permissions)}"
+                        f" in {prepared.channel.mention}"
+                    )
+                    continue
+                for file_name in prepared.missing:
+                    problems.append(f"{prompt_id}: file {file_name} is missing")
+                if not outbox.add_prompt(prepared):
+                    problems.append(
+                        f"{prompt_id}: edited after part of it was sent, not sent"
+                    )
+            ready = []
+            for prompt_id in outbox.pending():
+                channel = guild.get_channel(outbox.prompts[prompt_id]["channel"])
+                if channel:
+                    ready.append((prompt_id, channel))
+                else:
+                    # Otherwise every resume would try it again
+                    outbox.prompts[prompt_id]["state"] = "failed"
+                    problems.append(f"{prompt_id}: its channel no longer exists")
+            await outbox.checkpoint()
+
+            await self._sleep_until(target)
+            started = time.perf_counter()
+            results = await asyncio.gather(
+                *(
+                    deliver(self.bot, outbox, prompt_id, channel)
+                    for prompt_id, channel in ready
+                ),
+                return_exceptions=True,
+            )
+            duration = time.perf_counter() - started
+            # Channels still hidden by an interrupted reveal-mode send-all
+            await reveal_channels(outbox, guild)
+
+            for (prompt_id, channel), result in zip(ready, results):
+                if isinstance(result, discord.Forbidden) or (
+                    isinstance(result, DeliveryError) and result.permanent
+                ):
+                    outbox.prompts[prompt_id]["state"] = "failed"
+                if isinstance(result, Exception):
+                    problems.append(f"{prompt_id}: {result}")
+            sent_channels = {
+                prompt_id: channel
+                for prompt_id, channel in ready
+                if outbox.prompts[prompt_id]["state"] == "sent"
+            }
+            sent = await settle_outbox(self.bot, outbox)
+        finally:
+            outbox.release()
+
+        first_sent = [
+            outbox.first_sent_at[prompt_id]
+            for prompt_id in sent
+            if prompt_id in outbox.first_sent_at
+        ]
+        skew = max(first_sent) - min(first_sent) if first_sent else 0.0
+        logger.info(
+            "Scheduled send delivered %d of %d prompts (skew %.0fms)",
+            len(sent),
+            len(ready),
+            skew * 1000,
+            extra={
+                "guild": guild_id,
+                "command": "schedule-send-all",
+                "duration": duration,
+            },
+        )
+        self.bot.config.get(guild_id, {}).pop("scheduled_send", None)
+        self.bot.save()
+
+        log_channel = self.bot.get_channel(
+            self.bot.config.get(guild_id, {}).get("log_channel_id")
+        )
+        if log_channel:
+            log_embed = discord.Embed(
+                title="Scheduled prompts sent.", color=discord.Color.green()
+            )
+            log_embed.add_field(
+                name="Prompt IDs",
+                value="\n".join(sent) or "None",
+                inline=True,
+            )
+            log_embed.add_field(
+                name="Prompt channels",
+                value="\n".join(
+                    sent_channels[prompt_id].mention
+                    for prompt_id in sent
+                    if prompt_id in sent_channels
+                )
+                or "None",
+                inline=True,
+            )
+            log_embed.add_field(
+                name="First to last district",
+                value=f"{skew * 1000:.0f}ms",
+                inline=False,
+            )
+            if problems:
+                log_embed.add_field(
+                    name="Problems", value="\n".join(problems)[:1024], inline=False
+                )
+            if guild.icon != None:
+                log_embed.set_thumbnail(url=f"{guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
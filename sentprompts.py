@@ -0,0 +1,336 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+import discord
+from promptrecord import PromptRecord
+from promptstore import save_guild
+from promptsender import send_prompt_message
+from utils import split_message
+
+logger = logging.getLogger(__name__)
+
+# Sent prompts remembered per guild; the oldest are forgotten first
+MAX_SENT = 500
+# Channels cleaned up at once by a retraction
+RETRACT_CONCURRENCY = 4
+# Bulk deletes take at most 100 messages, none older than 14 days. An hour
+# is kept in hand so a message does not age out mid-retraction.
+BULK_DELETE_LIMIT = 100
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14, hours=-1)
+
+
+class SentPrompts:
+    """
+    The messages each delivered prompt was sent as, so a sent prompt can be
+    corrected in place or retracted. One file per guild, read on first use:
+
+        {prompt_id: {"channel": id, "sent": time, "batch": str,
+                     "chunks": [{"id": id, "text": str, "webhook_id": id}],
+                     "files": [{"id": id, "name": str, "webhook_id": id}]}}
+
+    batch identifies the send-all a prompt went out in, None for
+    /send-prompt. webhook_id is set on messages sent through a webhook,
+    which only that webhook can edit.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._guilds = {}
+        self._locks = {}
+
+    def lock(self, guild_id) -> asyncio.Lock:
+        # Held while a guild's sent prompts are being edited or retracted
+        return self._locks.setdefault(guild_id, asyncio.Lock())
+
+    def guild(self, guild_id) -> dict:
+        if guild_id not in self._guilds:
+            path = os.path.join(self.directory, f"{guild_id}.json")
+            try:
+                with open(path, "r") as f:
+                    self._guilds[guild_id] = json.load(f)
+            except FileNotFoundError:
+                self._guilds[guild_id] = {}
+        return self._guilds[guild_id]
+
+    def get(self, guild_id, prompt_id) -> dict | None:
+        return self.guild(guild_id).get(prompt_id)
+
+    def record(self, guild_id, prompt_id, channel_id, chunks, files, batch=None):
+        """
+        Remembers a delivered prompt and saves the guild.
+
+        Args:
+            guild_id: The guild ID as a string
+            prompt_id: The prompt that was sent
+            channel_id: The channel it was sent to
+            chunks: {"id", "text", "webhook_id"} for each chunk, in order
+            files: {"id", "name", "webhook_id"} for each attachment, in order
+            batch: The send-all it was part of, if any
+        """
+        sent = self.guild(guild_id)
+        # Re-inserted so the dict stays oldest first
+        sent.pop(prompt_id, None)
+        sent[prompt_id] = {
+            "channel": channel_id,
+            "sent": time.time(),
+            "batch": batch,
+            "chunks": chunks,
+            "files": files,
+        }
+        for old_id in list(sent)[: max(0, len(sent) - MAX_SENT)]:
+            del sent[old_id]
+        self.save(guild_id)
+
+    def remove(self, guild_id, prompt_ids):
+        sent = self.guild(guild_id)
+        for prompt_id in prompt_ids:
+            sent.pop(prompt_id, None)
+        self.save(guild_id)
+
+    def latest_batch(self, guild_id) -> list[str]:
+        """Prompt IDs sent by the most recent send-all still remembered."""
+        sent = self.guild(guild_id)
+        batched = [entry for entry in sent.values() if entry.get("batch")]
+        if not batched:
+            return []
+        latest = max(batched, key=lambda entry: entry["sent"])["batch"]
+        return [
+            prompt_id
+            for prompt_id, entry in sent.items()
+            if entry.get("batch") == latest
+        ]
+
+    def save(self, guild_id):
+        save_guild(self.directory, guild_id, self.guild(guild_id))
+
+
+def sent_message(message, **fields) -> dict:
+    """
+    The entry SentPrompts keeps for a chunk or attachment message, with its
+    text= or file name=.
+    """
+    return {"id": message.id, "webhook_id": message.webhook_id, **fields}
+
+
+class EditPlan:
+    """The message edits, appends and deletes that turn one text into another."""
+
+    def __init__(self, edits, appends, deletes):
+        # (index, new text) of chunks whose text changed
+        self.edits = edits
+        # Texts of chunks to send after the last one
+        self.appends = appends
+        # Indexes of chunks no longer needed
+        self.deletes = deletes
+
+    def __len__(self):
+        return len(self.edits) + len(self.appends) + len(self.deletes)
+
+
+def plan_edit(chunks: list[dict], message: str) -> EditPlan:
+    """
+    Re-chunks a corrected prompt and compares it chunk by chunk with what
+    was sent. Unchanged chunks cost nothing.
+    """
+    new_chunks = split_message(message)
+    edits = [
+        (index, text)
+        for index, (chunk, text) in enumerate(zip(chunks, new_chunks))
+        if chunk["text"] != text
+    ]
+    return EditPlan(
+        edits,
+        new_chunks[len(chunks) :],
+        list(range(len(new_chunks), len(chunks))),
+    )
+
+
+async def apply_edit(bot, channel, guild_id, prompt_id, plan: EditPlan):
+    """
+    Applies an EditPlan to a sent prompt and records the result. Appended
+    chunks are sent through the same path as prompts, so they land after
+    the prompt's attachments.
+
+    Raises discord.HTTPException, and ValueError when a webhook message's
+    webhook is gone, to the caller, keeping whatever was done.
+    """
+    entry = bot.sent.get(guild_id, prompt_id)
+    chunks = entry["chunks"]
+    try:
+        for index, text in plan.edits:
+            chunk = chunks[index]
+            await _edit_message(bot, channel, chunk, text)
+            chunk["text"] = text
+        # From the end, so indexes stay valid
+        for index in reversed(plan.deletes):
+            chunk = chunks[index]
+            try:
+                # The bot can delete webhook messages with Manage Messages
+                await channel.get_partial_message(chunk["id"]).delete()
+            except discord.NotFound:
+                pass
+            del chunks[index]
+        for text in plan.appends:
+            message = await send_prompt_message(bot, channel, content=text)
+            chunks.append(sent_message(message, text=text))
+    finally:
+        bot.sent.save(guild_id)
+
+
+async def _edit_message(bot, channel, chunk, text):
+    if chunk["webhook_id"]:
+        webhook = await bot.webhooks.get(channel)
+        if not webhook or webhook.id != chunk["webhook_id"]:
+            raise ValueError(
+                "The webhook that sent this prompt no longer exists, so it "
+                "cannot be edited."
+            )
+        await webhook.edit_message(chunk["id"], content=text)
+    else:
+        await channel.get_partial_message(chunk["id"]).edit(content=text)
+
+
+async def _delete_messages(channel, message_ids):
+    """Deletes messages from one channel, up to 100 per request where it can."""
+    cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    recent = [
+        message_id
+        for message_id in message_ids
+        if discord.utils.snowflake_time(message_id) > cutoff
+    ]
+    single = [message_id for message_id in message_ids if message_id not in recent]
+    for start in range(0, len(recent), BULK_DELETE_LIMIT):
+        batch = recent[start : start + BULK_DELETE_LIMIT]
+        try:
+            await channel.delete_messages(
+                [discord.Object(message_id) for message_id in batch],
+                reason="Prompt retracted",
+            )
+        except discord.NotFound:
+            # A batch of one is a single delete
+            pass
+        except discord.Forbidden:
+            raise
+        except discord.HTTPException:
+            # e.g. a message was already deleted by hand
+            single.extend(batch)
+    for message_id in single:
+        try:
+            await channel.get_partial_message(message_id).delete()
+        except discord.NotFound:
+            pass
+
+
+async def _save_files(channel, entry, file_dir) -> list[str]:
+    """Downloads a sent prompt's attachments back into its file directory."""
+    names = []
+    for file in entry["files"]:
+        try:
+            message = await channel.fetch_message(file["id"])
+        except discord.NotFound:
+            continue
+        if message.attachments:
+            os.makedirs(file_dir, exist_ok=True)
+            await message.attachments[0].save(os.path.join(file_dir, file["name"]))
+            names.append(file["name"])
+    return names
+
+
+async def retract_prompts(bot, guild, guild_id, prompt_ids):
+    """
+    Deletes sent prompts' messages and puts the prompts back so they can be
+    sent again, with any edits made since they were sent.
+
+    Messages are deleted per channel in bulk, several channels at a time.
+    Attachments are downloaded before their messages are deleted, since
+    the files were removed from disk when they were sent. A prompt saved
+    again under the same ID since is kept rather than replaced.
+
+    Args:
+        bot: The bot instance
+        guild: The guild the prompts were sent in
+        guild_id: The guild ID as a string
+        prompt_ids: Sent prompts to retract
+
+    Returns:
+        (restored, kept, failed) lists of prompt IDs
+    """
+    sent = bot.sent.guild(guild_id)
+    saved = bot.state.snapshot(guild_id)
+    file_dir = os.path.join(bot.prompt_image_dir, guild_id)
+    by_channel = {}
+    for prompt_id in prompt_ids:
+        if prompt_id in sent:
+            by_channel.setdefault(sent[prompt_id]["channel"], []).append(prompt_id)
+
+    semaphore = asyncio.Semaphore(RETRACT_CONCURRENCY)
+    files = {}
+    failed = []
+
+    async def retract_channel(channel_id, channel_prompt_ids):
+        channel = guild.get_channel(channel_id)
+        if not channel:
+            failed.extend(channel_prompt_ids)
+            return
+        async with semaphore:
+            try:
+                for prompt_id in channel_prompt_ids:
+                    if prompt_id not in saved:
+                        files[prompt_id] = await _save_files(
+                            channel, sent[prompt_id], file_dir
+                        )
+                await _delete_messages(
+                    channel,
+                    [
+                        message["id"]
+                        for prompt_id in channel_prompt_ids
+                        for message in sent[prompt_id]["chunks"]
+                        + sent[prompt_id]["files"]
+                    ],
+                )
+            except discord.HTTPException as e:
+                logger.warning(
+                    "Failed to retract prompts from %s: %s",
+                    channel.name,
+                    e,
+                    extra={"guild": guild_id},
+                )
+                for prompt_id in channel_prompt_ids:
+                    files.pop(prompt_id, None)
+                failed.extend(channel_prompt_ids)
+
+    await asyncio.gather(
+        *(
+            retract_channel(channel_id, channel_prompt_ids)
+            for channel_id, channel_prompt_ids in by_channel.items()
+        )
+    )
+
+    retracted = [
+        prompt_id
+        for channel_prompt_ids in by_channel.values()
+        for prompt_id in channel_prompt_ids
+        if prompt_id not in failed
+    ]
+    restored = []
+    kept = []
+    async with bot.state.write(guild_id) as prompts:
+        for prompt_id in retracted:
+            entry = sent[prompt_id]
+            if prompt_id in prompts or prompt_id not in files:
+                kept.append(prompt_id)
+                continue
+            record = PromptRecord(
+                prompt_id,
+                entry["channel"],
+                "".join(chunk["text"] for chunk in entry["chunks"]),
+                tuple(files[prompt_id]),
+            )
+            prompts[prompt_id] = record
+            bot.search.update(guild_id, record)
+            restored.append(prompt_id)
+    bot.sent.remove(guild_id, retracted)
+    return restored, kept, failed
@@ -0,0 +1,308 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from commandutils import deferred
+from typing import Literal, Optional
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsCommands(commands.Cog):
+    """Per-server settings: log channel, prompt category, game, delivery and tribute role."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(
+        name="set-log-channel", description="Sets the channel for logs to be sent to"
+    )
+    @deferred
+    async def set_log_channel(
+        self,
+        interaction: discord.Interaction,
+        channel_id: Optional[str],
+        channel_name: Optional[str],
+    ):
+        guild_id = str(interaction.guild.id)
+        sent = False
+        # Allows setting of log channel by channel id
+        if channel_id:
+            channel_id = channel_id.strip()
+            if any(channel.id == int(channel_id) for channel in interaction.guild.channels):
+                self.bot.config[guild_id]["log_channel_id"] = int(channel_id)
+                log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+                self.bot.save()
+                try:
+                    await interaction.followup.send(
+                        f'Log channel set to <#{self.bot.config[guild_id]["log_channel_id"]}>',
+                        ephemeral=True,
+                    )
+                    log_embed = discord.Embed(
+                        title=f'**Log channel set to <#{self.bot.config[guild_id]["log_channel_id"]}>**\n',
+                        color=discord.Color.green(),
+                    )
+                    log_embed.set_author(
+                        name=f"{interaction.user.name}",
+                        icon_url=f"{interaction.user.avatar}",
+                    )
+                    if interaction.guild.icon != None:
+                        log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+                    log_embed.timestamp = datetime.datetime.now()
+                    await log_channel.send(embed=log_embed)
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set log channel",
+                        extra={"guild": guild_id, "command": "set-log-channel"},
+                    )
+            else:
+                try:
+                    await interaction.followup.send(
+                        "Channel not found", ephemeral=True
+                    )
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set log channel",
+                        extra={"guild": guild_id, "command": "set-log-channel"},
+                    )
+        # Allows setting of log channel by channel name
+        elif channel_name:
+            channel_name = channel_name.strip()
+            for channel in interaction.guild.channels:
+                if channel_name.lower() == channel.name.lower():
+                    self.bot.config[guild_id]["log_channel_id"] = channel.id
+                    log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+                    try:
+                        await interaction.followup.send(
+                            f'Log channel set to <#{self.bot.config[guild_id]["log_channel_id"]}>',
+                            ephemeral=True,
+                        )
+                    except Exception as e:
+                        await interaction.followup.send(
+                            "An error occured. Please try again.", ephemeral=True
+                        )
+                        logger.exception(
+                            "Failed to set log channel",
+                            extra={"guild": guild_id, "command": "set-log-channel"},
+                        )
+                    self.bot.save()
+                    sent = True
+                    break
+            log_embed = discord.Embed(
+                title=f'**Log channel set to <#{self.bot.config[guild_id]["log_channel_id"]}>**\n',
+                color=discord.Color.green(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            if not sent:
+                try:
+                    await interaction.followup.send(
+                        "Channel not found", ephemeral=True
+                    )
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set log channel",
+                        extra={"guild": guild_id, "command": "set-log-channel"},
+                    )
+            else:
+                await log_channel.send(embed=log_embed)
+        else:
+            try:
+                await interaction.followup.send(
+                    "Provide an argument", ephemeral=True
+                )
+            except Exception as e:
+                await interaction.followup.send(
+                    "An error occured. Please try again.", ephemeral=True
+                )
+                logger.exception(
+                    "Failed to set log channel",
+                    extra={"guild": guild_id, "command": "set-log-channel"},
+                )
+
+    @app_commands.command(
+        name="set-category", description="Sets the category for prompts to be sent to"
+    )
+    @deferred
+    async def set_category(
+        self,
+        interaction: discord.Interaction,
+        category_id: Optional[str],
+        category_name: Optional[str],
+    ):
+        guild_id = str(interaction.guild.id)
+        sent = False
+        # Allows setting of category by category id
+        if category_id:
+            category_id = category_id.strip()
+            if any(
+                category.id == int(category_id) for category in interaction.guild.categories
+            ):
+                self.bot.config[guild_id]["category_id"] = int(category_id)
+                log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+                self.bot.save()
+                try:
+                    await interaction.followup.send(
+                        f'Prompt category set to <#{self.bot.config[guild_id]["category_id"]}>',
+                        ephemeral=True,
+                    )
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set category",
+                        extra={"guild": guild_id, "command": "set-category"},
+                    )
+                if self.bot.config[guild_id]["log_channel_id"]:
+                    log_embed = discord.Embed(
+                        title=f"**Prompt category set to <#{self.bot.config[guild_id]['category_id']}>**\n",
+                        color=discord.Color.green(),
+                    )
+                    log_embed.set_author(
+                        name=f"{interaction.user.name}",
+                        icon_url=f"{interaction.user.avatar}",
+                    )
+                    if interaction.guild.icon != None:
+                        log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+                    log_embed.timestamp = datetime.datetime.now()
+                    await log_channel.send(embed=log_embed)
+            else:
+                try:
+                    await interaction.followup.send(
+                        "Category not found", ephemeral=True
+                    )
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set category",
+                        extra={"guild": guild_id, "command": "set-category"},
+                    )
+        # Allows setting of category by category name
+        elif category_name:
+            category_name = category_name.strip()
+            for category in interaction.guild.categories:
+                if category_name.lower() == category.name.lower():
+                    self.bot.config[guild_id]["category_id"] = category.id
+                    log_channel = self.bot.get_channel(self.bot.config[guild_id]["log_channel_id"])
+                    self.bot.save()
+                    try:
+                        await interaction.followup.send(
+                            f'Prompt category set to <#{self.bot.config[guild_id]["category_id"]}>',
+                            ephemeral=True,
+                        )
+                    except Exception as e:
+                        await interaction.followup.send(
+                            "An error occured. Please try again.", ephemeral=True
+                        )
+                        logger.exception(
+                            "Failed to set category",
+                            extra={"guild": guild_id, "command": "set-category"},
+                        )
+                    sent = True
+                    break
+            log_embed = discord.Embed(
+                title=f"**Prompt category set to <#{self.bot.config[guild_id]['category_id']}>**\n",
+                color=discord.Color.green(),
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            if not sent:
+                try:
+                    await interaction.followup.send(
+                        "Category not found", ephemeral=True
+                    )
+                except Exception as e:
+                    await interaction.followup.send(
+                        "An error occured. Please try again.", ephemeral=True
+                    )
+                    logger.exception(
+                        "Failed to set category",
+                        extra={"guild": guild_id, "command": "set-category"},
+                    )
+            else:
+                await log_channel.send(embed=log_embed)
+
+    @app_commands.command(
+        name="set-game", description="Sets the game name sent and cleared prompts are archived under"
+    )
+    async def set_game(self, interaction: discord.Interaction, name: str):
+        guild_id = str(interaction.guild.id)
+        self.bot.config.setdefault(guild_id, {})["game"] = name.strip()
+        self.bot.save()
+        await interaction.response.send_message(
+            f"Prompts will be archived under the game **{name.strip()}**.", ephemeral=True
+        )
+
+    @app_commands.command(
+        name="set-delivery", description="Sets whether prompts are sent by the bot or by webhooks"
+    )
+    @app_commands.describe(
+        mode="webhook sends prompts through a webhook in each district channel"
+    )
+    async def set_delivery(
+        self, interaction: discord.Interaction, mode: Literal["bot", "webhook"]
+    ):
+        guild_id = str(interaction.guild.id)
+        await interaction.response.defer(ephemeral=True)
+        self.bot.config.setdefault(guild_id, {})["delivery"] = mode
+        self.bot.save(guild_id)
+        if mode == "bot":
+            await interaction.followup.send(
+                "Prompts will be sent by the bot.", ephemeral=True
+            )
+            return
+
+        # Webhooks are set up now so problems show before the next send
+        missing = []
+        for channel in interaction.guild.text_channels:
+            if (
+                channel.category_id == self.bot.config[guild_id].get("category_id")
+                and "district-" in channel.name
+                and not await self.bot.webhooks.get(channel)
+            ):
+                missing.append(channel.mention)
+        message = "Prompts will be sent through webhooks."
+        if missing:
+            message += (
+                " These channels have no webhook, so the bot sends to them"
+                " instead. Give the bot Manage Webhooks there to fix it: "
+                + ", ".join(missing)
+            )
+        await interaction.followup.send(message[:2000], ephemeral=True)
+
+    @app_commands.command(
+        name="set-tribute-role", description="Sets the role districts are hidden from during a reveal"
+    )
+    async def set_tribute_role(self, interaction: discord.Interaction, role: discord.Role):
+        guild_id = str(interaction.guild.id)
+        self.bot.config.setdefault(guild_id, {})["tribute_role_id"] = role.id
+        self.bot.save(guild_id)
+        await interaction.response.send_message(
+            f"Reveal-mode send-alls will hide the districts from {role.mention}.",
+            ephemeral=True,
+        )
+
+
+async def setup(bot):
+    await bot.add_cog(SettingsCommands(bot))
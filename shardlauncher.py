@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before restarting a shard process that exited
+RESTART_DELAY = 10
+
+
+def parse_shard_ids(spec: str) -> list[int]:
+    """
+    Parses a shard ID spec such as "0-3", "4,5,6" or "0-1,4".
+
+    Returns:
+        Sorted list of shard IDs
+    """
+    shard_ids = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.update(range(int(start), int(end) + 1))
+        else:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+def shard_settings_from_env() -> tuple[int | None, list[int] | None]:
+    """
+    Reads SHARD_COUNT and SHARD_IDS.
+
+    Returns:
+        (shard_count, shard_ids). Both are None when this process should run
+        every shard itself.
+    """
+    shard_count = os.environ.get("SHARD_COUNT")
+    shard_ids = os.environ.get("SHARD_IDS")
+    if not shard_count:
+        return None, None
+    if not shard_ids:
+        return int(shard_count), None
+    return int(shard_count), parse_shard_ids(shard_ids)
+
+
+def shard_for_guild(guild_id, shard_count: int) -> int:
+    """Discord's guild to shard mapping."""
+    return (int(guild_id) >> 22) % shard_count
+
+
+def recommended_shard_count(token: str) -> int:
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={
+            "Authorization": f"Bot {token}",
+            "User-Agent": "DiscordBot (thgbot, 1.0)",
+        },
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def shard_ranges(shard_count: int, processes: int) -> list[list[int]]:
+    """Splits shards into contiguous ranges, one per process."""
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def main():
+    """
+    Runs thgbot.py in SHARD_PROCESSES processes, each owning a contiguous
+    range of shards, and restarts any process that exits.
+    """
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    processes = int(os.environ.get("SHARD_PROCESSES") or 1)
+    shard_count = os.environ.get("SHARD_COUNT")
+    shard_count = (
+        int(shard_count)
+        if shard_count
+        else recommended_shard_count(os.environ["TOKEN"])
+    )
+    bot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thgbot.py")
+
+    def start(shard_ids):
+        env = dict(
+            os.environ,
+            SHARD_COUNT=str(shard_count),
+            SHARD_IDS=f"{shard_ids[0]}-{shard_ids[-1]}",
+        )
+        logger.info("Starting shards %s of %d", env["SHARD_IDS"], shard_count)
+        return subprocess.Popen([sys.executable, bot_path, *sys.argv[1:]], env=env)
+
+    children = {tuple(ids): start(ids) for ids in shard_ranges(shard_count, processes)}
+
+    def stop(signum, frame):
+        for child in children.values():
+            child.terminate()
+        for child in children.values():
+            child.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while True:
+        time.sleep(1)
+        for shard_ids, child in list(children.items()):
+            if child.poll() is None:
+                continue
+            logger.warning(
+                "Shards %d-%d exited with %s, restarting in %ds",
+                shard_ids[0],
+                shard_ids[-1],
+                child.returncode,
+                RESTART_DELAY,
+            )
+            time.sleep(RESTART_DELAY)
+            children[shard_ids] = start(list(shard_ids))
+
+
+if __name__ == "__main__":
+    main()
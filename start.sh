@@ -9,4 +9,43 @@ if [ -z "$TOKEN" ]; then
 fi
 
 export TOKEN
+
+# Optional logging settings, e.g. snap set thg-discord-bot log-levels="promptmodal=DEBUG"
+export LOG_LEVEL=$(snapctl get log-level)
+export LOG_LEVELS=$(snapctl get log-levels)
+export LOG_FILE=$(snapctl get log-file)
+
+# Event loop stall detection, e.g. snap set thg-discord-bot stall-watchdog=true
+export STALL_WATCHDOG=$(snapctl get stall-watchdog)
+export STALL_THRESHOLD_MS=$(snapctl get stall-threshold-ms)
+
+# Traffic capture for trafficreplay.py, e.g. snap set thg-discord-bot capture-file=/var/snap/thg-discord-bot/current/session.jsonl.gz
+export CAPTURE_FILE=$(snapctl get capture-file)
+
+# Trimmed intents and caches, e.g. snap set thg-discord-bot low-memory=true
+export LOW_MEMORY=$(snapctl get low-memory)
+
+# Default per-server quotas, e.g. snap set thg-discord-bot quota-commands-per-minute=30.
+# 0 turns a limit off; thg-discord-bot.admin set-quota overrides them per server.
+export QUOTA_MAX_PROMPTS=$(snapctl get quota-max-prompts)
+export QUOTA_MAX_MIB=$(snapctl get quota-max-mib)
+export QUOTA_COMMANDS_PER_MINUTE=$(snapctl get quota-commands-per-minute)
+
+# Processes that resize and thumbnail uploads, e.g. snap set thg-discord-bot media-workers=2
+export MEDIA_WORKERS=$(snapctl get media-workers)
+
+# Sender worker processes that deliver prompts off the gateway process, e.g.
+# snap set thg-discord-bot sender-workers=2, then snap restart thg-discord-bot
+export SENDER_WORKERS=$(snapctl get sender-workers)
+
+# Sharding, e.g. snap set thg-discord-bot shard-processes=4 shard-count=8.
+# shard-count defaults to Discord's recommendation when unset.
+export SHARD_COUNT=$(snapctl get shard-count)
+SHARD_PROCESSES=$(snapctl get shard-processes)
+
+if [ -n "$SHARD_PROCESSES" ] && [ "$SHARD_PROCESSES" -gt 1 ]; then
+    export SHARD_PROCESSES
+    exec python3 $SNAP/bin/shardlauncher.py "$@"
+fi
+
 python3 $SNAP/bin/thgbot.py "$@"
@@ -0,0 +1,272 @@
+import discord
+from discord import app_commands
+from discord.ext import commands
+from commandutils import deferred
+from promptbundle import valid_prompt_id
+from promptrecord import PromptRecord
+from prompttemplates import (
+    Template,
+    TemplateError,
+    district_values,
+    read_values,
+    template_name,
+)
+from templatemodal import TemplateModal
+from utils import split_message
+from typing import Optional
+import csv
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Largest template or values file accepted as an upload
+MAX_UPLOAD_BYTES = 256 * 1024
+
+
+class TemplateCommands(commands.Cog):
+    """Prompt templates rendered for every district at once."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(
+        name="save-template", description="Writes or changes a prompt template"
+    )
+    @app_commands.describe(
+        name="Name to save the template as, e.g. arena-intro",
+        file="A .txt or .md template, for templates too long for the form",
+    )
+    async def save_template(
+        self,
+        interaction: discord.Interaction,
+        name: str,
+        file: Optional[discord.Attachment] = None,
+    ):
+        guild_id = str(interaction.guild.id)
+        normalised = template_name(name)
+        if not normalised:
+            await interaction.response.send_message(
+                "Template names are up to 32 letters, digits, - and _.",
+                ephemeral=True,
+            )
+            return
+
+        async def on_text(interaction, source):
+            try:
+                template = self.bot.templates.save(guild_id, normalised, source)
+            except TemplateError as e:
+                await interaction.response.send_message(
+                    f"Template not saved: {e}.", ephemeral=True
+                )
+                return
+            logger.info(
+                "Saved template %s",
+                normalised,
+                extra={"guild": guild_id, "command": "save-template"},
+            )
+            names = ", ".join(sorted(template.names)) or "none"
+            await interaction.response.send_message(
+                f"Template `{normalised}` saved. Values it uses: {names}"[:2000],
+                ephemeral=True,
+            )
+
+        if not file:
+            entry = self.bot.templates.guild(guild_id).get(normalised)
+            await interaction.response.send_modal(
+                TemplateModal(normalised, entry["source"] if entry else "", on_text)
+            )
+            return
+        if not file.filename.lower().endswith((".txt", ".md")):
+            await interaction.response.send_message(
+                "Please upload a .txt or .md file.", ephemeral=True
+            )
+            return
+        if file.size > MAX_UPLOAD_BYTES:
+            await interaction.response.send_message(
+                f"Templates can be up to {MAX_UPLOAD_BYTES // 1024} KiB.",
+                ephemeral=True,
+            )
+            return
+        try:
+            source = (await file.read()).decode("utf-8-sig")
+        except UnicodeDecodeError:
+            await interaction.response.send_message(
+                "The template must be UTF-8 text.", ephemeral=True
+            )
+            return
+        await on_text(interaction, source)
+
+    @app_commands.command(
+        name="render-template",
+        description="Saves a template as a prompt for every district channel",
+    )
+    @app_commands.describe(
+        name="The template to render",
+        prompt_id="ID for each district's prompt, e.g. D{{district}}F",
+        values="A .csv or .json of each district's values, e.g. tribute names",
+        replace="Replace prompts that already exist, keeping their files",
+    )
+    @deferred
+    async def render_template(
+        self,
+        interaction: discord.Interaction,
+        name: str,
+        prompt_id: str = "D{{district}}",
+        values: Optional[discord.Attachment] = None,
+        replace: bool = False,
+    ):
+        guild_id = str(interaction.guild.id)
+        normalised = template_name(name) or ""
+        template = self.bot.templates.get(guild_id, normalised)
+        if not template:
+            await interaction.followup.send(
+                f"There is no template named `{name}`.", ephemeral=True
+            )
+            return
+        try:
+            id_template = Template(prompt_id.upper().strip().replace(" ", "_"))
+        except TemplateError as e:
+            await interaction.followup.send(f"Bad prompt_id: {e}.", ephemeral=True)
+            return
+
+        rows = {}
+        if values:
+            if values.size > MAX_UPLOAD_BYTES:
+                await interaction.followup.send(
+                    f"Values files can be up to {MAX_UPLOAD_BYTES // 1024} KiB.",
+                    ephemeral=True,
+                )
+                return
+            try:
+                rows = read_values(await values.read(), values.filename)
+            except (ValueError, csv.Error) as e:
+                await interaction.followup.send(
+                    f"Nothing was rendered. {e}"[:2000], ephemeral=True
+                )
+                return
+
+        # The same channels PromptModal offers
+        channels = sorted(
+            (
+                channel
+                for channel in interaction.guild.text_channels
+                if channel.category_id == self.bot.config[guild_id].get("category_id")
+                and "district-" in channel.name
+            ),
+            key=lambda channel: channel.position,
+        )
+        if not channels:
+            await interaction.followup.send(
+                "No district channels found in the configured category.",
+                ephemeral=True,
+            )
+            return
+
+        # Every district is rendered before anything is saved, so a bad
+        # value never leaves half the districts changed
+        rendered = {}
+        errors = []
+        used = set()
+        for channel in channels:
+            district = district_values(channel)
+            key = district["district"] if district["district"] in rows else channel.name
+            used.add(key)
+            district.update(rows.get(key, {}))
+            try:
+                new_id = id_template.render(district).upper().replace(" ", "_")
+                text = template.render(district)
+            except TemplateError as e:
+                errors.append(f"{channel.name}: {e}")
+                continue
+            if not valid_prompt_id(new_id):
+                errors.append(f"{channel.name}: {new_id} is not a valid prompt ID")
+            elif new_id in rendered:
+                errors.append(f"{channel.name}: {new_id} is used by two districts")
+            elif not text.strip():
+                errors.append(f"{channel.name}: the prompt is empty")
+            else:
+                rendered[new_id] = (channel, text)
+        errors.extend(
+            f"District {key} has values but no channel" for key in rows.keys() - used
+        )
+        if errors:
+            message = "\n".join(errors[:15])
+            if len(errors) > 15:
+                message += f"\n...and {len(errors) - 15} more"
+            await interaction.followup.send(
+                f"Nothing was rendered.\n{message}"[:2000], ephemeral=True
+            )
+            return
+
+        saved = self.bot.state.snapshot(guild_id)
+        existing = [new_id for new_id in rendered if new_id in saved]
+        if existing and not replace:
+            await interaction.followup.send(
+                f"Nothing was rendered. These prompts already exist: "
+                f"{', '.join(existing)}. Use replace to overwrite them."[:2000],
+                ephemeral=True,
+            )
+            return
+        over_quota = self.bot.quotas.check_storage(
+            guild_id,
+            new_prompts=len(rendered) - len(existing),
+            new_bytes=sum(len(text.encode()) for _, text in rendered.values()),
+        )
+        if over_quota:
+            await interaction.followup.send(
+                f"Nothing was rendered. {over_quota}", ephemeral=True
+            )
+            return
+
+        # Chunked now to report how the prompts will go out; the sender
+        # chunks the saved text the same way
+        chunks = sum(len(split_message(text)) for _, text in rendered.values())
+        async with self.bot.state.write(guild_id) as prompts:
+            records = {}
+            for new_id, (channel, text) in rendered.items():
+                old = prompts.get(new_id)
+                records[new_id] = PromptRecord(
+                    new_id,
+                    channel.id,
+                    text,
+                    old.attachments if old else (),
+                    old.created if old else None,
+                    updated=time.time(),
+                )
+            prompts.update(records)
+        for record in records.values():
+            self.bot.search.update(guild_id, record)
+        logger.info(
+            "Rendered template %s as %d prompts",
+            normalised,
+            len(records),
+            extra={"guild": guild_id, "command": "render-template"},
+        )
+        await interaction.followup.send(
+            f"Saved {len(records)} prompts from `{normalised}` "
+            f"({len(existing)} replaced), {chunks} messages when sent.",
+            ephemeral=True,
+        )
+
+        log_channel = self.bot.get_channel(self.bot.config[guild_id].get("log_channel_id"))
+        if log_channel:
+            log_embed = discord.Embed(
+                title=f"{len(records)} prompts rendered from {normalised}.",
+                color=discord.Color.green(),
+            )
+            log_embed.add_field(
+                name="Prompt IDs", value=f"**{"\n".join(records)}**"[:1024]
+            )
+            log_embed.set_author(
+                name=f"{interaction.user.name}", icon_url=f"{interaction.user.avatar}"
+            )
+            if interaction.guild.icon != None:
+                log_embed.set_thumbnail(url=f"{interaction.guild.icon.url}")
+            log_embed.timestamp = datetime.datetime.now()
+            await log_channel.send(embed=log_embed)
+
+
+async def setup(bot):
+    await bot.add_cog(TemplateCommands(bot))
@@ -0,0 +1,27 @@
+import discord
+import logging
+from editpromptmodal import MODAL_TEXT_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+# Modal for writing a prompt template, prefilled with the saved one when
+# it is being changed. The text is handed to on_text, which compiles and
+# saves it.
+class TemplateModal(discord.ui.Modal):
+    def __init__(self, name: str, source: str, on_text) -> None:
+        super().__init__(title=f"Template {name}"[:45])
+        self.on_text = on_text
+        self.add_item(
+            discord.ui.TextInput(
+                label="Template",
+                placeholder="District {{district}}... {{#equipped}}EQUIPPED: {{equipped}}{{/equipped}}",
+                default=source or None,
+                custom_id="template",
+                style=discord.TextStyle.paragraph,
+                max_length=MODAL_TEXT_LIMIT,
+            )
+        )
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await self.on_text(interaction, self.children[0].value)
@@ -0,0 +1,283 @@
+import contextvars
+import gzip
+import json
+import logging
+import os
+import time
+import discord
+from discord.webhook.async_ import async_context
+
+logger = logging.getLogger(__name__)
+
+# Version of the capture file layout, written in its first line
+CAPTURE_VERSION = 1
+# Events held in memory before they are written out
+FLUSH_EVERY = 256
+# Interaction types worth telling apart in a capture
+INTERACTION_KINDS = {
+    discord.InteractionType.application_command: "command",
+    discord.InteractionType.component: "component",
+    discord.InteractionType.modal_submit: "modal",
+    discord.InteractionType.autocomplete: "autocomplete",
+}
+
+# The app command a REST call was made for, if any
+current_command = contextvars.ContextVar("current_command", default=None)
+
+
+class TrafficCapture:
+    """
+    Records the shape of a session's traffic for trafficreplay.py: every
+    interaction the bot receives and every REST call it makes, with when
+    each happened and how long it took. Nothing a player wrote is kept.
+    IDs are replaced with small per-capture numbers, which still tell
+    channels apart for rate limiting, and text is reduced to its length.
+    Interaction and webhook tokens are not recorded at all.
+
+    The file is gzipped JSON lines, one event per line:
+
+        {"e": "start", "v": 1, "time": unix time}
+        {"e": "interaction", "t": s, "k": kind, "c": command, "g": guild,
+         "o": [[option, type, length]], "i": component's position}
+        {"e": "completion", "t": s, "c": command, "d": s}
+        {"e": "call", "t": s, "m": method, "r": route, "p": {param: n},
+         "w": via the webhook adapter, "s": status, "d": s, "b": bytes,
+         "f": files, "c": command}
+
+    t is seconds since the capture started. REST calls made while an app
+    command runs, including in its deferred job, carry the command's name.
+    A deferred command completes when its job finishes, not at the defer.
+    i is the position of the button or menu used among the message's
+    components.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.perf_counter()
+        self._ids = {}
+        self._events = []
+        self._write(
+            {"e": "start", "v": CAPTURE_VERSION, "time": time.time()}, flush=True
+        )
+
+    def install(self, bot):
+        """Starts capturing a bot's interactions and REST calls."""
+        http_request = bot.http.request
+        adapter = async_context.get()
+        webhook_request = adapter.request
+
+        async def captured_http_request(route, *, files=None, form=None, **kwargs):
+            with self._call(route, kwargs.get("json"), files or form):
+                return await http_request(route, files=files, form=form, **kwargs)
+
+        async def captured_webhook_request(route, session, *, payload=None, **kwargs):
+            with self._call(
+                route, payload, kwargs.get("files") or kwargs.get("multipart"), True
+            ):
+                return await webhook_request(route, session, payload=payload, **kwargs)
+
+        tree_check = bot.tree.interaction_check
+
+        async def interaction_check(interaction):
+            # Runs in the command's task, so calls it makes inherit the name
+            current_command.set(_command_name(interaction.data or {}))
+            return await tree_check(interaction)
+
+        bot.http.request = captured_http_request
+        # Interaction responses and followups go through the webhook adapter
+        adapter.request = captured_webhook_request
+        bot.tree.interaction_check = interaction_check
+        bot.add_listener(self.on_interaction, "on_interaction")
+        bot.add_listener(self.on_app_command_completion, "on_app_command_completion")
+        bot.add_listener(
+            self.on_deferred_command_completion, "on_deferred_command_completion"
+        )
+        logger.info("Capturing traffic to %s", self.path)
+
+    def now(self) -> float:
+        return round(time.perf_counter() - self.started, 4)
+
+    def anonymise(self, value) -> int:
+        # Numbered in order of first use, so captures compare across guilds
+        return self._ids.setdefault(str(value), len(self._ids) + 1)
+
+    def _call(self, route, payload, files, webhook=False):
+        return _CapturedCall(self, route, payload, files, webhook)
+
+    async def on_interaction(self, interaction: discord.Interaction):
+        data = interaction.data or {}
+        event = {
+            "e": "interaction",
+            "t": self.now(),
+            "k": INTERACTION_KINDS.get(interaction.type, "other"),
+            "c": _command_name(data)
+            if interaction.type == discord.InteractionType.application_command
+            else None,
+            "g": self.anonymise(interaction.guild_id)
+            if interaction.guild_id
+            else None,
+            "o": _redact_options(data),
+        }
+        if (
+            interaction.type == discord.InteractionType.component
+            and interaction.message
+        ):
+            event["i"] = _component_position(interaction.message, data.get("custom_id"))
+        self._write(event)
+
+    async def on_app_command_completion(self, interaction, command):
+        # Deferred commands are recorded when their job finishes instead
+        if not getattr(command.callback, "deferred", False):
+            await self.on_deferred_command_completion(interaction, command)
+
+    async def on_deferred_command_completion(self, interaction, command):
+        self._write(
+            {
+                "e": "completion",
+                "t": self.now(),
+                "c": command.qualified_name,
+                "d": round(
+                    (discord.utils.utcnow() - interaction.created_at).total_seconds(),
+                    4,
+                ),
+            }
+        )
+
+    def _write(self, event, flush=False):
+        self._events.append(event)
+        if flush or len(self._events) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if not self._events:
+            return
+        lines = "".join(
+            json.dumps(event, separators=(",", ":")) + "\n" for event in self._events
+        )
+        self._events = []
+        try:
+            # Each flush appends a gzip member; readers see one stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError:
+            logger.exception("Failed to write traffic capture")
+
+    def close(self):
+        self.flush()
+
+
+class _CapturedCall:
+    """Times one REST call and records it when it finishes."""
+
+    def __init__(self, capture, route, payload, files, webhook):
+        self.capture = capture
+        self.route = route
+        self.payload = payload
+        self.files = files
+        self.webhook = webhook
+
+    def __enter__(self):
+        self.t = self.capture.now()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        route = self.route
+        if exc is None:
+            status = 200
+        elif isinstance(exc, discord.HTTPException):
+            status = exc.status
+        else:
+            # Connection errors and cancellations never got a status
+            status = 0
+        event = {
+            "e": "call",
+            "t": self.t,
+            "m": route.method,
+            "r": route.path,
+            "p": {
+                name: self.capture.anonymise(value)
+                for name, value in _route_parameters(route).items()
+                # Tokens are credentials, and unique per interaction
+                if not name.endswith("token")
+            },
+            "s": status,
+            "d": round(time.perf_counter() - self.started, 4),
+            "b": len(json.dumps(self.payload)) if self.payload else 0,
+            "f": len(self.files) if self.files else 0,
+            "c": current_command.get(),
+        }
+        if self.webhook:
+            event["w"] = True
+        self.capture._write(event)
+        return False
+
+
+def _route_parameters(route) -> dict:
+    # Only the template is kept on the Route, so the values are read back
+    # out of the URL it was formatted into
+    values = route.url[len(route.BASE) :].split("/")
+    return {
+        part[1:-1]: value
+        for part, value in zip(route.path.split("/"), values)
+        if part.startswith("{")
+    }
+
+
+def _component_position(message, custom_id) -> int | None:
+    position = 0
+    for row in message.components:
+        for component in getattr(row, "children", [row]):
+            if getattr(component, "custom_id", None) == custom_id:
+                return position
+            position += 1
+    return None
+
+
+def _command_name(data) -> str:
+    name = [data.get("name", "")]
+    options = data.get("options") or []
+    # Subcommands and groups arrive as the only option, nested
+    while options and options[0].get("type") in (1, 2):
+        name.append(options[0]["name"])
+        options = options[0].get("options") or []
+    return " ".join(name)
+
+
+def _redact_options(data) -> list:
+    """Option names, types and lengths, with every value dropped."""
+    options = data.get("options") or []
+    while options and options[0].get("type") in (1, 2):
+        options = options[0].get("options") or []
+    attachments = (data.get("resolved") or {}).get("attachments") or {}
+    redacted = []
+    for option in options:
+        value = option.get("value")
+        if option.get("type") == 11:
+            # Attachments are measured by their size
+            length = attachments.get(str(value), {}).get("size", 0)
+        else:
+            length = len(str(value)) if value is not None else 0
+        redacted.append([option["name"], option.get("type"), length])
+    # Modal text inputs and select menu choices
+    for row in data.get("components") or []:
+        for component in row.get("components") or []:
+            redacted.append(
+                [None, component.get("type"), len(component.get("value") or "")]
+            )
+    if "values" in data:
+        redacted.append([None, data.get("component_type"), len(data["values"])])
+    return redacted
+
+
+def capture_from_env() -> TrafficCapture | None:
+    """
+    Builds a capture from CAPTURE_FILE, the path to append to.
+
+    Returns:
+        A TrafficCapture if CAPTURE_FILE is set, None otherwise
+    """
+    path = os.environ.get("CAPTURE_FILE")
+    if not path:
+        return None
+    return TrafficCapture(path)
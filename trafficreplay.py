@@ -0,0 +1,911 @@
+# Replays traffic captured with CAPTURE_FILE (see trafficcapture.py)
+# through this revision of the bot, against a local stub of Discord's
+# HTTP API, at the captured pace or faster, and compares captures made
+# with different bot revisions.
+#
+# A replay runs a THGBot whose REST calls go to the stub and feeds it the
+# captured interactions, so this revision's own command handlers decide
+# which calls are made. The stub answers each call after the time calls
+# to its route took when captured. Captures keep no option values or
+# text, so they are made up at the captured lengths, and every guild
+# starts with a prompt for each district channel. The replay is captured
+# as well and compared with the original.
+#
+# e.g. python3 trafficreplay.py replay session.jsonl.gz --speed 10
+#      python3 trafficreplay.py compare before.jsonl.gz after.jsonl.gz
+
+import argparse
+import asyncio
+import datetime
+import gzip
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from aiohttp import web
+import discord
+from discord.http import Route
+from trafficcapture import CAPTURE_VERSION
+
+# The bot's own user, answered to the login request
+STUB_USER = {
+    "id": "1",
+    "username": "replay",
+    "discriminator": "0",
+    "avatar": None,
+    "global_name": None,
+    "bot": True,
+}
+# Who every replayed interaction comes from; also the bot's owner
+PLAYER = {
+    "id": "2",
+    "username": "player",
+    "discriminator": "0",
+    "avatar": None,
+    "global_name": None,
+}
+APPLICATION = {
+    "id": "1",
+    "name": "replay",
+    "icon": None,
+    "description": "",
+    "rpc_origins": [],
+    "bot_public": True,
+    "bot_require_code_grant": False,
+    "verify_key": "",
+    "owner": PLAYER,
+    "flags": 0,
+}
+ALL_PERMISSIONS = str(discord.Permissions.all().value)
+# District channels each replayed guild has, two prompts each
+DISTRICTS = 12
+# Seconds without a REST call after the last interaction before the
+# replay is considered finished, and the longest it waits for that
+QUIET_SECONDS = 2.0
+SETTLE_TIMEOUT = 120.0
+
+
+def read_capture(path) -> list[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events or events[0].get("e") != "start":
+        sys.exit(f"{path} is not a traffic capture")
+    if events[0]["v"] > CAPTURE_VERSION:
+        sys.exit(f"{path} was written by a newer bot; update trafficreplay.py")
+    return events
+
+
+def percentile(values, fraction) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def route_key(call) -> str:
+    return f"{call['m']} {call['r']}"
+
+
+def summarise(events) -> dict:
+    """
+    Per-command latency and call counts, and per-route call times.
+
+    Returns:
+        {"duration": s, "calls": n,
+         "commands": {name: {"runs": n, "latencies": [s], "calls": n}},
+         "routes": {"METHOD /path": [s]}}
+    """
+    commands = {}
+    routes = {}
+    calls = 0
+    for event in events:
+        if event["e"] == "interaction" and event["c"]:
+            commands.setdefault(
+                event["c"], {"runs": 0, "latencies": [], "calls": 0}
+            )["runs"] += 1
+        elif event["e"] == "completion":
+            commands.setdefault(
+                event["c"], {"runs": 0, "latencies": [], "calls": 0}
+            )["latencies"].append(event["d"])
+        elif event["e"] == "call":
+            calls += 1
+            routes.setdefault(route_key(event), []).append(event["d"])
+            if event["c"]:
+                commands.setdefault(
+                    event["c"], {"runs": 0, "latencies": [], "calls": 0}
+                )["calls"] += 1
+    return {
+        "duration": events[-1].get("t", 0),
+        "calls": calls,
+        "commands": commands,
+        "routes": routes,
+    }
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class StubDiscord:
+    """
+    Enough of Discord's HTTP API for the bot's commands: messages,
+    interaction responses and followups, webhooks, pins and permission
+    overwrites. Each call is answered after the median time calls to its
+    route took in the capture, divided by speed; routes the capture never
+    called are answered at once.
+
+    Messages are kept, so edits, component clicks and fetches of the
+    original response find them. Modals the bot opens are kept by the
+    interaction that opened them, for the replayed submission.
+    """
+
+    def __init__(self, calls, speed):
+        self.speed = speed
+        times = {}
+        for call in calls:
+            times.setdefault((call["m"], call["r"]), []).append(call["d"])
+        # Concrete paths are matched back to the captured route templates
+        self.latencies = [
+            (
+                method,
+                re.compile(re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(path))),
+                percentile(durations, 0.5),
+            )
+            for (method, path), durations in times.items()
+        ]
+        self.ids = itertools.count(10**16)
+        self.channels = {}
+        self.messages = {}
+        # Interaction token -> channel ID, and -> its original response
+        self.tokens = {}
+        self.originals = {}
+        # Interaction token -> message ID, for component interactions
+        self.component_messages = {}
+        # Interaction ID -> modal payload
+        self.modals = {}
+        # Webhook ID -> channel ID
+        self.webhooks = {}
+        self.last_request = time.monotonic()
+        self.runner = None
+        self.root = None
+
+    async def start(self) -> str:
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.root = f"http://{host}:{port}"
+        return f"{self.root}/api/v10"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def latency(self, method, path) -> float:
+        for captured_method, pattern, seconds in self.latencies:
+            if captured_method == method and pattern.fullmatch(path):
+                return seconds
+        return 0.0
+
+    async def handle(self, request):
+        self.last_request = time.monotonic()
+        path = request.path.removeprefix("/api/v10")
+        if path.startswith("/attachments/"):
+            return web.Response(body=b"x" * int(path.split("/")[2]))
+        payload, files = {}, []
+        if request.content_type == "multipart/form-data":
+            async for part in await request.multipart():
+                if part.name == "payload_json":
+                    payload = json.loads(await part.text())
+                else:
+                    files.append((part.filename, len(await part.read())))
+        elif request.can_read_body:
+            payload = await request.json()
+        await asyncio.sleep(self.latency(request.method, path) / self.speed)
+        answer = self.answer(request.method, path.strip("/").split("/"), payload, files)
+        self.last_request = time.monotonic()
+        if answer is None:
+            return web.Response(status=204)
+        # discord.py only decodes JSON when the type has no charset
+        return web.Response(
+            body=json.dumps(answer).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+    def answer(self, method, parts, payload, files):
+        if parts == ["users", "@me"]:
+            return STUB_USER
+        if parts == ["oauth2", "applications", "@me"]:
+            return APPLICATION
+        if parts[0] == "interactions" and parts[-1] == "callback":
+            return self.callback(parts[1], parts[2], payload, files)
+        if parts[0] == "webhooks":
+            return self.webhook(method, parts[1], parts[2], parts[3:], payload, files)
+        if parts[0] == "channels":
+            channel_id, rest = parts[1], parts[2:]
+            if not rest:
+                return self.channels.get(channel_id, {})
+            if rest == ["messages"]:
+                if method == "GET":
+                    return []
+                return self.message(channel_id, payload, files)
+            if rest[0] == "messages" and len(rest) == 2:
+                return self.edit(method, rest[1], payload, files)
+            if rest == ["webhooks"]:
+                if method == "GET":
+                    return []
+                webhook_id = str(next(self.ids))
+                self.webhooks[webhook_id] = channel_id
+                return {
+                    "id": webhook_id,
+                    "type": 1,
+                    "channel_id": channel_id,
+                    "guild_id": self.channels.get(channel_id, {}).get("guild_id"),
+                    "name": payload.get("name", "replay"),
+                    "avatar": None,
+                    "token": "replay",
+                    "application_id": APPLICATION["id"],
+                    "user": STUB_USER,
+                }
+            # Pins and permission overwrites
+            return None
+        if parts[0] == "guilds" and parts[2:] == ["audit-logs"]:
+            return {
+                "audit_log_entries": [],
+                "users": [],
+                "webhooks": [],
+                "integrations": [],
+                "threads": [],
+                "application_commands": [],
+                "auto_moderation_rules": [],
+                "guild_scheduled_events": [],
+            }
+        return None if method in ("PUT", "DELETE") else {}
+
+    def callback(self, interaction_id, token, payload, files):
+        kind = payload.get("type")
+        data = payload.get("data") or {}
+        response = {"interaction": {"id": interaction_id, "type": 2}}
+        if kind == 9:
+            self.modals[interaction_id] = data
+        elif kind in (4, 5):
+            message = self.message(
+                self.tokens.get(token), data, files, interaction_id=interaction_id
+            )
+            self.originals[token] = message["id"]
+            response["interaction"]["response_message_id"] = message["id"]
+            if kind == 4:
+                response["resource"] = {"type": kind, "message": message}
+        elif kind in (6, 7):
+            message_id = self.component_messages.get(token)
+            self.originals[token] = message_id
+            if kind == 7 and message_id in self.messages:
+                message = self.edit("PATCH", message_id, data, files)
+                response["resource"] = {"type": kind, "message": message}
+        return response
+
+    def webhook(self, method, webhook_id, token, rest, payload, files):
+        if not rest:
+            if webhook_id in self.webhooks:
+                return self.message(
+                    self.webhooks[webhook_id], payload, files, webhook_id=webhook_id
+                )
+            # An interaction followup
+            return self.message(self.tokens.get(token), payload, files)
+        if rest[0] == "messages" and len(rest) == 2:
+            message_id = (
+                self.originals.get(token) if rest[1] == "@original" else rest[1]
+            )
+            return self.edit(method, message_id, payload, files)
+        return {}
+
+    def message(
+        self, channel_id, payload, files=(), webhook_id=None, interaction_id=None
+    ) -> dict:
+        message_id = str(next(self.ids))
+        message = {
+            "id": message_id,
+            "channel_id": channel_id or "0",
+            "type": 0,
+            "content": payload.get("content") or "",
+            "author": STUB_USER,
+            "attachments": [],
+            "embeds": payload.get("embeds") or [],
+            "components": payload.get("components") or [],
+            "mentions": [],
+            "mention_roles": [],
+            "pinned": False,
+            "mention_everyone": False,
+            "tts": False,
+            "timestamp": _now(),
+            "edited_timestamp": None,
+            "flags": payload.get("flags") or 0,
+            "webhook_id": webhook_id,
+        }
+        if interaction_id:
+            message["interaction_metadata"] = {
+                "id": interaction_id,
+                "type": 2,
+                "user": PLAYER,
+                "authorizing_integration_owners": {},
+            }
+        self._attach(message, files)
+        self.messages[message_id] = message
+        return message
+
+    def edit(self, method, message_id, payload, files):
+        message = self.messages.get(message_id)
+        if message is None or method == "DELETE":
+            self.messages.pop(message_id, None)
+            return None if method == "DELETE" else {}
+        if method == "PATCH":
+            for key in ("content", "embeds", "components"):
+                if key in payload:
+                    message[key] = payload[key] or ([] if key != "content" else "")
+            message["edited_timestamp"] = _now()
+            self._attach(message, files)
+        return message
+
+    def _attach(self, message, files):
+        for file_name, size in files:
+            attachment_id = str(next(self.ids))
+            url = f"{self.root}/attachments/{size}/{file_name}"
+            message["attachments"].append(
+                {
+                    "id": attachment_id,
+                    "filename": file_name or "file",
+                    "size": size,
+                    "url": url,
+                    "proxy_url": url,
+                }
+            )
+
+
+class ReplayGuild:
+    """A made-up guild set up the way the bot is configured in a real one."""
+
+    def __init__(self, number, ids):
+        self.number = number
+        self.id = str(next(ids))
+        self.category = str(next(ids))
+        self.log_channel = str(next(ids))
+        self.tribute_role = str(next(ids))
+        self.districts = [str(next(ids)) for _ in range(DISTRICTS)]
+        self.prompt_ids = [
+            f"D{district}{tribute}"
+            for district in range(1, DISTRICTS + 1)
+            for tribute in "FM"
+        ]
+        self._prompt_ids = itertools.cycle(self.prompt_ids)
+
+    def next_prompt_id(self) -> str:
+        return next(self._prompt_ids)
+
+    def channel(self, channel_id, name, position, kind=0) -> dict:
+        channel = {
+            "id": channel_id,
+            "type": kind,
+            "guild_id": self.id,
+            "name": name,
+            "position": position,
+            "permission_overwrites": [],
+            "nsfw": False,
+        }
+        if kind == 0:
+            channel.update(
+                parent_id=self.category if name.startswith("district-") else None,
+                topic=None,
+                rate_limit_per_user=0,
+                last_message_id=None,
+            )
+        return channel
+
+    def channels(self) -> list[dict]:
+        return [
+            self.channel(self.category, "districts", 0, kind=4),
+            self.channel(self.log_channel, "prompt-log", 0),
+        ] + [
+            self.channel(channel_id, f"district-{index}", index)
+            for index, channel_id in enumerate(self.districts, 1)
+        ]
+
+    def role(self, role_id, name, permissions) -> dict:
+        return {
+            "id": role_id,
+            "name": name,
+            "permissions": permissions,
+            "position": 0 if role_id == self.id else 1,
+            "color": 0,
+            "hoist": False,
+            "managed": False,
+            "mentionable": False,
+            "flags": 0,
+        }
+
+    def payload(self) -> dict:
+        return {
+            "id": self.id,
+            "name": f"replay {self.number}",
+            "owner_id": PLAYER["id"],
+            "roles": [
+                self.role(self.id, "@everyone", ALL_PERMISSIONS),
+                self.role(self.tribute_role, "tributes", "0"),
+            ],
+            "channels": self.channels(),
+            "members": [
+                {
+                    "user": STUB_USER,
+                    "roles": [],
+                    "joined_at": _now(),
+                    "deaf": False,
+                    "mute": False,
+                    "flags": 0,
+                }
+            ],
+            "member_count": 2,
+            "features": [],
+            "emojis": [],
+            "stickers": [],
+            "premium_tier": 0,
+            "verification_level": 0,
+            "default_message_notifications": 0,
+            "explicit_content_filter": 0,
+            "mfa_level": 0,
+            "nsfw_level": 0,
+            "preferred_locale": "en-US",
+            "afk_timeout": 300,
+            "system_channel_flags": 0,
+            "icon": None,
+            "splash": None,
+            "banner": None,
+            "description": None,
+            "large": False,
+        }
+
+    def config(self) -> dict:
+        return {
+            "log_channel_id": int(self.log_channel),
+            "category_id": int(self.category),
+            "tribute_role_id": int(self.tribute_role),
+        }
+
+
+class Replay:
+    """
+    Feeds a capture's interactions to a THGBot at their captured times
+    divided by speed. Commands are run with made-up options of the
+    captured lengths; modal submissions fill in the bot's latest modal in
+    that guild, and component interactions press the captured position
+    in its latest message with components.
+    """
+
+    def __init__(self, events, speed, datadir):
+        self.events = events
+        self.speed = speed
+        self.datadir = datadir
+        self.stub = StubDiscord(
+            [event for event in events if event["e"] == "call"], speed
+        )
+        self.ids = itertools.count(10**15)
+        self.sequence = itertools.count()
+        self.guilds = {}
+        for event in events:
+            if event["e"] == "interaction" and event["g"] not in self.guilds:
+                self.guilds[event["g"]] = ReplayGuild(event["g"], self.ids)
+        # Interaction ID -> guild, to find each guild's latest modal
+        self.interaction_guilds = {}
+        self.skipped = []
+        self.bot = None
+
+    def prompt_length(self) -> int:
+        # Roughly the text of the messages the captured bot posted
+        sizes = [
+            event["b"]
+            for event in self.events
+            if event["e"] == "call"
+            and event["m"] == "POST"
+            and event["r"] == "/channels/{channel_id}/messages"
+        ]
+        return max(1, percentile(sizes, 0.5) - 40) if sizes else 400
+
+    def write_guilds(self):
+        # Imported here so summary and compare do not load the bot
+        from promptrecord import PromptRecord, encode_prompts
+        from promptstore import save_guild
+
+        length = self.prompt_length()
+        for guild in self.guilds.values():
+            save_guild(
+                os.path.join(self.datadir, "config"), guild.id, guild.config()
+            )
+            records = {
+                prompt_id: PromptRecord(
+                    prompt_id, int(guild.districts[index // 2]), "x" * length
+                )
+                for index, prompt_id in enumerate(guild.prompt_ids)
+            }
+            save_guild(
+                os.path.join(self.datadir, "prompts"), guild.id, encode_prompts(records)
+            )
+
+    async def run(self, output) -> float:
+        """
+        Runs the replay, capturing it to output.
+
+        Returns:
+            Seconds from the first interaction until the bot went quiet
+        """
+        # The modals read SNAP_DATA when the extensions load
+        os.environ["SNAP_DATA"] = self.datadir
+        os.environ["CAPTURE_FILE"] = output
+        from thgbot import THGBot
+
+        self.write_guilds()
+        Route.BASE = await self.stub.start()
+        intents = discord.Intents.none()
+        intents.guilds = True
+        self.bot = THGBot(
+            datadir=self.datadir,
+            intents=intents,
+            max_messages=None,
+            member_cache_flags=discord.MemberCacheFlags.none(),
+            chunk_guilds_at_startup=False,
+        )
+        try:
+            await self.bot.login("replay")
+            for guild in self.guilds.values():
+                self.bot._connection._add_guild_from_data(guild.payload())
+                for channel in guild.channels():
+                    self.stub.channels[channel["id"]] = channel
+            started = time.perf_counter()
+            for event in self.events:
+                if event["e"] != "interaction":
+                    continue
+                delay = started + event["t"] / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                payload = self.interaction(event)
+                if payload is None:
+                    self.skipped.append(event)
+                    continue
+                self.bot._connection.parse_interaction_create(payload)
+            deadline = time.monotonic() + SETTLE_TIMEOUT
+            while (
+                time.monotonic() - self.stub.last_request < QUIET_SECONDS
+                and time.monotonic() < deadline
+            ):
+                await asyncio.sleep(QUIET_SECONDS / 4)
+            return time.perf_counter() - started
+        finally:
+            await self.bot.close()
+            await self.stub.stop()
+
+    def interaction(self, event) -> dict | None:
+        guild = self.guilds[event["g"]]
+        if event["k"] == "command":
+            kind, data, message = 2, self.command_data(guild, event), None
+        elif event["k"] == "modal":
+            kind, data, message = 5, self.modal_data(guild, event), None
+        elif event["k"] == "component":
+            kind = 3
+            message = self.latest_message(guild)
+            data = message and self.component_data(guild, event, message)
+        else:
+            return None
+        if data is None:
+            return None
+
+        # Snowflakes carry their creation time, which the bot reads
+        interaction_id = discord.utils.time_snowflake(
+            datetime.datetime.now(datetime.timezone.utc)
+        ) + next(self.sequence) % 4096
+        token = f"replay-{interaction_id}"
+        self.interaction_guilds[str(interaction_id)] = guild
+        self.stub.tokens[token] = guild.log_channel
+        if message:
+            self.stub.component_messages[token] = message["id"]
+        payload = {
+            "id": str(interaction_id),
+            "application_id": APPLICATION["id"],
+            "type": kind,
+            "token": token,
+            "version": 1,
+            "guild_id": guild.id,
+            "channel_id": guild.log_channel,
+            "channel": self.stub.channels[guild.log_channel],
+            "member": {
+                "user": PLAYER,
+                "roles": [],
+                "joined_at": _now(),
+                "deaf": False,
+                "mute": False,
+                "flags": 0,
+                "permissions": ALL_PERMISSIONS,
+            },
+            "app_permissions": ALL_PERMISSIONS,
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "entitlements": [],
+            "authorizing_integration_owners": {"0": guild.id},
+            "context": 0,
+            "data": data,
+        }
+        if message:
+            payload["message"] = message
+        return payload
+
+    def command_data(self, guild, event) -> dict | None:
+        names = event["c"].split()
+        command = self.bot.tree.get_command(names[0])
+        for name in names[1:]:
+            command = command.get_command(name) if command else None
+        # Commands this revision no longer has are skipped
+        if not isinstance(command, discord.app_commands.Command):
+            return None
+        parameters = {parameter.name: parameter for parameter in command.parameters}
+        resolved = {}
+        options = []
+        for name, option_type, length in event["o"]:
+            parameter = parameters.get(name)
+            if parameter is None:
+                continue
+            options.append(
+                {
+                    "name": name,
+                    "type": option_type,
+                    "value": self.option_value(
+                        guild, parameter, option_type, length, resolved
+                    ),
+                }
+            )
+        # Subcommands nest inside their group
+        for depth, name in reversed(list(enumerate(names[1:], 1))):
+            options = [
+                {"name": name, "type": 1 if depth == len(names) - 1 else 2, "options": options}
+            ]
+        data = {
+            "id": str(next(self.ids)),
+            "name": names[0],
+            "type": 1,
+            "options": options,
+        }
+        if resolved:
+            data["resolved"] = resolved
+        return data
+
+    def option_value(self, guild, parameter, option_type, length, resolved):
+        if parameter.choices:
+            # The choice the captured value could have been
+            for choice in parameter.choices:
+                if len(str(choice.value)) == length:
+                    return choice.value
+            return parameter.choices[0].value
+        if option_type == 3:
+            if "id" in parameter.name.split("_"):
+                return guild.next_prompt_id()
+            return "x" * max(length, parameter.min_value or 0)
+        if option_type in (4, 10):
+            value = int("1" * max(1, length))
+            if parameter.max_value is not None:
+                value = min(value, parameter.max_value)
+            if parameter.min_value is not None:
+                value = max(value, parameter.min_value)
+            return value
+        if option_type == 5:
+            return length == 4
+        if option_type in (6, 9):
+            resolved.setdefault("users", {})[PLAYER["id"]] = PLAYER
+            return PLAYER["id"]
+        if option_type == 7:
+            channel = self.stub.channels[guild.districts[0]]
+            resolved.setdefault("channels", {})[channel["id"]] = {
+                **channel,
+                "permissions": ALL_PERMISSIONS,
+            }
+            return channel["id"]
+        if option_type == 8:
+            resolved.setdefault("roles", {})[guild.tribute_role] = guild.role(
+                guild.tribute_role, "tributes", "0"
+            )
+            return guild.tribute_role
+        if option_type == 11:
+            attachment_id = str(next(self.ids))
+            url = f"{self.stub.root}/attachments/{length}/replay.txt"
+            resolved.setdefault("attachments", {})[attachment_id] = {
+                "id": attachment_id,
+                "filename": "replay.txt",
+                "size": length,
+                "url": url,
+                "proxy_url": url,
+            }
+            return attachment_id
+        return "x" * length
+
+    def modal_data(self, guild, event) -> dict | None:
+        modal = None
+        for interaction_id, data in self.stub.modals.items():
+            if self.interaction_guilds.get(interaction_id) is guild:
+                modal = data
+        if modal is None:
+            return None
+        lengths = iter(length for _, _, length in event["o"])
+        rows = []
+        for row in modal.get("components") or []:
+            inputs = []
+            for component in row.get("components") or []:
+                length = next(lengths, 0)
+                if "id" in (component.get("label") or "").lower().split():
+                    value = guild.next_prompt_id()
+                else:
+                    value = "x" * length
+                inputs.append(
+                    {"type": 4, "custom_id": component["custom_id"], "value": value}
+                )
+            rows.append({"type": 1, "components": inputs})
+        return {"custom_id": modal["custom_id"], "components": rows}
+
+    def latest_message(self, guild) -> dict | None:
+        channels = set(guild.districts) | {guild.log_channel}
+        for message in reversed(list(self.stub.messages.values())):
+            if message["components"] and message["channel_id"] in channels:
+                return message
+        return None
+
+    def component_data(self, guild, event, message) -> dict | None:
+        components = [
+            component
+            for row in message["components"]
+            for component in row.get("components", [row])
+        ]
+        position = event.get("i") or 0
+        if position >= len(components):
+            return None
+        component = components[position]
+        data = {
+            "custom_id": component.get("custom_id"),
+            "component_type": component["type"],
+        }
+        # The number of values chosen, for select menus
+        count = next(
+            (length for name, _, length in event["o"] if name is None), 1
+        )
+        if component["type"] == 3:
+            data["values"] = [
+                option["value"] for option in component.get("options", [])
+            ][: max(1, count)]
+        elif component["type"] in (5, 6, 7, 8):
+            data["values"] = guild.districts[: max(1, count)]
+            data["resolved"] = {
+                "channels": {
+                    channel_id: {
+                        **self.stub.channels[channel_id],
+                        "permissions": ALL_PERMISSIONS,
+                    }
+                    for channel_id in data["values"]
+                }
+            }
+        return data
+
+
+def print_summary(path, summary):
+    print(
+        f"{path}: {summary['duration']:.1f}s, {summary['calls']} REST calls,"
+        f" {sum(command['runs'] for command in summary['commands'].values())}"
+        " commands"
+    )
+    for name, command in sorted(summary["commands"].items()):
+        print(
+            f"  /{name:<24} runs={command['runs']:<4} calls={command['calls']:<5}"
+            f" p50={percentile(command['latencies'], 0.5) * 1000:.0f}ms"
+            f" p95={percentile(command['latencies'], 0.95) * 1000:.0f}ms"
+        )
+
+
+def print_comparison(before_path, before, after_path, after):
+    print(f"before: {before_path}, {before['calls']} REST calls")
+    print(f"after:  {after_path}, {after['calls']} REST calls")
+    empty = {"runs": 0, "latencies": [], "calls": 0}
+    for name in sorted(before["commands"].keys() | after["commands"].keys()):
+        old = before["commands"].get(name, empty)
+        new = after["commands"].get(name, empty)
+        print(
+            f"  /{name:<24}"
+            f" calls/run {old['calls'] / max(1, old['runs']):.1f}"
+            f" -> {new['calls'] / max(1, new['runs']):.1f},"
+            f" p50 {percentile(old['latencies'], 0.5) * 1000:.0f}ms"
+            f" -> {percentile(new['latencies'], 0.5) * 1000:.0f}ms,"
+            f" p95 {percentile(old['latencies'], 0.95) * 1000:.0f}ms"
+            f" -> {percentile(new['latencies'], 0.95) * 1000:.0f}ms"
+        )
+    for key in sorted(before["routes"].keys() | after["routes"].keys()):
+        old = len(before["routes"].get(key, []))
+        new = len(after["routes"].get(key, []))
+        if old != new:
+            print(f"  {key:<60} calls {old} -> {new}")
+
+
+def summary(args):
+    print_summary(args.capture, summarise(read_capture(args.capture)))
+    return 0
+
+
+def replay(args):
+    if args.speed <= 0:
+        sys.exit("--speed must be positive")
+    events = read_capture(args.capture)
+    # The replay's capture is written fresh, never appended to
+    if os.path.exists(args.output):
+        os.unlink(args.output)
+    with tempfile.TemporaryDirectory() as datadir:
+        session = Replay(events, args.speed, datadir)
+        duration = asyncio.run(session.run(args.output))
+    interactions = sum(event["e"] == "interaction" for event in events)
+    print(
+        f"replayed {interactions} interactions at {args.speed:g}x in {duration:.1f}s,"
+        f" {len(session.skipped)} skipped"
+    )
+    for event in session.skipped:
+        print(f"  skipped {event['k']} {event['c'] or ''} at {event['t']:.1f}s")
+    print_comparison(
+        args.capture, summarise(events), args.output, summarise(read_capture(args.output))
+    )
+    return 0
+
+
+def compare(args):
+    print_comparison(
+        args.before,
+        summarise(read_capture(args.before)),
+        args.after,
+        summarise(read_capture(args.after)),
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay and compare captured bot traffic"
+    )
+    commands = parser.add_subparsers(required=True)
+
+    summary_parser = commands.add_parser(
+        "summary", help="Show a capture's commands and call counts"
+    )
+    summary_parser.add_argument("capture")
+    summary_parser.set_defaults(run=summary)
+
+    replay_parser = commands.add_parser(
+        "replay", help="Run a capture's interactions through this revision"
+    )
+    replay_parser.add_argument("capture")
+    replay_parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="How many times faster than captured to replay",
+    )
+    replay_parser.add_argument(
+        "--output",
+        default="replay.jsonl.gz",
+        help="Where to write the replay's own capture",
+    )
+    replay_parser.set_defaults(run=replay)
+
+    compare_parser = commands.add_parser(
+        "compare", help="Compare latency and call counts of two captures"
+    )
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(run=compare)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
 import discord
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class TributeChannelSelector(discord.ui.Select):
@@ -17,8 +20,9 @@ class TributeChannelSelector(discord.ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         self.interaction = interaction
-        print("Before defer")
         await interaction.response.defer()
-        print("After defer")
+        logger.debug(
+            "Channel %s selected", self.values[0], extra={"guild": interaction.guild_id}
+        )
         self.channel_id = self.values[0]
         self.view.stop()
@@ -0,0 +1,77 @@
+import asyncio
+import contextvars
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GuildWorkQueue:
+    """
+    Runs deferred command bodies one at a time per guild, in the order they
+    were submitted. Guilds never wait on each other.
+
+    Each guild's worker task is kept referenced while it has work, so jobs
+    are never garbage collected mid-run, and is cancelled when the bot
+    closes. Jobs run in the context they were submitted from, so context
+    variables set by the command, like the traffic capture's command name,
+    carry over.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._workers = {}
+
+    def submit(self, guild_id, name: str, job):
+        """
+        Queues a coroutine to run after the guild's earlier jobs.
+
+        Args:
+            guild_id: The guild the job belongs to
+            name: Shown in logs, usually the command name
+            job: The coroutine to run
+        """
+        queue = self._queues.setdefault(guild_id, asyncio.Queue())
+        queue.put_nowait(
+            (name, job, contextvars.copy_context(), time.perf_counter())
+        )
+        if guild_id not in self._workers:
+            self._workers[guild_id] = asyncio.create_task(
+                self._work(guild_id, queue), name=f"guild-work-{guild_id}"
+            )
+
+    def pending(self, guild_id) -> int:
+        queue = self._queues.get(guild_id)
+        return queue.qsize() if queue else 0
+
+    async def _work(self, guild_id, queue):
+        try:
+            while not queue.empty():
+                name, job, context, queued = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    await asyncio.create_task(job, name=name, context=context)
+                except Exception:
+                    # The job reports its own failures; this is a backstop
+                    logger.exception(
+                        "Queued command failed",
+                        extra={"guild": guild_id, "command": name},
+                    )
+                logger.debug(
+                    "Queued command finished after waiting %.0fms",
+                    (started - queued) * 1000,
+                    extra={
+                        "guild": guild_id,
+                        "command": name,
+                        "duration": time.perf_counter() - started,
+                    },
+                )
+        finally:
+            del self._workers[guild_id]
+
+    def cancel(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait()[1].close()